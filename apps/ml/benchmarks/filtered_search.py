@@ -0,0 +1,93 @@
+"""
+Filtered vs unfiltered vector search latency
+
+Runs the same query embeddings against the configured vector store
+(VECTOR_STORE_BACKEND) without a filter and scoped to subsets of the
+ingested documents, and prints latency percentiles per scope. It also
+checks that every scoped result really belongs to the scope.
+
+Usage:
+    python benchmarks/filtered_search.py
+    python benchmarks/filtered_search.py --top-k 10 --repeat 20
+"""
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import settings  # noqa: E402
+from database import postgres  # noqa: E402
+from models.embeddings import get_embedder  # noqa: E402
+from services.vector_store import get_vector_store  # noqa: E402
+
+QUERIES = [
+    "What is supervised learning?",
+    "How do I evaluate a classification model?",
+    "Which LLM should I choose for production?",
+    "What is few-shot prompting?",
+    "How do functions work in Python?",
+    "What should I learn first to become an AI engineer?",
+]
+
+
+def measure(store, queries: List[List[float]], top_k: int, scope: Optional[List[str]]) -> Dict:
+    """Latency percentiles and scope violations for one scope"""
+    latencies = []
+    violations = 0
+    for query in queries:
+        started = time.perf_counter()
+        results = store.search(query, top_k=top_k, document_ids=scope)
+        latencies.append(time.perf_counter() - started)
+        if scope is not None:
+            violations += sum(1 for r in results if r["document_id"] not in scope)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+        "violations": violations
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtered vs unfiltered search latency")
+    parser.add_argument("--embedding-provider", choices=["local", "openai"], default=None)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=10, help="Passes over the query set")
+    args = parser.parse_args()
+    
+    documents = [d for d in postgres.get_documents() if d["status"] == "completed"]
+    if not documents:
+        print("No completed documents; ingest some first (e.g. python bulk_ingest.py ../../data/sample_docs)")
+        return
+    
+    embedder = get_embedder(args.embedding_provider or settings.embedding_provider)
+    queries = embedder.embed_batch(QUERIES) * args.repeat
+    store = get_vector_store()
+    store.search(queries[0], top_k=args.top_k)  # warm up
+    
+    random.seed(0)
+    ids = [d["id"] for d in documents]
+    scopes = [
+        ("unfiltered", None),
+        ("1 document", [random.choice(ids)]),
+        ("10% of documents", random.sample(ids, max(1, len(ids) // 10))),
+        ("50% of documents", random.sample(ids, max(1, len(ids) // 2))),
+    ]
+    
+    chunk_total = sum(d["chunk_count"] for d in documents)
+    print(f"{len(documents)} documents, {chunk_total} chunks, backend: {settings.vector_store_backend}")
+    print(f"{'scope':>18} {'docs':>6} {'p50 ms':>8} {'p95 ms':>8} {'out of scope':>13}")
+    for name, scope in scopes:
+        r = measure(store, queries, args.top_k, scope)
+        docs = len(scope) if scope is not None else len(ids)
+        print(f"{name:>18} {docs:>6} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['violations']:>13}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Load test for the RAG API: throughput vs number of concurrent clients
+
+Runs the same workload at increasing concurrency levels against a running
+server and prints requests/s and latency percentiles per level. If the
+request path is non-blocking, throughput should grow with concurrency until
+the LLM provider (or CPU for local embeddings) becomes the bottleneck.
+
+Usage:
+    python benchmarks/load_test.py --url http://localhost:8000 --levels 1,2,4,8,16
+    python benchmarks/load_test.py --endpoint health --requests 200
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+
+
+def _post_json(url: str, payload: Dict, timeout: float) -> int:
+    """POST JSON and return the HTTP status code"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def _get(url: str, timeout: float) -> int:
+    """GET and return the HTTP status code"""
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def run_level(args, concurrency: int) -> Dict:
+    """Send args.requests requests with `concurrency` clients in parallel"""
+    latencies: List[float] = []
+    errors = 0
+    
+    def one_request(i: int):
+        started = time.perf_counter()
+        if args.endpoint == "query":
+            # A unique suffix defeats the answer cache unless --cached is set
+            query = args.query if args.cached else f"{args.query} (#{concurrency}-{i})"
+            status = _post_json(
+                f"{args.url}/query",
+                {"query": query, "top_k": args.top_k},
+                args.timeout
+            )
+        else:
+            status = _get(f"{args.url}/health", args.timeout)
+        return status, time.perf_counter() - started
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(one_request, i) for i in range(args.requests)]
+        for future in futures:
+            try:
+                status, latency = future.result()
+                if status == 200:
+                    latencies.append(latency)
+                else:
+                    errors += 1
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CiteWise RAG load test")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=["query", "health"], default="query")
+    parser.add_argument("--query", default="What is retrieval-augmented generation?")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--cached", action="store_true", help="Repeat the same query (answer cache hits)")
+    args = parser.parse_args()
+    
+    levels = [int(level) for level in args.levels.split(",")]
+    results = [run_level(args, level) for level in levels]
+    
+    baseline = results[0]["throughput"] or 1.0
+    print(f"{'clients':>8} {'ok':>5} {'err':>5} {'req/s':>8} {'speedup':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in results:
+        print(
+            f"{r['concurrency']:>8} {r['ok']:>5} {r['errors']:>5} "
+            f"{r['throughput']:>8.2f} {r['throughput'] / baseline:>7.2f}x "
+            f"{r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Recall vs latency report for vector quantization modes
+
+Embeds the sample corpus, loads it into a LocalVectorStore per mode
+(none / int8 / binary), and compares each mode's top-k against exact float32
+search. The sample corpus is small, so --scale adds noisy copies of every
+chunk vector to approximate a large index.
+
+Usage:
+    python benchmarks/quantization_report.py
+    python benchmarks/quantization_report.py --scale 500 --rescore-limits 50,100,200
+"""
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import settings  # noqa: E402
+from models.embeddings import get_embedder  # noqa: E402
+from services.local_vector_store import LocalVectorStore  # noqa: E402
+from utils.chunking import text_chunker  # noqa: E402
+
+DEFAULT_QUERIES = [
+    "What is supervised learning?",
+    "How do I evaluate a classification model?",
+    "What is feature engineering?",
+    "How do neural networks learn?",
+    "Which LLM should I choose for production?",
+    "How much does it cost to run large language models?",
+    "What is few-shot prompting?",
+    "How do I write a good system prompt?",
+    "What should I learn first to become an AI engineer?",
+    "How do I build a portfolio for AI jobs?",
+    "What are Python list comprehensions?",
+    "How do functions work in Python?",
+]
+
+
+def load_corpus(directory: Path) -> List[Dict]:
+    """Chunk every .txt/.md file in the directory"""
+    chunks = []
+    for path in sorted(directory.glob("*")):
+        if path.suffix.lower() in {".txt", ".md"}:
+            chunks.extend(text_chunker.chunk_text(path.read_text(encoding="utf-8"), document_name=path.name))
+    return chunks
+
+
+def build_store(directory: str, chunks: List[Dict], vectors: np.ndarray, scale: int, noise: float):
+    """Write the corpus (plus noisy copies) into an unquantized store"""
+    store = LocalVectorStore(directory, quantization="none")
+    store.add_chunks(chunks, vectors.tolist(), "corpus", "sample_docs")
+    
+    rng = np.random.default_rng(0)
+    for copy in range(scale - 1):
+        noisy = vectors + rng.normal(scale=noise, size=vectors.shape).astype(np.float32)
+        copies = [dict(chunk, hash=f"{chunk['hash']}-{copy}") for chunk in chunks]
+        store.add_chunks(copies, noisy, f"copy-{copy}", "synthetic")
+    return store
+
+
+def measure(store: LocalVectorStore, queries: List[List[float]], truth: List[List[str]], top_k: int) -> Dict:
+    """Recall@k against exact results, and per-query latency"""
+    recalls, latencies = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = store.search(query, top_k=top_k)
+        latencies.append(time.perf_counter() - started)
+        found = {r["weaviate_id"] for r in results}
+        recalls.append(len(found & set(expected)) / len(expected))
+    latencies.sort()
+    return {
+        "recall": statistics.mean(recalls),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector quantization recall/latency report")
+    parser.add_argument("--docs", default=str(Path(__file__).resolve().parents[3] / "data" / "sample_docs"))
+    parser.add_argument("--embedding-provider", choices=["local", "openai"], default=None)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--scale", type=int, default=200, help="Corpus copies (1 = sample corpus only)")
+    parser.add_argument("--noise", type=float, default=0.05, help="Std-dev of noise added to copies")
+    parser.add_argument("--rescore-limits", default="50,100,200", help="Comma-separated candidate counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the query set")
+    args = parser.parse_args()
+    
+    provider = args.embedding_provider or settings.embedding_provider
+    embedder = get_embedder(provider)
+    chunks = load_corpus(Path(args.docs))
+    vectors = np.asarray(embedder.embed_batch([c["text"] for c in chunks]), dtype=np.float32)
+    queries = embedder.embed_batch(DEFAULT_QUERIES) * args.repeat
+    
+    with tempfile.TemporaryDirectory() as directory:
+        exact = build_store(directory, chunks, vectors, args.scale, args.noise)
+        total = len(exact._records)
+        truth = [[r["weaviate_id"] for r in exact.search(q, top_k=args.top_k)] for q in queries]
+        
+        rows = [("none", "-", measure(exact, queries, truth, args.top_k), exact.vectors_path.stat().st_size)]
+        for mode in ("int8", "binary"):
+            store = LocalVectorStore(directory, quantization=mode)
+            code_bytes = store.codes_path.stat().st_size
+            for limit in [int(x) for x in args.rescore_limits.split(",")]:
+                settings.vector_rescore_limit = limit
+                rows.append((mode, str(limit), measure(store, queries, truth, args.top_k), code_bytes))
+    
+    print(f"{total} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{args.top_k} vs exact float32")
+    print(f"{'mode':>7} {'rescore':>8} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'in-memory MB':>13}")
+    for mode, limit, r, size in rows:
+        print(
+            f"{mode:>7} {limit:>8} {r['recall']:>7.3f} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {size / 2**20:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
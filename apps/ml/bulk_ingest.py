@@ -0,0 +1,270 @@
+"""
+Bulk directory ingestion
+
+Walks a directory tree and ingests every .txt/.md file without going through
+the HTTP API:
+- files are read and chunked in a process pool
+- chunks from many documents are embedded together in large batches
+- each document is written to the vector store and PostgreSQL in bulk
+- progress is checkpointed, so a rerun skips files already ingested
+  (unless their content changed); documents an interrupted run left
+  half-written are removed at startup, so run one bulk ingest at a time
+
+Usage:
+    python bulk_ingest.py ../../data/sample_docs
+    python bulk_ingest.py /path/to/dump --workers 8 --embed-batch 2048
+
+Note: a running API server drops its cached answers within
+ANSWER_CACHE_CORPUS_CHECK_SECONDS and its lexical (BM25) index picks up the
+new documents within LEXICAL_INDEX_REFRESH_SECONDS. This process never
+loads that index.
+
+With VECTOR_STORE_BACKEND=local the CLI and the server share one store directory.
+Writers take its lock file (LOCAL_VECTOR_STORE_DIR/lock) in turn, and the
+server reads rows appended by the CLI on its next search (a deletion that
+compacts the files makes it reload them).
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+from config import settings
+from database import postgres
+from models.embeddings import get_embedder
+from services.document_processor import document_processor
+from utils.chunking import text_chunker
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {".txt", ".md"}
+
+# Chunked files waiting per worker; bounds memory on very large trees
+CHUNK_WINDOW_PER_WORKER = 4
+
+
+def _chunk_file(path: str, root: str) -> Dict:
+    """Read and chunk one file (runs in a worker process)"""
+    raw = Path(path).read_bytes()
+    name = str(Path(path).relative_to(root))
+    result = {
+        "path": path,
+        "name": name,
+        "sha256": hashlib.sha256(raw).hexdigest(),
+        "file_size": len(raw),
+        "file_type": Path(path).suffix.lower().replace(".", "")
+    }
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        result["error"] = "File must be UTF-8 encoded text"
+        return result
+    result["char_count"] = len(text)
+    result["chunks"] = text_chunker.chunk_text(text, document_name=name)
+    return result
+
+
+class Checkpoint:
+    """JSON record of ingested files: {relative path: {sha256, document_id}}"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if path.exists():
+            self.entries = json.loads(path.read_text())
+    
+    def is_done(self, name: str, sha256: str) -> bool:
+        entry = self.entries.get(name)
+        return entry is not None and entry["sha256"] == sha256
+    
+    def previous_document(self, name: str) -> Optional[str]:
+        """Document ID from an earlier run of this file, if any"""
+        entry = self.entries.get(name)
+        return entry["document_id"] if entry else None
+    
+    def mark_done(self, name: str, sha256: str, document_id: str):
+        """Record a file and write the checkpoint atomically"""
+        self.entries[name] = {"sha256": sha256, "document_id": document_id}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.entries, indent=2))
+        os.replace(tmp_path, self.path)
+
+
+class BulkIngester:
+    """Cross-document batching on top of DocumentProcessor"""
+    
+    def __init__(self, embedding_provider: Optional[str], embed_batch: int, checkpoint: Checkpoint):
+        self.provider = embedding_provider or settings.embedding_provider
+        self.embedder = get_embedder(self.provider)
+        self.embed_batch = embed_batch
+        self.checkpoint = checkpoint
+        self.pending: List[Dict] = []
+        self.pending_chunks = 0
+        self.stats = {
+            "docs": 0, "chunks": 0, "skipped": 0, "failed": 0, "reused": 0,
+            "embed_seconds": 0.0, "write_seconds": 0.0
+        }
+    
+    def add(self, doc: Dict):
+        """Queue a chunked file; flush once enough chunks are waiting"""
+        if "error" in doc:
+            logger.error(f"Skipping {doc['name']}: {doc['error']}")
+            self.stats["failed"] += 1
+            return
+        if self.checkpoint.is_done(doc["name"], doc["sha256"]):
+            self.stats["skipped"] += 1
+            return
+        
+        self.pending.append(doc)
+        self.pending_chunks += len(doc["chunks"])
+        if self.pending_chunks >= self.embed_batch:
+            self.flush()
+    
+    def flush(self):
+        """Embed all pending chunks in one batch, then write per document"""
+        if not self.pending:
+            return
+        docs, self.pending, self.pending_chunks = self.pending, [], 0
+        
+        all_chunks = [chunk for doc in docs for chunk in doc["chunks"]]
+        started = time.perf_counter()
+        embeddings, reused = document_processor.embed_chunks(all_chunks, self.embedder, self.provider)
+        self.stats["embed_seconds"] += time.perf_counter() - started
+        self.stats["reused"] += reused
+        
+        started = time.perf_counter()
+        offset = 0
+        for doc in docs:
+            count = len(doc["chunks"])
+            doc_embeddings = embeddings[offset:offset + count]
+            offset += count
+            
+            doc_id = postgres.insert_document(
+                filename=doc["name"],
+                file_type=doc["file_type"],
+                file_size=doc["file_size"],
+                metadata={
+                    "char_count": doc["char_count"],
+                    "embedding_provider": self.provider,
+                    "source": "bulk_ingest"
+                },
+                status="processing"
+            )
+            try:
+                if count:
+                    document_processor.store_chunks(
+                        doc_id, doc["name"], doc["chunks"], doc_embeddings,
+                        status="completed", update_lexical=False
+                    )
+                else:
+                    postgres.update_document_status(doc_id, "completed")
+            except Exception as e:
+                logger.error(f"Failed to store {doc['name']}: {e}")
+                postgres.update_document_status(doc_id, "failed")
+                # Vectors written before the failure would otherwise stay searchable
+                document_processor._discard_partial_chunks(doc_id)
+                self.stats["failed"] += 1
+                continue
+            
+            # The file changed since the last run: replace the old version
+            previous_id = self.checkpoint.previous_document(doc["name"])
+            if previous_id:
+                document_processor.delete_document(previous_id)
+            
+            self.checkpoint.mark_done(doc["name"], doc["sha256"], doc_id)
+            self.stats["docs"] += 1
+            self.stats["chunks"] += count
+        self.stats["write_seconds"] += time.perf_counter() - started
+        
+        logger.info(f"Ingested {self.stats['docs']} documents ({self.stats['chunks']} chunks) so far")
+
+
+def discard_interrupted() -> int:
+    """
+    Remove documents an earlier, interrupted run left in "processing"
+    
+    Their chunks may be partly written; the checkpoint never recorded them,
+    so this run ingests those files again.
+    """
+    doc_ids = postgres.get_document_ids_by_status(["processing"], source="bulk_ingest")
+    for doc_id in doc_ids:
+        document_processor.delete_document(doc_id)
+    if doc_ids:
+        logger.info(f"Removed {len(doc_ids)} documents left half-written by an interrupted run")
+    return len(doc_ids)
+
+
+def chunk_files(pool: ProcessPoolExecutor, files: List[str], root: str, window: int) -> Iterator[Dict]:
+    """Chunk files in the pool, in order, with at most `window` files in flight"""
+    in_flight = deque()
+    for path in files:
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+        in_flight.append(pool.submit(_chunk_file, path, root))
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def find_files(root: Path) -> List[str]:
+    """All supported files below root, in a stable order"""
+    return sorted(
+        str(path) for path in root.rglob("*")
+        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of .txt/.md files")
+    parser.add_argument("directory", help="Root directory to ingest")
+    parser.add_argument("--embedding-provider", choices=["local", "openai"], default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Chunking processes")
+    parser.add_argument("--embed-batch", type=int, default=1024, help="Chunks per embedding batch")
+    parser.add_argument(
+        "--checkpoint",
+        default=".cache/bulk_ingest_checkpoint.json",
+        help="Progress file; delete it to re-ingest everything"
+    )
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    root = Path(args.directory).resolve()
+    files = find_files(root)
+    logger.info(f"Found {len(files)} files under {root}")
+    
+    discard_interrupted()
+    ingester = BulkIngester(args.embedding_provider, args.embed_batch, Checkpoint(Path(args.checkpoint)))
+    
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        window = args.workers * CHUNK_WINDOW_PER_WORKER
+        for doc in chunk_files(pool, files, str(root), window):
+            ingester.add(doc)
+    ingester.flush()
+    elapsed = time.perf_counter() - started
+    
+    stats = ingester.stats
+    other_seconds = max(elapsed - stats["embed_seconds"] - stats["write_seconds"], 0.0)
+    print()
+    print(f"Documents ingested: {stats['docs']}  (skipped: {stats['skipped']}, failed: {stats['failed']})")
+    print(f"Chunks ingested:    {stats['chunks']}  (embeddings reused from cache: {stats['reused']})")
+    print(f"Total time:         {elapsed:.1f}s")
+    print(f"Throughput:         {stats['docs'] / elapsed:.2f} docs/s, {stats['chunks'] / elapsed:.1f} chunks/s")
+    print(
+        f"Time breakdown:     embed {stats['embed_seconds']:.1f}s, "
+        f"write {stats['write_seconds']:.1f}s, read/chunk/other {other_seconds:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Relevance gate calibration
+
+Reads recent query traces, learns a vector distance threshold per embedding
+model and writes it to RELEVANCE_GATE_THRESHOLDS_PATH. A running API server
+picks up the new file on its next query; set RELEVANCE_GATE_ENABLED=true to
+let it skip the LLM.
+
+Traces only record the embedding provider, so each trace is attributed to
+the model currently configured for that provider. Recalibrate after
+changing the embedding model (and before enabling the gate for it).
+
+Usage:
+    python calibrate_relevance_gate.py
+    python calibrate_relevance_gate.py --limit 20000 --max-false-skip 0.02 --dry-run
+"""
+import argparse
+import json
+
+from config import settings
+from database import postgres
+from services.relevance_gate import calibrate_thresholds, relevance_gate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn relevance gate thresholds from query traces")
+    parser.add_argument("--limit", type=int, default=10000, help="Most recent traces to use")
+    parser.add_argument(
+        "--max-false-skip",
+        type=float,
+        default=settings.relevance_gate_max_false_skip,
+        help="Tolerated share of answered queries the gate would have skipped"
+    )
+    parser.add_argument("--min-samples", type=int, default=50, help="Answered queries needed per model")
+    parser.add_argument("--dry-run", action="store_true", help="Print thresholds without saving them")
+    args = parser.parse_args()
+    
+    traces = postgres.get_query_traces_for_calibration(args.limit)
+    thresholds = calibrate_thresholds(traces, args.max_false_skip, args.min_samples)
+    if not thresholds:
+        print(f"No usable traces among the last {args.limit}; run some queries first")
+        return
+    
+    print(json.dumps(thresholds, indent=2, sort_keys=True))
+    calibrated = {key: value for key, value in thresholds.items() if value["max_distance"] is not None}
+    if args.dry_run or not calibrated:
+        return
+    relevance_gate.save(calibrated)
+    print(f"Saved {len(calibrated)} threshold(s) to {relevance_gate.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,31 +2,109 @@
 PostgreSQL connection and operations
 """
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from contextlib import contextmanager
-from typing import Any, Dict, List, Optional
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
 import logging
+import threading
 from config import settings
+from utils.concurrency import run_blocking
 
 logger = logging.getLogger(__name__)
 
 
+# Connection pool, created lazily on first use
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises when exhausted; this makes callers wait instead
+_pool_slots = threading.BoundedSemaphore(settings.db_pool_max_size)
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    """Get or create the global connection pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    settings.db_pool_min_size,
+                    settings.db_pool_max_size,
+                    settings.postgres_url
+                )
+                logger.info(
+                    f"PostgreSQL pool created (min={settings.db_pool_min_size}, "
+                    f"max={settings.db_pool_max_size})"
+                )
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    """Cheap liveness check for a pooled connection"""
+    if conn.closed:
+        return False
+    if not settings.db_pool_health_check:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(pool: ThreadedConnectionPool):
+    """Take a healthy connection from the pool, replacing dead ones"""
+    for _ in range(settings.db_pool_max_size + 1):
+        conn = pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        logger.warning("Discarding broken pooled database connection")
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("Could not obtain a healthy database connection")
+
+
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections"""
+    """Context manager for pooled database connections (one transaction)"""
+    pool = _get_pool()
     conn = None
+    _pool_slots.acquire()
     try:
-        conn = psycopg2.connect(settings.postgres_url)
+        conn = _checkout(pool)
         yield conn
         conn.commit()
     except Exception as e:
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         logger.error(f"Database error: {e}")
         raise
     finally:
         if conn:
-            conn.close()
+            pool.putconn(conn, close=bool(conn.closed))
+        _pool_slots.release()
+
+
+def close_pool():
+    """Close all pooled connections (application shutdown hook)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            logger.info("PostgreSQL pool closed")
+
+
+async def run_async(func: Callable, *args, **kwargs) -> Any:
+    """
+    Await a blocking database function from an async handler
+    
+    The call runs in a worker thread using a pooled connection, so the event
+    loop keeps serving other requests meanwhile.
+    """
+    return await run_blocking(func, *args, **kwargs)
 
 
 def execute_query(query: str, params: tuple = None, fetch: bool = True) -> Optional[List[Dict]]:
@@ -39,16 +117,22 @@ def execute_query(query: str, params: tuple = None, fetch: bool = True) -> Optio
             return None
 
 
-def insert_document(filename: str, file_type: str, file_size: int, metadata: Dict = None) -> str:
+def insert_document(
+    filename: str,
+    file_type: str,
+    file_size: int,
+    metadata: Dict = None,
+    status: str = "processing"
+) -> str:
     """Insert a new document and return its ID"""
     query = """
         INSERT INTO documents (filename, file_type, file_size, metadata, status)
-        VALUES (%s, %s, %s, %s, 'processing')
+        VALUES (%s, %s, %s, %s, %s)
         RETURNING id::text
     """
     with get_db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(query, (filename, file_type, file_size, Json(metadata or {})))
+            cur.execute(query, (filename, file_type, file_size, Json(metadata or {}), status))
             doc_id = cur.fetchone()[0]
             return doc_id
 
@@ -59,6 +143,49 @@ def update_document_status(doc_id: str, status: str):
     execute_query(query, (status, doc_id), fetch=False)
 
 
+def update_document_metadata(doc_id: str, updates: Dict):
+    """Merge keys into a document's metadata (e.g. ingestion progress)"""
+    query = "UPDATE documents SET metadata = COALESCE(metadata, '{}'::jsonb) || %s WHERE id = %s"
+    execute_query(query, (Json(updates), doc_id), fetch=False)
+
+
+def get_document_ids_by_status(
+    statuses: List[str],
+    source: str = None,
+    exclude_source: str = None
+) -> List[str]:
+    """
+    Get IDs of documents in any of the given statuses, oldest first
+    
+    Args:
+        statuses: Document statuses to match
+        source: Optional metadata source to match, e.g. "bulk_ingest"
+        exclude_source: Optional metadata source to leave out
+    """
+    query = """
+        SELECT id::text
+        FROM documents
+        WHERE status = ANY(%s)
+          AND (%s::text IS NULL OR metadata->>'source' = %s)
+          AND (%s::text IS NULL OR metadata->>'source' IS DISTINCT FROM %s)
+        ORDER BY upload_date
+    """
+    params = (list(statuses), source, source, exclude_source, exclude_source)
+    return [row["id"] for row in execute_query(query, params)]
+
+
+def delete_document_chunks(doc_id: str):
+    """Delete all chunk references of a document"""
+    query = "DELETE FROM document_chunks WHERE document_id = %s"
+    execute_query(query, (doc_id,), fetch=False)
+
+
+def delete_document(doc_id: str):
+    """Delete a document (chunk references cascade)"""
+    query = "DELETE FROM documents WHERE id = %s"
+    execute_query(query, (doc_id,), fetch=False)
+
+
 def insert_document_chunk(
     doc_id: str,
     chunk_index: int,
@@ -84,6 +211,67 @@ def insert_document_chunk(
             return chunk_id
 
 
+async def execute_query_async(query: str, params: tuple = None, fetch: bool = True) -> Optional[List[Dict]]:
+    """Async variant of execute_query for FastAPI handlers"""
+    return await run_async(execute_query, query, params, fetch)
+
+
+def insert_document_chunks(
+    doc_id: str,
+    chunks: List[Dict],
+    status: Optional[str] = None
+) -> List[str]:
+    """
+    Insert all chunk references for a document in one transaction
+    
+    Rows are sent as batched multi-row VALUES, and the document status is
+    updated in the same transaction, so a document is never marked
+    completed with only part of its chunks stored.
+    
+    Args:
+        doc_id: Parent document ID
+        chunks: Dicts with chunk_index, weaviate_id, chunk_text, token_count, metadata
+        status: Optional new document status to set atomically
+        
+    Returns:
+        List of chunk IDs in input order
+    """
+    query = """
+        INSERT INTO document_chunks 
+        (document_id, chunk_index, weaviate_id, chunk_text, token_count, metadata)
+        VALUES %s
+        RETURNING id::text
+    """
+    rows = [
+        (
+            doc_id,
+            chunk["chunk_index"],
+            chunk["weaviate_id"],
+            chunk["chunk_text"],
+            chunk["token_count"],
+            Json(chunk.get("metadata") or {})
+        )
+        for chunk in chunks
+    ]
+    
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            chunk_ids = []
+            if rows:
+                result = execute_values(
+                    cur, query, rows,
+                    page_size=settings.db_bulk_insert_page_size,
+                    fetch=True
+                )
+                chunk_ids = [row[0] for row in result]
+            if status:
+                cur.execute(
+                    "UPDATE documents SET status = %s WHERE id = %s",
+                    (status, doc_id)
+                )
+            return chunk_ids
+
+
 def get_documents() -> List[Dict]:
     """Get all documents"""
     query = """
@@ -102,6 +290,96 @@ def get_documents() -> List[Dict]:
     return execute_query(query)
 
 
+def get_corpus_version() -> tuple:
+    """
+    Cheap fingerprint of the searchable corpus: (completed documents, their
+    latest updated_at)
+    
+    Changes whenever any process finishes or deletes a completed document,
+    so in-memory state built from the corpus can tell when it is stale.
+    Progress reports on documents still being ingested don't count: they
+    bump updated_at every few seconds without changing what is searchable.
+    Deleting a completed document lowers the count; if another one
+    completes in the meantime, its newer updated_at changes the fingerprint
+    instead, so no separate deletion counter is needed.
+    """
+    query = """
+        SELECT COUNT(*) AS documents, MAX(updated_at) AS updated_at
+        FROM documents
+        WHERE status = 'completed'
+    """
+    row = execute_query(query)[0]
+    return (row["documents"], row["updated_at"])
+
+
+def get_document_versions(statuses: List[str]) -> Dict[str, tuple]:
+    """Get {document ID: (status, updated_at)} for documents in any of the given statuses"""
+    query = """
+        SELECT id::text, status, updated_at
+        FROM documents
+        WHERE status = ANY(%s)
+    """
+    return {
+        row["id"]: (row["status"], row["updated_at"])
+        for row in execute_query(query, (list(statuses),))
+    }
+
+
+def get_all_chunks(document_ids: List[str] = None) -> List[Dict]:
+    """Get every stored chunk (or those of some documents) with its document name"""
+    query = """
+        SELECT 
+            c.document_id::text,
+            d.filename,
+            c.chunk_index,
+            c.weaviate_id,
+            c.chunk_text,
+            c.metadata->>'hash' AS chunk_hash
+        FROM document_chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE %s::uuid[] IS NULL OR c.document_id = ANY(%s::uuid[])
+    """
+    ids = list(document_ids) if document_ids is not None else None
+    return execute_query(query, (ids, ids))
+
+
+def get_document_ids_matching(
+    document_ids: Optional[List[str]] = None,
+    filenames: Optional[List[str]] = None,
+    file_types: Optional[List[str]] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None
+) -> List[str]:
+    """Get IDs of documents matching all given criteria (search scoping)"""
+    conditions = []
+    params = []
+    if document_ids:
+        conditions.append("id::text = ANY(%s)")
+        params.append(list(document_ids))
+    if filenames:
+        conditions.append("filename = ANY(%s)")
+        params.append(list(filenames))
+    if file_types:
+        conditions.append("file_type = ANY(%s)")
+        params.append([file_type.lower().lstrip(".") for file_type in file_types])
+    if uploaded_after:
+        conditions.append("upload_date >= %s")
+        params.append(uploaded_after)
+    if uploaded_before:
+        conditions.append("upload_date <= %s")
+        params.append(uploaded_before)
+    
+    query = "SELECT id::text FROM documents"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return [row["id"] for row in execute_query(query, tuple(params))]
+
+
+def count_documents() -> int:
+    """Number of documents in the corpus"""
+    return execute_query("SELECT COUNT(*) AS documents FROM documents")[0]["documents"]
+
+
 def get_document_by_id(doc_id: str) -> Optional[Dict]:
     """Get document by ID"""
     query = """
@@ -129,14 +407,17 @@ def insert_query_trace(
     llm_provider: str,
     embedding_provider: str,
     top_k: int,
-    processing_time_ms: int
+    processing_time_ms: int,
+    metadata: Dict = None,
+    time_to_first_token_ms: Optional[int] = None
 ) -> str:
     """Insert a query trace for debugging"""
     query = """
         INSERT INTO query_traces
         (query_text, retrieved_chunk_ids, similarity_scores, answer_text, 
-         citations, llm_provider, embedding_provider, top_k, processing_time_ms)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+         citations, llm_provider, embedding_provider, top_k, processing_time_ms,
+         time_to_first_token_ms, metadata)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING id::text
     """
     with get_db_connection() as conn:
@@ -152,13 +433,62 @@ def insert_query_trace(
                     llm_provider,
                     embedding_provider,
                     top_k,
-                    processing_time_ms
+                    processing_time_ms,
+                    time_to_first_token_ms,
+                    Json(metadata or {})
                 )
             )
             trace_id = cur.fetchone()[0]
             return trace_id
 
 
+def insert_query_traces(traces: List[Dict]) -> List[str]:
+    """
+    Insert many query traces in one transaction (batch queries)
+    
+    Args:
+        traces: Dicts with the keyword arguments of insert_query_trace
+        
+    Returns:
+        List of trace IDs in input order
+    """
+    query = """
+        INSERT INTO query_traces
+        (query_text, retrieved_chunk_ids, similarity_scores, answer_text, 
+         citations, llm_provider, embedding_provider, top_k, processing_time_ms,
+         time_to_first_token_ms, metadata)
+        VALUES %s
+        RETURNING id::text
+    """
+    rows = [
+        (
+            trace["query_text"],
+            Json(trace["retrieved_chunk_ids"]),
+            Json(trace["similarity_scores"]),
+            trace["answer_text"],
+            Json(trace["citations"]),
+            trace["llm_provider"],
+            trace["embedding_provider"],
+            trace["top_k"],
+            trace["processing_time_ms"],
+            trace.get("time_to_first_token_ms"),
+            Json(trace.get("metadata") or {})
+        )
+        for trace in traces
+    ]
+    if not rows:
+        return []
+    
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            result = execute_values(
+                cur, query, rows,
+                page_size=settings.db_bulk_insert_page_size,
+                fetch=True
+            )
+            return [row[0] for row in result]
+
+
 def get_query_trace(trace_id: str) -> Optional[Dict]:
     """Get query trace by ID"""
     query = """
@@ -173,6 +503,8 @@ def get_query_trace(trace_id: str) -> Optional[Dict]:
             embedding_provider,
             top_k,
             processing_time_ms,
+            time_to_first_token_ms,
+            metadata,
             created_at
         FROM query_traces
         WHERE id = %s
@@ -198,3 +530,19 @@ def get_query_traces(limit: int = 50) -> List[Dict]:
         LIMIT %s
     """
     return execute_query(query, (limit,))
+
+
+def get_query_traces_for_calibration(limit: int = 10000) -> List[Dict]:
+    """Recent traces with their similarity scores, for tuning the relevance gate"""
+    query = """
+        SELECT 
+            similarity_scores,
+            answer_text,
+            embedding_provider,
+            processing_time_ms,
+            metadata
+        FROM query_traces
+        ORDER BY created_at DESC
+        LIMIT %s
+    """
+    return execute_query(query, (limit,))
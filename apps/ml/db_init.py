@@ -50,9 +50,15 @@ CREATE TABLE IF NOT EXISTS query_traces (
     embedding_provider VARCHAR(50),
     top_k INTEGER,
     processing_time_ms INTEGER,
+    time_to_first_token_ms INTEGER,
+    metadata JSONB DEFAULT '{}',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Columns added after v0.1 (no-ops on fresh databases)
+ALTER TABLE query_traces ADD COLUMN IF NOT EXISTS metadata JSONB DEFAULT '{}';
+ALTER TABLE query_traces ADD COLUMN IF NOT EXISTS time_to_first_token_ms INTEGER;
+
 -- Indexes
 CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status);
 CREATE INDEX IF NOT EXISTS idx_documents_upload_date ON documents(upload_date);
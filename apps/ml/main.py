@@ -4,8 +4,12 @@ Main entry point for the RAG service
 """
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import json
 import logging
 import time
 
@@ -13,9 +17,15 @@ from config import settings
 from services.document_processor import document_processor
 from services.retriever import retriever
 from services.generator import generator
+from services.ingestion_jobs import ingestion_queue
+from services.reranker import reranker
 from utils import tracing
+from utils.caching import query_embedding_cache, answer_cache
+from utils.concurrency import iterate_blocking, run_blocking, shutdown_executors, submit_fanout
 from database import postgres
 from db_init import init_database
+from models.embeddings import close_embedders
+from models.llm import close_llms, llm_connection_stats
 
 # Configure logging
 logging.basicConfig(
@@ -35,6 +45,26 @@ app = FastAPI(
     version="0.1.0"
 )
 
+@app.on_event("startup")
+def startup():
+    """Start ingestion workers (and resume unfinished jobs)"""
+    ingestion_queue.start()
+    if settings.rerank_enabled:
+        # Load in the background so the first queries are not over budget
+        submit_fanout(reranker.load)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    """Release pooled resources"""
+    ingestion_queue.stop()
+    shutdown_executors()
+    reranker.shutdown()
+    close_embedders()
+    close_llms()
+    postgres.close_pool()
+
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -46,11 +76,30 @@ app.add_middleware(
 
 
 # Request/Response models
+class QueryFilters(BaseModel):
+    """Restrict retrieval to matching documents (all given criteria must match)"""
+    document_ids: Optional[List[str]] = None
+    filenames: Optional[List[str]] = None
+    file_types: Optional[List[str]] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+
 class QueryRequest(BaseModel):
     query: str
     top_k: Optional[int] = None
     llm_provider: Optional[str] = None
     embedding_provider: Optional[str] = None
+    filters: Optional[QueryFilters] = None
+
+
+class BatchQueryRequest(BaseModel):
+    """Many questions sharing the same options"""
+    queries: List[str]
+    top_k: Optional[int] = None
+    llm_provider: Optional[str] = None
+    embedding_provider: Optional[str] = None
+    filters: Optional[QueryFilters] = None
 
 
 class QueryResponse(BaseModel):
@@ -59,6 +108,7 @@ class QueryResponse(BaseModel):
     trace_id: str
     processing_time_ms: int
     context_used: int
+    cached: bool = False
 
 
 # Endpoints
@@ -78,7 +128,7 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Check database connection
-        postgres.execute_query("SELECT 1", fetch=True)
+        await postgres.execute_query_async("SELECT 1", fetch=True)
         return {
             "status": "healthy",
             "database": "connected",
@@ -89,39 +139,59 @@ async def health_check():
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
 
-@app.post("/documents/upload")
+@app.post("/documents/upload", status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     embedding_provider: Optional[str] = Query(None)
 ):
     """
-    Upload and process a document
+    Upload a document for background processing
     
-    Accepts .txt and .md files
+    Accepts .txt and .md files. Returns a job ID right away; poll
+    /jobs/{job_id} for progress.
     """
     logger.info(f"Uploading document: {file.filename}")
     
     try:
         content = await file.read()
-        result = await document_processor.process_document(
+        doc_id = await run_blocking(
+            document_processor.create_document,
             file_content=content,
             filename=file.filename,
             embedding_provider=embedding_provider
         )
-        return result
+        ingestion_queue.submit(doc_id)
+        return {
+            "job_id": doc_id,
+            "document_id": doc_id,
+            "filename": file.filename,
+            "status": "pending"
+        }
     except ValueError as e:
         logger.error(f"Validation error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
-        raise HTTPException(status_code=500, detail="Document processing failed")
+        raise HTTPException(status_code=500, detail="Document upload failed")
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get ingestion job status and progress"""
+    try:
+        return await run_blocking(ingestion_queue.get_job, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting job: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve job")
 
 
 @app.get("/documents")
 async def get_documents():
     """Get all documents"""
     try:
-        documents = document_processor.get_documents()
+        documents = await run_blocking(document_processor.get_documents)
         return {"documents": documents}
     except Exception as e:
         logger.error(f"Error getting documents: {e}")
@@ -132,7 +202,7 @@ async def get_documents():
 async def get_document(doc_id: str):
     """Get document by ID"""
     try:
-        document = document_processor.get_document(doc_id)
+        document = await run_blocking(document_processor.get_document, doc_id)
         return document
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -141,68 +211,469 @@ async def get_document(doc_id: str):
         raise HTTPException(status_code=500, detail="Failed to retrieve document")
 
 
-@app.post("/query", response_model=QueryResponse)
-async def query_rag(request: QueryRequest):
+def _filter_args(request: QueryRequest) -> Tuple[Optional[Dict], str]:
     """
-    Main RAG endpoint: retrieve and generate answer
+    Retrieval filters as a dict, plus a stable key for the answer cache
     
-    This is the core of the RAG pipeline:
-    1. Retrieve relevant chunks
-    2. Generate answer with citations
-    3. Save trace for debugging
+    Returns:
+        Tuple of (filters or None, scope key; "" when unscoped)
+    """
+    if request.filters is None:
+        return None, ""
+    filters = request.filters.model_dump(mode="json", exclude_none=True)
+    if not filters:
+        return None, ""
+    return filters, json.dumps(filters, sort_keys=True)
+
+
+def _answer_cache_generation() -> int:
+    """Corpus generation a new query runs against (after catching up with other processes)"""
+    answer_cache.sync_corpus(postgres.get_corpus_version)
+    return answer_cache.generation
+
+
+def _lookup_answer_cache(
+    request: QueryRequest,
+    trace_metadata: Dict,
+    query_embedding: Optional[List[float]] = None
+) -> Tuple[Optional[Dict], Optional[List[float]]]:
+    """
+    Look up a cached answer (exact, then semantic) and record it in the trace
+    
+    Args:
+        request: The query
+        trace_metadata: Trace metadata to record the lookup in
+        query_embedding: Precomputed query embedding (batch queries)
+    
+    Returns:
+        Tuple of (cache hit or None, query embedding if one was computed)
+    """
+    top_k = request.top_k or settings.default_top_k
+    llm_provider = request.llm_provider or settings.llm_provider
+    embedding_provider = request.embedding_provider or settings.embedding_provider
+    _, scope = _filter_args(request)
+    
+    cache_hit = answer_cache.get_exact(request.query, top_k, llm_provider, embedding_provider, scope)
+    
+    if cache_hit is None and answer_cache.semantic_enabled:
+        if query_embedding is None:
+            query_embedding = retriever.embed_query(request.query, request.embedding_provider)
+        cache_hit = answer_cache.get_similar(query_embedding, top_k, llm_provider, embedding_provider, scope)
+    
+    if cache_hit is not None:
+        logger.info(f"Answer cache hit ({cache_hit['match']})")
+        trace_metadata["answer_cache"] = {
+            "hit": True,
+            "match": cache_hit["match"],
+            "similarity": cache_hit["similarity"]
+        }
+    else:
+        trace_metadata["answer_cache"] = {"hit": False}
+    
+    return cache_hit, query_embedding
+
+
+def _answer_query(request: QueryRequest) -> QueryResponse:
+    """
+    Run the blocking RAG pipeline for one query (called in a worker thread)
+    
+    1. Serve from the answer cache when possible
+    2. Retrieve relevant chunks
+    3. Generate answer with citations
+    4. Save trace for debugging
     """
     start_time = time.time()
     
-    logger.info(f"Query received: {request.query[:100]}...")
+    top_k = request.top_k or settings.default_top_k
+    llm_provider = request.llm_provider or settings.llm_provider
+    embedding_provider = request.embedding_provider or settings.embedding_provider
+    filters, scope = _filter_args(request)
+    trace_metadata = {"filters": filters} if filters else {}
     
-    try:
+    # Serve repeated questions from the answer cache
+    generation = _answer_cache_generation()
+    cache_hit, query_embedding = _lookup_answer_cache(request, trace_metadata)
+    
+    if cache_hit is not None:
+        generation_result = cache_hit["result"]
+    else:
         # Retrieve relevant chunks
         chunks = retriever.retrieve(
             query=request.query,
             top_k=request.top_k,
-            embedding_provider=request.embedding_provider
+            embedding_provider=request.embedding_provider,
+            query_embedding=query_embedding,
+            trace=trace_metadata,
+            filters=filters
         )
         
         # Generate answer
         generation_result = generator.generate_answer(
             query=request.query,
             chunks=chunks,
-            llm_provider=request.llm_provider
+            llm_provider=request.llm_provider,
+            trace=trace_metadata,
+            embedding_provider=request.embedding_provider
         )
         
-        # Calculate processing time
+        answer_cache.store(
+            request.query, top_k, llm_provider, embedding_provider,
+            result=generation_result,
+            generation=generation,
+            query_embedding=query_embedding,
+            scope=scope
+        )
+    
+    # Calculate processing time
+    processing_time_ms = int((time.time() - start_time) * 1000)
+    
+    # Save trace
+    trace_id = tracing.save_trace(
+        query_text=request.query,
+        chunks=generation_result.get("chunks", []),
+        answer=generation_result["answer"],
+        citations=generation_result["citations"],
+        llm_provider=llm_provider,
+        embedding_provider=embedding_provider,
+        top_k=top_k,
+        processing_time_ms=processing_time_ms,
+        metadata=trace_metadata
+    )
+    
+    return QueryResponse(
+        answer=generation_result["answer"],
+        citations=generation_result["citations"],
+        trace_id=trace_id,
+        processing_time_ms=processing_time_ms,
+        context_used=generation_result.get("context_used", 0),
+        cached=cache_hit is not None
+    )
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query_rag(request: QueryRequest):
+    """
+    Main RAG endpoint: retrieve and generate answer
+    
+    This is the core of the RAG pipeline:
+    1. Retrieve relevant chunks
+    2. Generate answer with citations
+    3. Save trace for debugging
+    
+    The pipeline runs in a worker thread, so a slow LLM call does not block
+    other requests.
+    """
+    logger.info(f"Query received: {request.query[:100]}...")
+    
+    try:
+        return await run_blocking(_answer_query, request)
+    except Exception as e:
+        logger.error(f"Error processing query: {e}")
+        raise HTTPException(status_code=500, detail="Query processing failed")
+
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _stream_query(request: QueryRequest) -> Iterator[str]:
+    """
+    Blocking SSE generator for /query/stream
+    
+    Driven through iterate_blocking, so each step runs in the bounded request
+    worker pool and the event loop stays free while we wait on retrieval and
+    the LLM.
+    
+    Events: sources -> token* / citation* -> done (or error)
+    """
+    start_time = time.time()
+    
+    top_k = request.top_k or settings.default_top_k
+    llm_provider = request.llm_provider or settings.llm_provider
+    embedding_provider = request.embedding_provider or settings.embedding_provider
+    filters, scope = _filter_args(request)
+    trace_metadata = {"filters": filters} if filters else {}
+    first_token_ms = None
+    
+    try:
+        generation = _answer_cache_generation()
+        cache_hit, query_embedding = _lookup_answer_cache(request, trace_metadata)
+        
+        if cache_hit is not None:
+            events = generator.replay_answer(cache_hit["result"])
+        else:
+            chunks = retriever.retrieve(
+                query=request.query,
+                top_k=request.top_k,
+                embedding_provider=request.embedding_provider,
+                query_embedding=query_embedding,
+                trace=trace_metadata,
+                filters=filters
+            )
+            events = generator.stream_answer(
+                query=request.query,
+                chunks=chunks,
+                llm_provider=request.llm_provider,
+                trace=trace_metadata,
+                embedding_provider=request.embedding_provider
+            )
+        
+        generation_result = None
+        for event in events:
+            if event["event"] == "result":
+                generation_result = event["data"]
+                continue
+            if event["event"] == "token" and first_token_ms is None:
+                first_token_ms = int((time.time() - start_time) * 1000)
+            yield _sse(event["event"], event["data"])
+        
+        if cache_hit is None:
+            answer_cache.store(
+                request.query, top_k, llm_provider, embedding_provider,
+                result=generation_result,
+                generation=generation,
+                query_embedding=query_embedding,
+                scope=scope
+            )
+        
         processing_time_ms = int((time.time() - start_time) * 1000)
         
-        # Save trace
         trace_id = tracing.save_trace(
             query_text=request.query,
             chunks=generation_result.get("chunks", []),
             answer=generation_result["answer"],
             citations=generation_result["citations"],
-            llm_provider=request.llm_provider or settings.llm_provider,
-            embedding_provider=request.embedding_provider or settings.embedding_provider,
-            top_k=request.top_k or settings.default_top_k,
-            processing_time_ms=processing_time_ms
-        )
-        
-        return QueryResponse(
-            answer=generation_result["answer"],
-            citations=generation_result["citations"],
-            trace_id=trace_id,
+            llm_provider=llm_provider,
+            embedding_provider=embedding_provider,
+            top_k=top_k,
             processing_time_ms=processing_time_ms,
-            context_used=generation_result.get("context_used", 0)
+            metadata=trace_metadata,
+            time_to_first_token_ms=first_token_ms
         )
+        
+        yield _sse("done", {
+            "trace_id": trace_id,
+            "processing_time_ms": processing_time_ms,
+            "time_to_first_token_ms": first_token_ms,
+            "context_used": generation_result.get("context_used", 0),
+            "citations": generation_result["citations"],
+            "cached": cache_hit is not None
+        })
     
     except Exception as e:
-        logger.error(f"Error processing query: {e}")
-        raise HTTPException(status_code=500, detail="Query processing failed")
+        logger.error(f"Error streaming query: {e}")
+        yield _sse("error", {"detail": "Query processing failed"})
+
+
+@app.post("/query/stream")
+async def query_rag_stream(request: QueryRequest):
+    """
+    Streaming RAG endpoint (Server-Sent Events)
+    
+    Sends the retrieved sources first, then answer tokens as the LLM produces
+    them, a citation event the first time each [N] marker appears, and a
+    final done event with the trace ID and timings.
+    """
+    logger.info(f"Streaming query received: {request.query[:100]}...")
+    return StreamingResponse(
+        iterate_blocking(_stream_query(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Per-provider caps on concurrent batch generations (created on first use,
+# always from the event loop thread)
+_generation_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def _generation_slot(llm_provider: str) -> asyncio.Semaphore:
+    """Semaphore limiting concurrent batch generations for one LLM provider"""
+    if llm_provider not in _generation_slots:
+        limit = getattr(settings, f"{llm_provider}_max_concurrency", 1)
+        _generation_slots[llm_provider] = asyncio.Semaphore(max(limit, 1))
+    return _generation_slots[llm_provider]
+
+
+async def _answer_batch_item(
+    index: int,
+    request: QueryRequest,
+    query_embedding: List[float],
+    generation: int,
+    retrieval_slots: asyncio.Semaphore
+) -> Dict:
+    """
+    Answer one question of a batch
+    
+    Retrieval waits for one of the batch's retrieval slots, generation for a
+    slot of its LLM provider. The trace is returned instead of saved, so the
+    batch can write all traces at once.
+    """
+    start_time = time.time()
+    
+    top_k = request.top_k or settings.default_top_k
+    llm_provider = request.llm_provider or settings.llm_provider
+    embedding_provider = request.embedding_provider or settings.embedding_provider
+    filters, scope = _filter_args(request)
+    trace_metadata = {"batch": True, "filters": filters} if filters else {"batch": True}
+    
+    try:
+        # Takes a lock and may run the semantic matrix product: keep it off the loop
+        cache_hit, _ = await run_blocking(_lookup_answer_cache, request, trace_metadata, query_embedding)
+        if cache_hit is not None:
+            generation_result = cache_hit["result"]
+        else:
+            async with retrieval_slots:
+                chunks = await run_blocking(
+                    retriever.retrieve,
+                    query=request.query,
+                    top_k=request.top_k,
+                    embedding_provider=request.embedding_provider,
+                    query_embedding=query_embedding,
+                    trace=trace_metadata,
+                    filters=filters
+                )
+            async with _generation_slot(llm_provider):
+                generation_result = await run_blocking(
+                    generator.generate_answer,
+                    query=request.query,
+                    chunks=chunks,
+                    llm_provider=request.llm_provider,
+                    trace=trace_metadata,
+                    embedding_provider=request.embedding_provider
+                )
+            answer_cache.store(
+                request.query, top_k, llm_provider, embedding_provider,
+                result=generation_result,
+                generation=generation,
+                query_embedding=query_embedding,
+                scope=scope
+            )
+    except Exception as e:
+        logger.error(f"Error processing batch query {index}: {e}")
+        return {"index": index, "query": request.query, "error": "Query processing failed"}
+    
+    processing_time_ms = int((time.time() - start_time) * 1000)
+    return {
+        "index": index,
+        "query": request.query,
+        "answer": generation_result["answer"],
+        "citations": generation_result["citations"],
+        "context_used": generation_result.get("context_used", 0),
+        "cached": cache_hit is not None,
+        "processing_time_ms": processing_time_ms,
+        "trace": {
+            "query_text": request.query,
+            "chunks": generation_result.get("chunks", []),
+            "answer": generation_result["answer"],
+            "citations": generation_result["citations"],
+            "llm_provider": llm_provider,
+            "embedding_provider": embedding_provider,
+            "top_k": top_k,
+            "processing_time_ms": processing_time_ms,
+            "metadata": trace_metadata
+        }
+    }
+
+
+async def _stream_batch(request: BatchQueryRequest) -> AsyncIterator[str]:
+    """
+    NDJSON stream for /query/batch: one line per answer as it finishes
+    (with its input index), then a summary line with all trace IDs
+    """
+    start_time = time.time()
+    
+    try:
+        embeddings = await run_blocking(retriever.embed_queries, request.queries, request.embedding_provider)
+    except Exception as e:
+        logger.error(f"Error embedding batch queries: {e}")
+        yield json.dumps({"error": "Query embedding failed"}) + "\n"
+        return
+    
+    generation = await run_blocking(_answer_cache_generation)
+    options = request.model_dump(exclude={"queries"})
+    # Leave most request threads to other clients while a large batch runs
+    retrieval_slots = asyncio.Semaphore(settings.batch_retrieval_concurrency)
+    tasks = [
+        asyncio.create_task(
+            _answer_batch_item(
+                index, QueryRequest(query=query, **options), embedding, generation, retrieval_slots
+            )
+        )
+        for index, (query, embedding) in enumerate(zip(request.queries, embeddings))
+    ]
+    
+    traces: Dict[int, Dict] = {}
+    failed = 0
+    try:
+        for finished in asyncio.as_completed(tasks):
+            item = await finished
+            trace = item.pop("trace", None)
+            if trace is not None:
+                traces[item["index"]] = trace
+            else:
+                failed += 1
+            yield json.dumps(item, default=str) + "\n"
+    finally:
+        # Client went away: stop whatever has not finished yet
+        for task in tasks:
+            task.cancel()
+    
+    indexes = sorted(traces)
+    trace_ids = await run_blocking(tracing.save_traces, [traces[i] for i in indexes])
+    yield json.dumps({
+        "done": True,
+        "count": len(request.queries),
+        "failed": failed,
+        "trace_ids": dict(zip(indexes, trace_ids)),
+        "processing_time_ms": int((time.time() - start_time) * 1000)
+    }) + "\n"
+
+
+@app.post("/query/batch")
+async def query_rag_batch(request: BatchQueryRequest):
+    """
+    Batch RAG endpoint for evaluation and bulk-answer jobs
+    
+    All questions are embedded in one batch, retrievals run concurrently,
+    and generations are limited per LLM provider (<PROVIDER>_MAX_CONCURRENCY).
+    Results stream back as NDJSON in completion order; traces are written
+    in one bulk insert at the end.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(request.queries) > settings.batch_max_queries:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.batch_max_queries} queries per batch"
+        )
+    
+    logger.info(f"Batch of {len(request.queries)} queries received")
+    return StreamingResponse(_stream_batch(request), media_type="application/x-ndjson")
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for in-process caches"""
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "rerank_scores": reranker.score_cache.stats()
+    }
+
+
+@app.get("/llm/connections")
+async def llm_connections():
+    """Connection reuse per LLM client: requests vs new connections opened"""
+    return llm_connection_stats()
 
 
 @app.get("/traces/{trace_id}")
 async def get_trace(trace_id: str):
     """Get query trace by ID"""
     try:
-        trace = tracing.get_trace(trace_id)
+        trace = await run_blocking(tracing.get_trace, trace_id)
         return trace
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -215,7 +686,7 @@ async def get_trace(trace_id: str):
 async def get_traces(limit: int = Query(50, le=100)):
     """Get recent query traces"""
     try:
-        traces = tracing.get_traces(limit=limit)
+        traces = await run_blocking(tracing.get_traces, limit=limit)
         return {"traces": traces}
     except Exception as e:
         logger.error(f"Error getting traces: {e}")
@@ -4,9 +4,13 @@ Embedding providers: Local (Sentence Transformers) and OpenAI
 from abc import ABC, abstractmethod
 from typing import List
 import logging
+import threading
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from openai import OpenAI
 from config import settings
+from models.registry import InstanceRegistry
+from utils.concurrency import embedding_slots
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +32,29 @@ class AbstractEmbedder(ABC):
     def get_dimension(self) -> int:
         """Get embedding dimension"""
         pass
+    
+    def close(self):
+        """Release resources held by the embedder (optional)"""
+        pass
+    
+    def get_full_dimension(self) -> int:
+        """Native model dimension (differs from get_dimension when truncated)"""
+        return self.get_dimension()
+    
+    def embed_batch_full(self, texts: List[str]) -> List[List[float]]:
+        """Generate full-dimension embeddings for multiple texts"""
+        return self.embed_batch(texts)
+    
+    def truncate(self, embeddings: List[List[float]]) -> List[List[float]]:
+        """Reduce full-dimension embeddings to get_dimension()"""
+        return embeddings
+    
+    def rescores_full_dimension(self) -> bool:
+        """Index truncated vectors but rescore final hits with full ones"""
+        return (
+            settings.embedding_rescore_full_dimensions
+            and self.get_full_dimension() != self.get_dimension()
+        )
 
 
 class LocalEmbedder(AbstractEmbedder):
@@ -39,26 +66,95 @@ class LocalEmbedder(AbstractEmbedder):
         self.model = SentenceTransformer(self.model_name)
         self._dimension = self.model.get_sentence_embedding_dimension()
         logger.info(f"Model loaded successfully. Dimension: {self._dimension}")
+        # Worker processes for bulk encoding, started on first large batch
+        self._pool = None
+        self._pool_lock = threading.Lock()
     
     def embed_text(self, text: str) -> List[float]:
         """Generate embedding for a single text"""
-        embedding = self.model.encode(text, convert_to_numpy=True)
+        with embedding_slots:
+            embedding = self.model.encode(text, convert_to_numpy=True)
         return embedding.tolist()
     
     def embed_batch(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for multiple texts"""
-        embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+        if self._use_multi_process(len(texts)):
+            return self._embed_multi_process(texts)
+        
+        with embedding_slots:
+            embeddings = self.model.encode(
+                texts,
+                batch_size=settings.local_embedding_batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=True
+            )
         return embeddings.tolist()
     
+    @staticmethod
+    def _use_multi_process(batch_size: int) -> bool:
+        """Only large batches amortize the inter-process overhead"""
+        return (
+            settings.local_embedding_processes > 1
+            and batch_size >= settings.local_embedding_mp_min_batch
+        )
+    
+    def _embed_multi_process(self, texts: List[str]) -> List[List[float]]:
+        """
+        Encode a large batch across worker processes
+        
+        Texts are sorted by length before being split into per-worker chunks,
+        so each forward pass pads to similar lengths; results are put back in
+        input order.
+        """
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+        
+        # The pool's queues are shared, so one batch at a time
+        with self._pool_lock:
+            if self._pool is None:
+                logger.info(f"Starting {settings.local_embedding_processes} embedding processes")
+                self._pool = self.model.start_multi_process_pool(
+                    target_devices=["cpu"] * settings.local_embedding_processes
+                )
+            embeddings = self.model.encode_multi_process(
+                sorted_texts,
+                self._pool,
+                batch_size=settings.local_embedding_batch_size,
+                chunk_size=settings.local_embedding_mp_chunk_size or None
+            )
+        
+        result = np.empty_like(embeddings)
+        result[order] = embeddings
+        return result.tolist()
+    
+    def close(self):
+        """Stop embedding worker processes"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+                logger.info("Embedding processes stopped")
+    
     def get_dimension(self) -> int:
         """Get embedding dimension"""
         return self._dimension
 
 
+# Native sizes of OpenAI embedding models
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Models trained with Matryoshka loss: a prefix of the vector is a valid embedding
+OPENAI_SHORTENABLE_MODELS = {"text-embedding-3-small", "text-embedding-3-large"}
+
+
 class OpenAIEmbedder(AbstractEmbedder):
     """OpenAI embeddings API"""
     
-    def __init__(self, model_name: str = None, api_key: str = None):
+    def __init__(self, model_name: str = None, api_key: str = None, dimensions: int = None):
         self.model_name = model_name or settings.openai_embedding_model
         api_key = api_key or settings.openai_api_key
         
@@ -66,30 +162,76 @@ class OpenAIEmbedder(AbstractEmbedder):
             raise ValueError("OpenAI API key is required for OpenAI embeddings")
         
         self.client = OpenAI(api_key=api_key)
-        # text-embedding-3-small has 1536 dimensions
-        self._dimension = 1536
-        logger.info(f"OpenAI embedder initialized with model: {self.model_name}")
+        self._full_dimension = OPENAI_EMBEDDING_DIMENSIONS.get(self.model_name, 1536)
+        
+        if dimensions is None:
+            dimensions = settings.openai_embedding_dimensions
+        if dimensions and dimensions != self._full_dimension:
+            if self.model_name not in OPENAI_SHORTENABLE_MODELS:
+                raise ValueError(f"{self.model_name} does not support shortened embeddings")
+            if not 0 < dimensions < self._full_dimension:
+                raise ValueError(
+                    f"Embedding dimensions must be between 1 and {self._full_dimension} "
+                    f"for {self.model_name}, got {dimensions}"
+                )
+            self._dimension = dimensions
+        else:
+            self._dimension = self._full_dimension
+        logger.info(f"OpenAI embedder initialized with model: {self.model_name} ({self._dimension} dims)")
+    
+    def _create(self, texts, dimensions: int = None):
+        """Call the embeddings API, asking for shortened vectors if requested"""
+        if dimensions is not None and dimensions != self._full_dimension:
+            # Shortened server-side: smaller response payload, already unit length
+            return self.client.embeddings.create(model=self.model_name, input=texts, dimensions=dimensions)
+        return self.client.embeddings.create(model=self.model_name, input=texts)
     
     def embed_text(self, text: str) -> List[float]:
         """Generate embedding for a single text"""
-        response = self.client.embeddings.create(
-            model=self.model_name,
-            input=text
-        )
+        response = self._create(text, self._dimension)
         return response.data[0].embedding
     
     def embed_batch(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for multiple texts"""
         # OpenAI API accepts batch requests
-        response = self.client.embeddings.create(
-            model=self.model_name,
-            input=texts
-        )
+        response = self._create(texts, self._dimension)
+        return [item.embedding for item in response.data]
+    
+    def embed_batch_full(self, texts: List[str]) -> List[List[float]]:
+        """Generate full-dimension embeddings for multiple texts"""
+        response = self._create(texts)
         return [item.embedding for item in response.data]
     
+    def truncate(self, embeddings: List[List[float]]) -> List[List[float]]:
+        """Keep the first get_dimension() values and re-normalize (same as the API does)"""
+        if self._dimension == self._full_dimension:
+            return embeddings
+        matrix = np.asarray(embeddings, dtype=np.float32)[:, :self._dimension]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).tolist()
+    
     def get_dimension(self) -> int:
         """Get embedding dimension"""
         return self._dimension
+    
+    def get_full_dimension(self) -> int:
+        """Native model dimension"""
+        return self._full_dimension
+
+
+# Warm embedder instances shared across requests, keyed by (provider, model)
+_embedder_registry = InstanceRegistry(
+    name="embedders",
+    max_instances=settings.embedder_registry_max_models,
+    idle_ttl_seconds=settings.embedder_registry_idle_ttl_seconds,
+    on_evict=lambda embedder: embedder.close()
+)
+
+
+def close_embedders():
+    """Release all embedders (application shutdown)"""
+    _embedder_registry.clear()
 
 
 # Factory function
@@ -97,6 +239,9 @@ def get_embedder(provider: str = None) -> AbstractEmbedder:
     """
     Get embedder instance based on provider
     
+    Instances come from a registry, so each model is loaded once and reused
+    by every request (including per-request provider overrides).
+    
     Args:
         provider: "local" or "openai". If None, uses settings.embedding_provider
     
@@ -106,8 +251,17 @@ def get_embedder(provider: str = None) -> AbstractEmbedder:
     provider = provider or settings.embedding_provider
     
     if provider == "local":
-        return LocalEmbedder()
+        model_name = settings.local_embedding_model
+        factory = lambda: LocalEmbedder(model_name=model_name)
     elif provider == "openai":
-        return OpenAIEmbedder()
+        model_name = settings.openai_embedding_model
+        factory = lambda: OpenAIEmbedder(model_name=model_name)
     else:
         raise ValueError(f"Unknown embedding provider: {provider}")
+    
+    key = (provider, model_name)
+    if provider == settings.embedding_provider:
+        # The default model is used by almost every request; never evict it
+        _embedder_registry.pin(key)
+    
+    return _embedder_registry.get(key, factory)
@@ -2,15 +2,78 @@
 LLM providers: Ollama (local), OpenAI, and Groq
 """
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Dict, Iterator, List, Optional
 import logging
+import threading
+import httpx
 import ollama
 from openai import OpenAI
 from groq import Groq
 from config import settings
+from models.registry import InstanceRegistry
 
 logger = logging.getLogger(__name__)
 
+# httpcore trace events emitted only when a new connection is opened
+_CONNECT_EVENTS = {"connection.connect_tcp.complete", "connection.connect_unix_socket.complete"}
+
+
+class ConnectionStats:
+    """Requests sent vs connections opened by one HTTP client"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+    
+    def _trace(self, event_name: str, info: Dict):
+        """httpcore trace callback, called for each connection-level step"""
+        if event_name in _CONNECT_EVENTS:
+            with self._lock:
+                self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+    
+    def on_request(self, request: httpx.Request):
+        """httpx request hook: count the request and trace its connection"""
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.requests += 1
+    
+    def stats(self) -> Dict:
+        """Counters plus the share of requests served on a reused connection"""
+        with self._lock:
+            reused = max(self.requests - self.connections_opened, 0)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0
+            }
+
+
+def _http_timeout() -> httpx.Timeout:
+    """Connect fast or fail; generation itself may take a while"""
+    return httpx.Timeout(
+        settings.llm_http_read_timeout_seconds,
+        connect=settings.llm_http_connect_timeout_seconds
+    )
+
+
+def _http_client_options(connection_stats: ConnectionStats) -> Dict:
+    """Keyword arguments for an httpx.Client with the configured pool"""
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.llm_http_max_connections,
+            max_keepalive_connections=settings.llm_http_max_keepalive_connections,
+            keepalive_expiry=settings.llm_http_keepalive_expiry_seconds
+        ),
+        "timeout": _http_timeout(),
+        "event_hooks": {"request": [connection_stats.on_request]}
+    }
+
 
 class AbstractLLM(ABC):
     """Base class for LLM providers"""
@@ -28,6 +91,23 @@ class AbstractLLM(ABC):
             Generated answer text
         """
         pass
+    
+    def generate_stream(self, prompt: str, context: str) -> Iterator[str]:
+        """
+        Stream the answer as text deltas
+        
+        Providers override this with native streaming; the default yields
+        the whole answer at once.
+        """
+        yield self.generate(prompt=prompt, context=context)
+    
+    def connection_stats(self) -> Dict:
+        """Connection reuse counters of the provider's HTTP client"""
+        return self._connection_stats.stats()
+    
+    def close(self):
+        """Close the HTTP client and its pooled connections"""
+        self.client.close()
 
 
 class OllamaLLM(AbstractLLM):
@@ -36,10 +116,12 @@ class OllamaLLM(AbstractLLM):
     def __init__(self, model_name: str = None, base_url: str = None):
         self.model_name = model_name or settings.ollama_model
         self.base_url = base_url or settings.ollama_base_url
+        self._connection_stats = ConnectionStats()
+        self.client = ollama.Client(host=self.base_url, **_http_client_options(self._connection_stats))
         logger.info(f"Ollama LLM initialized with model: {self.model_name}")
     
-    def generate(self, prompt: str, context: str) -> str:
-        """Generate answer using Ollama"""
+    def _build_messages(self, prompt: str, context: str) -> List[Dict]:
+        """Build chat messages with RAG instructions"""
         
         # Construct system message with RAG instructions
         system_message = """You are a helpful assistant that answers questions based ONLY on the provided context.
@@ -59,18 +141,38 @@ Question: {prompt}
 
 Please answer the question using ONLY the context above. Include citations [1], [2], etc."""
         
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ]
+    
+    def generate(self, prompt: str, context: str) -> str:
+        """Generate answer using Ollama"""
         try:
-            response = ollama.chat(
+            response = self.client.chat(
                 model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ]
+                messages=self._build_messages(prompt, context)
             )
             return response["message"]["content"]
         except Exception as e:
             logger.error(f"Ollama generation error: {e}")
             raise
+    
+    def generate_stream(self, prompt: str, context: str) -> Iterator[str]:
+        """Stream answer tokens from Ollama"""
+        try:
+            stream = self.client.chat(
+                model=self.model_name,
+                messages=self._build_messages(prompt, context),
+                stream=True
+            )
+            for part in stream:
+                content = part["message"]["content"]
+                if content:
+                    yield content
+        except Exception as e:
+            logger.error(f"Ollama streaming error: {e}")
+            raise
 
 
 class OpenAILLM(AbstractLLM):
@@ -83,11 +185,16 @@ class OpenAILLM(AbstractLLM):
         if not api_key:
             raise ValueError("OpenAI API key is required for OpenAI LLM")
         
-        self.client = OpenAI(api_key=api_key)
+        self._connection_stats = ConnectionStats()
+        self.client = OpenAI(
+            api_key=api_key,
+            timeout=_http_timeout(),
+            http_client=httpx.Client(**_http_client_options(self._connection_stats))
+        )
         logger.info(f"OpenAI LLM initialized with model: {self.model_name}")
     
-    def generate(self, prompt: str, context: str) -> str:
-        """Generate answer using OpenAI API"""
+    def _build_messages(self, prompt: str, context: str) -> List[Dict]:
+        """Build chat messages with RAG instructions"""
         
         # Construct system message with RAG instructions
         system_message = """You are a helpful assistant that answers questions based ONLY on the provided context.
@@ -107,13 +214,17 @@ Question: {prompt}
 
 Please answer the question using ONLY the context above. Include citations [1], [2], etc."""
         
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ]
+    
+    def generate(self, prompt: str, context: str) -> str:
+        """Generate answer using OpenAI API"""
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=self._build_messages(prompt, context),
                 temperature=0.3,  # Lower temperature for more factual responses
                 max_tokens=1000
             )
@@ -121,6 +232,23 @@ Please answer the question using ONLY the context above. Include citations [1],
         except Exception as e:
             logger.error(f"OpenAI generation error: {e}")
             raise
+    
+    def generate_stream(self, prompt: str, context: str) -> Iterator[str]:
+        """Stream answer tokens from OpenAI API"""
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt, context),
+                temperature=0.3,
+                max_tokens=1000,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"OpenAI streaming error: {e}")
+            raise
 
 
 class GroqLLM(AbstractLLM):
@@ -133,11 +261,16 @@ class GroqLLM(AbstractLLM):
         if not api_key:
             raise ValueError("Groq API key is required for Groq LLM")
         
-        self.client = Groq(api_key=api_key)
+        self._connection_stats = ConnectionStats()
+        self.client = Groq(
+            api_key=api_key,
+            timeout=_http_timeout(),
+            http_client=httpx.Client(**_http_client_options(self._connection_stats))
+        )
         logger.info(f"Groq LLM initialized with model: {self.model_name}")
     
-    def generate(self, prompt: str, context: str) -> str:
-        """Generate answer using Groq API"""
+    def _build_messages(self, prompt: str, context: str) -> List[Dict]:
+        """Build chat messages with RAG instructions"""
         
         # Construct system message with RAG instructions
         system_message = """You are a helpful assistant that answers questions based ONLY on the provided context.
@@ -157,13 +290,17 @@ Question: {prompt}
 
 Please answer the question using ONLY the context above. Include citations [1], [2], etc."""
         
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ]
+    
+    def generate(self, prompt: str, context: str) -> str:
+        """Generate answer using Groq API"""
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=self._build_messages(prompt, context),
                 temperature=0.3,  # Lower temperature for more factual responses
                 max_tokens=2000  # Groq supports longer outputs
             )
@@ -171,6 +308,41 @@ Please answer the question using ONLY the context above. Include citations [1],
         except Exception as e:
             logger.error(f"Groq generation error: {e}")
             raise
+    
+    def generate_stream(self, prompt: str, context: str) -> Iterator[str]:
+        """Stream answer tokens from Groq API"""
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt, context),
+                temperature=0.3,
+                max_tokens=2000,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"Groq streaming error: {e}")
+            raise
+
+
+# Long-lived LLM clients keyed by (provider, model, base_url), so every
+# request reuses the same keep-alive connection pool
+_llm_registry = InstanceRegistry(name="llms", on_evict=lambda llm: llm.close())
+
+
+def close_llms():
+    """Close all LLM clients (application shutdown)"""
+    _llm_registry.clear()
+
+
+def llm_connection_stats() -> Dict[str, Dict]:
+    """Connection reuse counters per live LLM client"""
+    return {
+        "/".join(part for part in key if part): llm.connection_stats()
+        for key, llm in _llm_registry.instances()
+    }
 
 
 # Factory function
@@ -178,6 +350,9 @@ def get_llm(provider: str = None) -> AbstractLLM:
     """
     Get LLM instance based on provider
     
+    Instances come from a registry, so each (provider, model, base_url) keeps
+    one client and its HTTP connections across requests.
+    
     Args:
         provider: "ollama", "openai", or "groq". If None, uses settings.llm_provider
     
@@ -187,10 +362,15 @@ def get_llm(provider: str = None) -> AbstractLLM:
     provider = provider or settings.llm_provider
     
     if provider == "ollama":
-        return OllamaLLM()
+        model_name, base_url = settings.ollama_model, settings.ollama_base_url
+        factory = lambda: OllamaLLM(model_name=model_name, base_url=base_url)
     elif provider == "openai":
-        return OpenAILLM()
+        model_name, base_url = settings.openai_model, None  # SDK default endpoint
+        factory = lambda: OpenAILLM(model_name=model_name)
     elif provider == "groq":
-        return GroqLLM()
+        model_name, base_url = settings.groq_model, None
+        factory = lambda: GroqLLM(model_name=model_name)
     else:
         raise ValueError(f"Unknown LLM provider: {provider}. Choose from: ollama, openai, groq")
+    
+    return _llm_registry.get((provider, model_name, base_url), factory)
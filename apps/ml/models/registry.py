@@ -0,0 +1,154 @@
+"""
+Registry of warm, long-lived model instances
+
+Loading a SentenceTransformer (or building an API client) is expensive, so
+instances are created once per key and shared by every request that asks for
+the same provider/model.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    """Registry slot: the instance plus its own init lock"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.instance: Any = None
+        self.last_used = time.monotonic()
+
+
+class InstanceRegistry:
+    """
+    Thread-safe keyed registry with lazy init and optional LRU/idle eviction
+    
+    Each key gets its own lock, so two concurrent first requests for the same
+    model load it once, while loading one model never blocks requests that
+    use another, already warm model.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        max_instances: int = 0,
+        idle_ttl_seconds: float = 0,
+        on_evict: Optional[Callable[[Any], None]] = None
+    ):
+        """
+        Args:
+            name: Registry name used in logs
+            max_instances: Keep at most this many instances (0 = unlimited)
+            idle_ttl_seconds: Drop instances unused for this long (0 = never)
+            on_evict: Optional cleanup callback for evicted instances
+        """
+        self.name = name
+        self.max_instances = max_instances
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pinned: set = set()
+    
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Return the instance for key, creating it with factory on first use
+        
+        Args:
+            key: Hashable key, e.g. (provider, model_name)
+            factory: Zero-argument callable that builds the instance
+        
+        Returns:
+            Shared instance for key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry.last_used = time.monotonic()
+        
+        if entry.instance is None:
+            with entry.lock:
+                # Re-check: another thread may have finished loading meanwhile
+                if entry.instance is None:
+                    logger.info(f"[{self.name}] Creating instance for {key}")
+                    try:
+                        entry.instance = factory()
+                    except Exception:
+                        with self._lock:
+                            if self._entries.get(key) is entry:
+                                del self._entries[key]
+                        raise
+        
+        self._evict(keep=key)
+        return entry.instance
+    
+    def pin(self, key: Hashable):
+        """Never evict key (used for the default provider)"""
+        with self._lock:
+            self._pinned.add(key)
+    
+    def _evict(self, keep: Hashable = None):
+        """Drop idle instances and the least recently used over the limit"""
+        evicted = []
+        now = time.monotonic()
+        
+        with self._lock:
+            candidates = [
+                k for k, e in self._entries.items()
+                if k != keep and k not in self._pinned and e.instance is not None
+            ]
+            
+            if self.idle_ttl_seconds:
+                for k in candidates:
+                    if now - self._entries[k].last_used > self.idle_ttl_seconds:
+                        evicted.append((k, self._entries.pop(k)))
+                candidates = [k for k in candidates if k in self._entries]
+            
+            if self.max_instances:
+                # OrderedDict keeps LRU order, oldest first
+                while len(self._entries) > self.max_instances and candidates:
+                    k = candidates.pop(0)
+                    evicted.append((k, self._entries.pop(k)))
+        
+        for key, entry in evicted:
+            logger.info(f"[{self.name}] Evicting instance for {key}")
+            if self.on_evict:
+                try:
+                    self.on_evict(entry.instance)
+                except Exception as e:
+                    logger.warning(f"[{self.name}] Eviction cleanup failed for {key}: {e}")
+    
+    def clear(self):
+        """Drop all instances (e.g. on shutdown)"""
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        
+        for key, entry in entries:
+            if self.on_evict and entry.instance is not None:
+                try:
+                    self.on_evict(entry.instance)
+                except Exception as e:
+                    logger.warning(f"[{self.name}] Cleanup failed for {key}: {e}")
+    
+    def instances(self) -> List[Tuple[Hashable, Any]]:
+        """(key, instance) pairs of everything currently loaded"""
+        with self._lock:
+            return [(k, e.instance) for k, e in self._entries.items() if e.instance is not None]
+    
+    def stats(self) -> Dict:
+        """Loaded keys, for debugging"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "loaded": [str(k) for k, e in self._entries.items() if e.instance is not None],
+                "max_instances": self.max_instances,
+                "idle_ttl_seconds": self.idle_ttl_seconds
+            }
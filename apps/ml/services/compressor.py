@@ -0,0 +1,163 @@
+"""
+Extractive compression of retrieved chunks before generation
+
+Most of a relevant chunk is still filler for a given question, and
+generation time (on Ollama especially) grows with prompt length. The chunks
+are split into sentences, all sentences are scored against the query in one
+matrix product, and only the best ones (plus their neighbours, for
+readability) are kept until a token target is met. Each chunk keeps its own
+kept sentences, so citation [N] still points at the chunk they came from.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, List
+import hashlib
+import logging
+import math
+import time
+
+import numpy as np
+
+from config import settings
+from models.embeddings import get_embedder
+from utils.caching import LRUCache, query_embedding_cache
+from utils.tokens import get_token_counter, split_sentences
+
+logger = logging.getLogger(__name__)
+
+# Marks sentences left out between two kept ones
+GAP_MARKER = " ... "
+
+
+class ContextCompressor:
+    """Keep the query-relevant sentences of each chunk"""
+    
+    def __init__(self):
+        # Sentences recur across queries (same chunks retrieved again)
+        self.sentence_cache = LRUCache(max_size=settings.context_compression_cache_size)
+    
+    def _embed(self, embedder, provider: str, query: str, sentences: List[str]) -> np.ndarray:
+        """
+        Unit-length embeddings: the query in row 0, then one row per sentence
+        
+        Cache misses (the query included) are embedded in one batch.
+        """
+        keys = [
+            (embedder.model_name, hashlib.md5(sentence.encode("utf-8")).hexdigest())
+            for sentence in sentences
+        ]
+        vectors = [self.sentence_cache.get(key) for key in keys]
+        query_vector = query_embedding_cache.get(provider, embedder.model_name, query)
+        
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        texts = [sentences[i] for i in missing]
+        if query_vector is None:
+            texts.append(query)
+        if texts:
+            embedded = embedder.embed_batch(texts)
+            if query_vector is None:
+                query_vector = embedded.pop()
+                query_embedding_cache.set(provider, embedder.model_name, query, query_vector)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+                self.sentence_cache.set(keys[i], vectors[i])
+        
+        matrix = np.vstack([np.asarray(query_vector, dtype=np.float32)] + vectors)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+    
+    def compress(self, query: str, chunks: List[Dict], llm_provider: str = None, trace: Dict = None) -> List[Dict]:
+        """
+        Shrink chunks to their most query-relevant sentences
+        
+        Sentences are taken best first, each with `context_compression_neighbors`
+        sentences on either side, until the kept text reaches the token target:
+        `context_compression_target_tokens`, or else `context_compression_ratio`
+        of the original tokens.
+        
+        Args:
+            query: User question
+            chunks: Chunks in prompt order
+            llm_provider: Provider whose tokenizer counts the target
+            trace: Optional dict; receives compression stats under "context"
+        
+        Returns:
+            Chunks in the same order with shortened text; chunks without any
+            kept sentence are dropped. Shortened chunks have compressed=True.
+        """
+        started = time.perf_counter()
+        counter = get_token_counter(llm_provider)
+        
+        sentences = []  # (chunk position, sentence position, text)
+        for position, chunk in enumerate(chunks):
+            for number, sentence in enumerate(split_sentences(chunk["text"])):
+                sentences.append((position, number, sentence))
+        if not sentences:
+            return chunks
+        
+        tokens = [counter.count(text) for _, _, text in sentences]
+        tokens_before = sum(tokens)
+        target = settings.context_compression_target_tokens or math.ceil(
+            tokens_before * settings.context_compression_ratio
+        )
+        if tokens_before <= target:
+            return chunks
+        
+        provider = settings.context_compression_embedding_provider
+        embedder = get_embedder(provider)
+        matrix = self._embed(embedder, provider, query, [text for _, _, text in sentences])
+        scores = matrix[1:] @ matrix[0]
+        
+        row_of = {(position, number): row for row, (position, number, _) in enumerate(sentences)}
+        neighbors = settings.context_compression_neighbors
+        kept = set()
+        tokens_after = 0
+        for row in np.argsort(-scores):
+            if tokens_after >= target:
+                break
+            position, number, _ = sentences[row]
+            for offset in range(-neighbors, neighbors + 1):
+                neighbor = row_of.get((position, number + offset))
+                if neighbor is not None and neighbor not in kept:
+                    kept.add(neighbor)
+                    tokens_after += tokens[neighbor]
+        
+        kept_by_chunk = defaultdict(list)
+        for row in sorted(kept):
+            kept_by_chunk[sentences[row][0]].append(row)
+        totals = Counter(position for position, _, _ in sentences)
+        
+        compressed = []
+        for position, chunk in enumerate(chunks):
+            rows = kept_by_chunk.get(position)
+            if not rows:
+                continue
+            if len(rows) < totals[position]:
+                parts = [sentences[rows[0]][2]]
+                for previous, row in zip(rows, rows[1:]):
+                    gap = sentences[row][1] - sentences[previous][1] > 1
+                    parts.append(GAP_MARKER if gap else " ")
+                    parts.append(sentences[row][2])
+                chunk = dict(chunk, text="".join(parts), compressed=True)
+            compressed.append(chunk)
+        
+        ratio = tokens_after / tokens_before
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            f"Compressed context to {ratio:.0%} ({tokens_before} -> {tokens_after} tokens, "
+            f"{len(kept)}/{len(sentences)} sentences) in {elapsed_ms} ms"
+        )
+        if trace is not None:
+            trace.setdefault("context", {})["compression"] = {
+                "tokens_before": tokens_before,
+                "tokens_after": tokens_after,
+                "ratio": round(ratio, 3),
+                "sentences_kept": len(kept),
+                "sentences_total": len(sentences),
+                "chunks_dropped": len(chunks) - len(compressed),
+                "ms": elapsed_ms
+            }
+        return compressed
+
+
+# Global instance
+context_compressor = ContextCompressor()
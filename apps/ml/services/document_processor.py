@@ -1,14 +1,18 @@
 """
 Document processing service: upload, chunking, embedding
 """
-from typing import Dict, List
+from typing import Callable, Dict, List, Tuple
 import logging
 from pathlib import Path
+import queue
+import threading
 import time
 
 from models.embeddings import get_embedder
 from utils.chunking import text_chunker
+from utils.caching import get_embedding_cache, answer_cache
 from services.vector_store import get_vector_store
+from services.lexical_index import lexical_index
 from database import postgres
 from config import settings
 
@@ -29,14 +33,17 @@ class DocumentProcessor:
         if self.vector_store is None:
             self.vector_store = get_vector_store()
     
-    async def process_document(
+    def create_document(
         self,
         file_content: bytes,
         filename: str,
         embedding_provider: str = None
-    ) -> Dict:
+    ) -> str:
         """
-        Process a document: chunk, embed, store
+        Validate an upload, register it as pending and spool it to disk
+        
+        The spooled copy lets a worker (or a restarted service) ingest the
+        document later without the original HTTP request.
         
         Args:
             file_content: Raw file bytes
@@ -44,12 +51,8 @@ class DocumentProcessor:
             embedding_provider: Override default embedding provider
             
         Returns:
-            Processing result with document ID and stats
+            Document ID (also used as the ingestion job ID)
         """
-        self._ensure_initialized()
-        
-        start_time = time.time()
-        
         # Determine file type
         file_ext = Path(filename).suffix.lower()
         if file_ext not in ['.txt', '.md']:
@@ -63,53 +66,94 @@ class DocumentProcessor:
         
         file_size = len(file_content)
         
-        logger.info(f"Processing document: {filename} ({file_size} bytes)")
-        
         # Insert document metadata
         doc_id = postgres.insert_document(
             filename=filename,
             file_type=file_ext.replace('.', ''),
             file_size=file_size,
-            metadata={"char_count": len(text)}
+            metadata={
+                "char_count": len(text),
+                "embedding_provider": embedding_provider or settings.embedding_provider
+            },
+            status="pending"
         )
         
+        spool_path = self._spool_path(doc_id)
+        spool_path.parent.mkdir(parents=True, exist_ok=True)
+        spool_path.write_bytes(file_content)
+        
+        logger.info(f"Registered document: {filename} ({file_size} bytes) as {doc_id}")
+        return doc_id
+    
+    def ingest_document(
+        self,
+        doc_id: str,
+        progress: Callable[[Dict], None] = None
+    ) -> Dict:
+        """
+        Ingest a registered document: chunk, embed, store
+        
+        Safe to call again after a crash: chunks left over from an earlier
+        partial run are removed first.
+        
+        Args:
+            doc_id: Document ID returned by create_document
+            progress: Optional callback receiving progress counters
+            
+        Returns:
+            Processing result with document ID and stats
+        """
+        self._ensure_initialized()
+        
+        start_time = time.time()
+        progress = progress or (lambda update: None)
+        
+        document = self.get_document(doc_id)
+        filename = document["filename"]
+        embedding_provider = (document.get("metadata") or {}).get("embedding_provider")
+        
+        # Remove leftovers of an interrupted earlier attempt, even if it
+        # cannot be retried below (a failure here leaves it "processing")
+        if document["status"] == "processing":
+            logger.info(f"Resuming document {doc_id}: clearing partial chunks")
+            self.vector_store.delete_by_document(doc_id)
+            lexical_index.delete_by_document(doc_id)
+            postgres.delete_document_chunks(doc_id)
+        
+        spool_path = self._spool_path(doc_id)
+        if not spool_path.exists():
+            postgres.update_document_status(doc_id, "failed")
+            raise ValueError(f"Upload data for document {doc_id} is missing")
+        text = spool_path.read_bytes().decode('utf-8')
+        
+        logger.info(f"Processing document: {filename} ({doc_id})")
+        postgres.update_document_status(doc_id, "processing")
+        
         try:
             # Chunk the text
             chunks = text_chunker.chunk_text(text, document_name=filename)
             logger.info(f"Created {len(chunks)} chunks")
+            progress({"chunks_total": len(chunks), "chunks_embedded": 0, "chunks_stored": 0})
             
-            # Generate embeddings
             if embedding_provider:
                 embedder = get_embedder(embedding_provider)
             else:
                 embedder = self.embedder
             
-            chunk_texts = [chunk["text"] for chunk in chunks]
-            embeddings = embedder.embed_batch(chunk_texts)
-            logger.info(f"Generated {len(embeddings)} embeddings")
-            
-            # Store in Weaviate
-            weaviate_ids = self.vector_store.add_chunks(
-                chunks=chunks,
-                embeddings=embeddings,
-                document_id=doc_id,
-                document_name=filename
+            # Embed and store in overlapping batches
+            reused = self._run_pipeline(
+                doc_id,
+                filename,
+                chunks,
+                embedder,
+                provider=embedding_provider or settings.embedding_provider,
+                progress=progress
             )
+            logger.info(f"Stored {len(chunks)} chunks ({reused} embeddings reused from cache)")
             
-            # Store chunk references in PostgreSQL
-            for chunk, weaviate_id in zip(chunks, weaviate_ids):
-                token_count = text_chunker.estimate_tokens(chunk["text"])
-                postgres.insert_document_chunk(
-                    doc_id=doc_id,
-                    chunk_index=chunk["index"],
-                    weaviate_id=weaviate_id,
-                    chunk_text=chunk["text"],
-                    token_count=token_count,
-                    metadata={"hash": chunk["hash"]}
-                )
-            
-            # Update document status
-            postgres.update_document_status(doc_id, "completed")
+            # Corpus changed: cached answers may now be incomplete
+            answer_cache.invalidate()
+            spool_path.unlink(missing_ok=True)
             
             processing_time = time.time() - start_time
             
@@ -117,6 +161,7 @@ class DocumentProcessor:
                 "document_id": doc_id,
                 "filename": filename,
                 "chunk_count": len(chunks),
+                "embeddings_reused": reused,
                 "processing_time_seconds": round(processing_time, 2),
                 "status": "completed"
             }
@@ -127,8 +172,232 @@ class DocumentProcessor:
         except Exception as e:
             logger.error(f"Error processing document: {e}")
             postgres.update_document_status(doc_id, "failed")
+            self._discard_partial_chunks(doc_id)
+            # A failed document is not retried; don't keep its upload around
+            spool_path.unlink(missing_ok=True)
+            answer_cache.invalidate()
             raise
     
+    def _run_pipeline(
+        self,
+        doc_id: str,
+        filename: str,
+        chunks: List[Dict],
+        embedder,
+        provider: str,
+        progress: Callable[[Dict], None]
+    ) -> int:
+        """
+        Embed and store chunks in fixed-size batches with overlapping stages
+        
+        This thread embeds batch N+1 while a writer thread stores batch N in
+        the vector store and PostgreSQL. The hand-off queue is bounded, so at
+        most `ingestion_queue_depth` embedded batches wait in memory no matter
+        how large the document is. The last batch marks the document
+        completed in the same transaction as its chunk rows.
+        
+        Returns:
+            Number of embeddings reused from the cache
+        """
+        batch_size = settings.ingestion_batch_size
+        batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+        if not batches:
+            postgres.update_document_status(doc_id, "completed")
+            return 0
+        
+        handoff = queue.Queue(maxsize=settings.ingestion_queue_depth)
+        writer_errors = []
+        stored = [0]
+        
+        def writer():
+            while True:
+                item = handoff.get()
+                if item is None or writer_errors:
+                    return
+                batch, embeddings, is_last = item
+                try:
+                    self.store_chunks(
+                        doc_id,
+                        filename,
+                        batch,
+                        embeddings,
+                        status="completed" if is_last else None
+                    )
+                    stored[0] += len(batch)
+                    progress({"chunks_stored": stored[0]})
+                except Exception as e:
+                    writer_errors.append(e)
+                    return
+        
+        writer_thread = threading.Thread(target=writer, name=f"ingest-writer-{doc_id[:8]}", daemon=True)
+        writer_thread.start()
+        
+        embedded = 0
+        reused = 0
+        try:
+            for number, batch in enumerate(batches, start=1):
+                if writer_errors:
+                    break
+                embeddings, batch_reused = self.embed_chunks(batch, embedder, provider)
+                embedded += len(batch)
+                reused += batch_reused
+                progress({"chunks_embedded": embedded, "embeddings_reused": reused})
+                
+                # Blocks while the writer is `ingestion_queue_depth` batches behind
+                item = (batch, embeddings, number == len(batches))
+                while not writer_errors:
+                    try:
+                        handoff.put(item, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            # Wake the writer even if the queue is full of unwritten batches
+            while writer_thread.is_alive():
+                try:
+                    handoff.put(None, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            writer_thread.join()
+        
+        if writer_errors:
+            raise writer_errors[0]
+        return reused
+    
+    def _discard_partial_chunks(self, doc_id: str):
+        """Best-effort removal of chunks stored before a failure"""
+        try:
+            self.vector_store.delete_by_document(doc_id)
+            lexical_index.delete_by_document(doc_id)
+            postgres.delete_document_chunks(doc_id)
+        except Exception as e:
+            logger.warning(f"Could not remove partial chunks of {doc_id}: {e}")
+    
+    def process_document(
+        self,
+        file_content: bytes,
+        filename: str,
+        embedding_provider: str = None
+    ) -> Dict:
+        """
+        Process a document synchronously: register, then ingest
+        
+        Args:
+            file_content: Raw file bytes
+            filename: Original filename
+            embedding_provider: Override default embedding provider
+            
+        Returns:
+            Processing result with document ID and stats
+        """
+        doc_id = self.create_document(file_content, filename, embedding_provider)
+        return self.ingest_document(doc_id)
+    
+    @staticmethod
+    def _spool_path(doc_id: str) -> Path:
+        """Where the raw upload waits until it has been ingested"""
+        return Path(settings.ingestion_spool_dir) / doc_id
+    
+    def store_chunks(
+        self,
+        doc_id: str,
+        filename: str,
+        chunks: List[Dict],
+        embeddings: List[List[float]],
+        status: str = None,
+        update_lexical: bool = True
+    ) -> List[str]:
+        """
+        Write embedded chunks to the vector store, PostgreSQL and the lexical index
+        
+        Args:
+            doc_id: Parent document ID
+            filename: Parent document name
+            chunks: Chunk dicts from TextChunker
+            embeddings: One vector per chunk
+            status: Optional document status to set with the chunk rows
+            update_lexical: Index the chunks in this process's lexical index.
+                Processes that never search (bulk_ingest.py) pass False and
+                skip loading it; the server picks the chunks up from PostgreSQL.
+            
+        Returns:
+            Vector store IDs of the chunks
+        """
+        self._ensure_initialized()
+        
+        weaviate_ids = self.vector_store.add_chunks(
+            chunks=chunks,
+            embeddings=embeddings,
+            document_id=doc_id,
+            document_name=filename
+        )
+        postgres.insert_document_chunks(
+            doc_id,
+            [
+                {
+                    "chunk_index": chunk["index"],
+                    "weaviate_id": weaviate_id,
+                    "chunk_text": chunk["text"],
+                    "token_count": text_chunker.estimate_tokens(chunk["text"]),
+                    "metadata": {"hash": chunk["hash"]}
+                }
+                for chunk, weaviate_id in zip(chunks, weaviate_ids)
+            ],
+            status=status
+        )
+        if update_lexical and settings.hybrid_search_enabled:
+            lexical_index.add_chunks(chunks, weaviate_ids, doc_id, filename)
+        return weaviate_ids
+    
+    @staticmethod
+    def embed_chunks(chunks: List[Dict], embedder, provider: str) -> Tuple[List[List[float]], int]:
+        """
+        Embed chunks, reusing cached vectors for chunk hashes seen before
+        
+        Returns:
+            Tuple of (embeddings in chunk order, number reused from cache)
+        """
+        # With full-dimension rescoring the cache keeps full vectors (the
+        # retriever rescores from it) and the index gets truncated ones
+        full = embedder.rescores_full_dimension()
+        dimension = embedder.get_full_dimension() if full else embedder.get_dimension()
+        cache = get_embedding_cache(provider, embedder.model_name, dimension)
+        hashes = [chunk["hash"] for chunk in chunks]
+        cached = cache.get_many(hashes) if cache else {}
+        
+        # Embed each unseen text once, even if it repeats within the document
+        missing = list(dict.fromkeys(h for h in hashes if h not in cached))
+        if missing:
+            text_by_hash = {chunk["hash"]: chunk["text"] for chunk in chunks}
+            texts = [text_by_hash[h] for h in missing]
+            new_embeddings = embedder.embed_batch_full(texts) if full else embedder.embed_batch(texts)
+            if cache:
+                cache.put_many(missing, new_embeddings)
+            computed = dict(zip(missing, new_embeddings))
+        else:
+            computed = {}
+        
+        embeddings = []
+        for h in hashes:
+            if h in cached:
+                embeddings.append(cached[h].tolist())
+            else:
+                embeddings.append(computed[h])
+        if full:
+            embeddings = embedder.truncate(embeddings)
+        
+        reused = sum(1 for h in hashes if h in cached)
+        return embeddings, reused
+    
+    def delete_document(self, doc_id: str):
+        """Delete a document with its chunks from the vector store and PostgreSQL"""
+        self._ensure_initialized()
+        self.vector_store.delete_by_document(doc_id)
+        lexical_index.delete_by_document(doc_id)
+        postgres.delete_document(doc_id)
+        answer_cache.invalidate()
+    
     def get_documents(self) -> List[Dict]:
         """Get all documents"""
         return postgres.get_documents()
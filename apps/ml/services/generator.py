@@ -1,18 +1,40 @@
 """
 Answer generation service with citations
 """
-from typing import Dict, List, Tuple
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
 import logging
 import re
 
+from config import settings
 from models.llm import get_llm
+from services.compressor import context_compressor
+from services.relevance_gate import NOT_FOUND_ANSWER, relevance_gate
+from utils.tokens import get_token_counter
 
 logger = logging.getLogger(__name__)
 
+# Shorter suffix/prefix matches between neighbours are treated as chance
+MIN_OVERLAP_CHARS = 16
+
+
+def _overlap_length(previous: str, following: str) -> int:
+    """Length of the longest suffix of previous that starts following"""
+    longest = min(len(previous), len(following), settings.chunk_overlap)
+    for length in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:length]):
+            return length
+    return 0
+
 
 class Generator:
     """Generate answers with citations"""
     
+    # Longest citation marker we expect while streaming, e.g. "[999]"
+    MAX_MARKER_LENGTH = 6
+    # Tokens for a chunk's "[N] " prefix and separator in the context
+    MARKER_TOKENS = 4
+    
     def __init__(self):
         self.llm = None
     
@@ -25,7 +47,9 @@ class Generator:
         self,
         query: str,
         chunks: List[Dict],
-        llm_provider: str = None
+        llm_provider: str = None,
+        trace: Dict = None,
+        embedding_provider: str = None
     ) -> Dict:
         """
         Generate answer from query and retrieved chunks
@@ -34,20 +58,24 @@ class Generator:
             query: User question
             chunks: Retrieved chunks with metadata
             llm_provider: Override default LLM provider
+            trace: Optional dict; receives context packing stats
+            embedding_provider: Provider the chunks were retrieved with
+                (selects the relevance gate threshold)
             
         Returns:
             Dictionary with answer, citations, and metadata
         """
         self._ensure_initialized()
         
-        if not chunks:
+        if not chunks or self._relevance_bypass(chunks, embedding_provider, trace):
             return {
-                "answer": "Not found in sources",
+                "answer": NOT_FOUND_ANSWER,
                 "citations": [],
                 "context_used": False
             }
         
-        # Format context with citations
+        # Merge neighbours, compress and fit the token budget, then format with citations
+        chunks = self._assemble_context(query, chunks, llm_provider, trace)
         context, citation_map = self._format_context(chunks)
         
         # Generate answer
@@ -72,6 +100,266 @@ class Generator:
         logger.info(f"Generated answer with {len(citations)} citations")
         return result
     
+    def stream_answer(
+        self,
+        query: str,
+        chunks: List[Dict],
+        llm_provider: str = None,
+        trace: Dict = None,
+        embedding_provider: str = None
+    ) -> Iterator[Dict]:
+        """
+        Stream answer generation as events
+        
+        Yields, in order:
+            {"event": "sources", "data": [...]}   all chunks offered as context
+            {"event": "token", "data": "..."}     text deltas from the LLM
+            {"event": "citation", "data": {...}}  first time each [N] appears
+            {"event": "result", "data": {...}}    same shape as generate_answer
+        """
+        self._ensure_initialized()
+        
+        if not chunks or self._relevance_bypass(chunks, embedding_provider, trace):
+            yield {"event": "sources", "data": []}
+            yield {"event": "token", "data": NOT_FOUND_ANSWER}
+            yield {"event": "result", "data": {
+                "answer": NOT_FOUND_ANSWER,
+                "citations": [],
+                "context_used": False
+            }}
+            return
+        
+        chunks = self._assemble_context(query, chunks, llm_provider, trace)
+        context, citation_map = self._format_context(chunks)
+        yield {"event": "sources", "data": list(citation_map.values())}
+        
+        if llm_provider:
+            llm = get_llm(llm_provider)
+        else:
+            llm = self.llm
+        
+        logger.info(f"Streaming answer for query: {query[:100]}...")
+        answer_text = ""
+        emitted = set()
+        
+        for delta in llm.generate_stream(prompt=query, context=context):
+            # Rescan a short tail so markers split across deltas are found
+            scan_from = max(0, len(answer_text) - self.MAX_MARKER_LENGTH)
+            answer_text += delta
+            yield {"event": "token", "data": delta}
+            
+            for citation in self._extract_citations(answer_text[scan_from:], citation_map):
+                if citation["number"] not in emitted:
+                    emitted.add(citation["number"])
+                    yield {"event": "citation", "data": citation}
+        
+        citations = self._extract_citations(answer_text, citation_map)
+        logger.info(f"Streamed answer with {len(citations)} citations")
+        
+        yield {"event": "result", "data": {
+            "answer": answer_text,
+            "citations": citations,
+            "context_used": len(chunks),
+            "chunks": chunks
+        }}
+    
+    def replay_answer(self, result: Dict) -> Iterator[Dict]:
+        """Emit a finished (e.g. cached) answer as stream_answer events"""
+        _, citation_map = self._format_context(result.get("chunks", []))
+        yield {"event": "sources", "data": list(citation_map.values())}
+        yield {"event": "token", "data": result["answer"]}
+        for citation in result["citations"]:
+            yield {"event": "citation", "data": citation}
+        yield {"event": "result", "data": result}
+    
+    @staticmethod
+    def _relevance_bypass(chunks: List[Dict], embedding_provider: str = None, trace: Dict = None) -> bool:
+        """
+        Whether the relevance gate answers without the LLM
+        
+        The decision goes into the trace even with the gate disabled: its
+        best_distance is what calibration learns thresholds from.
+        """
+        decision = relevance_gate.check(chunks, embedding_provider)
+        if not settings.relevance_gate_enabled:
+            decision["bypass"] = False
+        if trace is not None:
+            trace["relevance_gate"] = decision
+        if decision["bypass"]:
+            logger.info(
+                f"Relevance gate: best distance {decision['best_distance']} > "
+                f"{decision['max_distance']} ({decision['model']}), skipping the LLM"
+            )
+        return decision["bypass"]
+    
+    def _assemble_context(
+        self,
+        query: str,
+        chunks: List[Dict],
+        llm_provider: str = None,
+        trace: Dict = None
+    ) -> List[Dict]:
+        """Chunks as they go into the prompt: merged, compressed, within the token budget"""
+        if settings.merge_adjacent_chunks:
+            chunks = self._merge_adjacent(chunks, trace)
+        if settings.context_compression_enabled:
+            try:
+                chunks = context_compressor.compress(query, chunks, llm_provider, trace)
+            except Exception as e:
+                logger.error(f"Context compression failed, using full chunks: {e}")
+        return self._pack_context(chunks, llm_provider, trace)
+    
+    @staticmethod
+    def _merge_adjacent(chunks: List[Dict], trace: Dict = None) -> List[Dict]:
+        """
+        Merge consecutive chunks of one document into a single span
+        
+        Chunks i and i+1 of a document share up to chunk_overlap characters;
+        a span contains that text once and gets one citation number. Spans
+        take the rank (and score) of their best chunk.
+        
+        Returns:
+            Spans, best first; merged ones list their chunk_indices, the
+            offset of each member's text (span_offsets) and of the best
+            member's text (best_offset)
+        """
+        runs_by_document = defaultdict(list)
+        for rank, chunk in sorted(enumerate(chunks), key=lambda item: item[1]["chunk_index"]):
+            runs = runs_by_document[chunk["document_id"]]
+            if runs and runs[-1][-1][1]["chunk_index"] == chunk["chunk_index"] - 1:
+                runs[-1].append((rank, chunk))
+            else:
+                runs.append([(rank, chunk)])
+        
+        spans = []
+        removed_chars = 0
+        for runs in runs_by_document.values():
+            for run in runs:
+                best_rank, best = min(run, key=lambda item: item[0])
+                if len(run) == 1:
+                    spans.append((best_rank, best))
+                    continue
+                text = run[0][1]["text"]
+                offsets = [[run[0][1]["chunk_index"], 0]]
+                for _, chunk in run[1:]:
+                    overlap = _overlap_length(text, chunk["text"])
+                    removed_chars += overlap
+                    if overlap:
+                        offsets.append([chunk["chunk_index"], len(text) - overlap])
+                        text += chunk["text"][overlap:]
+                    else:
+                        text += "\n"
+                        offsets.append([chunk["chunk_index"], len(text)])
+                        text += chunk["text"]
+                span = dict(
+                    best,
+                    text=text,
+                    chunk_index=run[0][1]["chunk_index"],
+                    chunk_indices=[chunk["chunk_index"] for _, chunk in run],
+                    span_offsets=offsets,
+                    best_offset=dict(offsets)[best["chunk_index"]]
+                )
+                span.pop("chunk_hash", None)  # no longer the hash of this text
+                spans.append((best_rank, span))
+        
+        spans.sort(key=lambda item: item[0])
+        if trace is not None:
+            trace.setdefault("context", {}).update({
+                "chunks_merged": len(chunks) - len(spans),
+                "overlap_chars_removed": removed_chars
+            })
+        return [span for _, span in spans]
+    
+    def _pack_context(self, chunks: List[Dict], llm_provider: str = None, trace: Dict = None) -> List[Dict]:
+        """
+        Keep the best chunks that fit the provider's context token budget
+        
+        Chunks arrive best first and are taken in that order. The first one
+        that does not fit is cut at a sentence boundary (if any sentence
+        fits) and everything after it is dropped.
+        
+        Args:
+            chunks: Retrieved chunks, best first
+            llm_provider: Provider whose budget and tokenizer apply
+            trace: Optional dict; receives tokens used/dropped under "context"
+        
+        Returns:
+            Chunks to send to the LLM (a cut chunk has truncated=True)
+        """
+        provider = llm_provider or settings.llm_provider
+        budget = getattr(settings, f"{provider}_context_token_budget")
+        counter = get_token_counter(provider)
+        
+        packed = []
+        used = 0
+        dropped = 0
+        full = False
+        for chunk in chunks:
+            tokens = counter.count(chunk["text"]) + self.MARKER_TOKENS
+            if not full and (budget <= 0 or used + tokens <= budget):
+                packed.append(chunk)
+                used += tokens
+                continue
+            
+            if not full:
+                full = True
+                cut = self._cut_chunk(chunk, counter, budget - used - self.MARKER_TOKENS)
+                if cut is not None:
+                    kept = counter.count(cut["text"]) + self.MARKER_TOKENS
+                    packed.append(cut)
+                    used += kept
+                    dropped += tokens - kept
+                    continue
+            dropped += tokens
+        
+        if not packed:
+            # Over budget with one chunk still beats answering from nothing
+            logger.warning(f"Best chunk exceeds the {provider} context budget of {budget} tokens")
+            packed = chunks[:1]
+            used = counter.count(chunks[0]["text"]) + self.MARKER_TOKENS
+            dropped -= used
+        
+        if trace is not None:
+            trace.setdefault("context", {}).update({
+                "tokenizer": counter.name,
+                "budget": budget,
+                "tokens_used": used,
+                "tokens_dropped": dropped,
+                "chunks_used": len(packed),
+                "chunks_dropped": len(chunks) - len(packed),
+                "truncated": any(chunk.get("truncated") for chunk in packed)
+            })
+        return packed
+    
+    @staticmethod
+    def _cut_chunk(chunk: Dict, counter, max_tokens: int) -> Optional[Dict]:
+        """
+        Whole sentences of a chunk that fit in max_tokens, or None
+        
+        A merged span is cut from the start of its best member, not from
+        its own start, so the text its citation and score belong to is kept
+        rather than a weaker neighbour's. Compressed spans have no valid
+        offsets and are cut from the start.
+        """
+        offsets = None if chunk.get("compressed") else chunk.get("span_offsets")
+        start = chunk.get("best_offset", 0) if offsets else 0
+        text = counter.truncate_sentences(chunk["text"][start:], max_tokens)
+        if not text:
+            return None
+        cut = dict(chunk, text=text, truncated=True)
+        if offsets:
+            # Members whose text overlaps [start, end) of the span
+            end = start + len(text)
+            bounds = [offset for _, offset in offsets[1:]] + [len(chunk["text"])]
+            covered = [
+                index for (index, offset), bound in zip(offsets, bounds)
+                if offset < end and bound > start
+            ]
+            cut.update(chunk_index=covered[0], chunk_indices=covered)
+            cut.pop("span_offsets")
+            cut.pop("best_offset")
+        return cut
+    
     @staticmethod
     def _format_context(chunks: List[Dict]) -> Tuple[str, Dict]:
         """
@@ -91,6 +379,7 @@ class Generator:
                 "number": idx,
                 "document_name": chunk["document_name"],
                 "chunk_index": chunk["chunk_index"],
+                "chunk_indices": chunk.get("chunk_indices", [chunk["chunk_index"]]),
                 "text": chunk["text"][:200] + "..." if len(chunk["text"]) > 200 else chunk["text"],
                 "similarity_score": chunk["similarity_score"]
             }
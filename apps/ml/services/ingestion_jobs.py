@@ -0,0 +1,133 @@
+"""
+Background ingestion: upload returns immediately, workers do the heavy lifting
+
+A job is identified by its document ID. Job state lives in the existing
+documents.status column (pending -> processing -> completed/failed) and
+progress counters in documents.metadata, so jobs survive restarts: on startup
+every pending or interrupted document is queued again.
+"""
+from typing import Dict, Optional
+import logging
+import queue
+import threading
+
+from services.document_processor import document_processor
+from database import postgres
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueue:
+    """In-process job queue with a fixed pool of worker threads"""
+    
+    def __init__(self, workers: int = None):
+        self.workers = workers or settings.ingestion_workers
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._threads = []
+        self._queued = set()
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Start worker threads and re-queue unfinished jobs"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker,
+                name=f"ingestion-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} ingestion workers")
+        self.resume()
+    
+    def resume(self):
+        """
+        Queue documents left pending or processing by a previous run
+        
+        Documents written by bulk_ingest.py have no spooled upload and are
+        cleaned up by the next bulk run, which may be writing them right now.
+        """
+        try:
+            doc_ids = postgres.get_document_ids_by_status(
+                ["pending", "processing"], exclude_source="bulk_ingest"
+            )
+        except Exception as e:
+            logger.error(f"Could not load unfinished ingestion jobs: {e}")
+            return
+        for doc_id in doc_ids:
+            self.submit(doc_id)
+        if doc_ids:
+            logger.info(f"Resumed {len(doc_ids)} ingestion jobs")
+    
+    def submit(self, doc_id: str):
+        """Queue a registered document for ingestion (idempotent)"""
+        with self._lock:
+            if doc_id in self._queued:
+                return
+            self._queued.add(doc_id)
+        self._queue.put(doc_id)
+    
+    def stop(self):
+        """Let workers finish their current job and exit"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=30)
+        self._threads = []
+        logger.info("Ingestion workers stopped")
+    
+    def _worker(self):
+        """Process jobs until a stop sentinel arrives"""
+        while True:
+            doc_id = self._queue.get()
+            if doc_id is None:
+                return
+            try:
+                document_processor.ingest_document(
+                    doc_id,
+                    progress=lambda update, doc_id=doc_id: self._report(doc_id, update)
+                )
+            except Exception as e:
+                logger.error(f"Ingestion job {doc_id} failed: {e}")
+                self._report(doc_id, {"error": str(e)})
+            finally:
+                with self._lock:
+                    self._queued.discard(doc_id)
+    
+    @staticmethod
+    def _report(doc_id: str, update: Dict):
+        """Persist progress counters; never fail the job over bookkeeping"""
+        try:
+            postgres.update_document_metadata(doc_id, update)
+        except Exception as e:
+            logger.warning(f"Could not record progress for {doc_id}: {e}")
+    
+    def get_job(self, doc_id: str) -> Dict:
+        """
+        Get job status and progress
+        
+        Raises:
+            ValueError: If no such document exists
+        """
+        document = document_processor.get_document(doc_id)
+        metadata = document.get("metadata") or {}
+        return {
+            "job_id": doc_id,
+            "document_id": doc_id,
+            "filename": document["filename"],
+            "status": document["status"],
+            "progress": {
+                "chunks_total": metadata.get("chunks_total"),
+                "chunks_embedded": metadata.get("chunks_embedded", 0),
+                "chunks_stored": metadata.get("chunks_stored", 0),
+                "embeddings_reused": metadata.get("embeddings_reused", 0)
+            },
+            "error": metadata.get("error")
+        }
+
+
+# Global instance
+ingestion_queue = IngestionQueue()
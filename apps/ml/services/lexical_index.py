@@ -0,0 +1,246 @@
+"""
+In-memory BM25 index over chunk text (lexical leg of hybrid retrieval)
+
+Vector search is weak on exact tokens: identifiers, error codes, API names.
+This inverted index is loaded from PostgreSQL on first use and then kept
+current by DocumentProcessor as chunks are stored or deleted. Documents
+another process wrote (bulk_ingest.py) are picked up by comparing the
+documents table's fingerprint every `lexical_index_refresh_seconds`.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+
+from config import settings
+from database import postgres
+
+logger = logging.getLogger(__name__)
+
+# Words plus dotted/dashed/underscored compounds like get_vector_store,
+# text-embedding-3-small, HTTP/1.1 or os.path.join
+_TOKEN_PATTERN = re.compile(r"\w+(?:[.\-:/]\w+)*")
+_PART_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased tokens; compounds are kept whole and also split into parts
+    
+    "ERR_CONN_RESET" matches the exact code and each of its words.
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """Okapi BM25 over chunks, keyed by vector store ID"""
+    
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> {chunk id: tf}
+        self._chunks: Dict[str, Dict] = {}  # chunk id -> metadata + length
+        self._by_document: Dict[str, List[str]] = defaultdict(list)
+        self._total_length = 0
+        self._loaded = False
+        self._version = None  # postgres.get_corpus_version() the index reflects
+        self._document_versions: Dict[str, tuple] = {}  # completed doc -> (status, updated_at) read
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+    
+    def _ensure_loaded(self):
+        """Build the index from all stored chunks on first use"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            # Taken first: changes made during the load show up as a new version
+            self._version = postgres.get_corpus_version()
+            self._checked_at = time.monotonic()
+            self._document_versions = self._completed(postgres.get_document_versions(["completed"]))
+            self._add_rows(postgres.get_all_chunks())
+            self._loaded = True
+            logger.info(f"Lexical index loaded: {len(self._chunks)} chunks, {len(self._postings)} terms")
+    
+    def _add_rows(self, rows: List[Dict]):
+        """Index chunk rows from postgres.get_all_chunks"""
+        for row in rows:
+            self._add(row["weaviate_id"], {
+                "text": row["chunk_text"],
+                "document_id": row["document_id"],
+                "document_name": row["filename"],
+                "chunk_index": row["chunk_index"],
+                "chunk_hash": row["chunk_hash"]
+            })
+    
+    @staticmethod
+    def _completed(versions: Dict[str, tuple]) -> Dict[str, tuple]:
+        """Versions of the completed documents only"""
+        return {doc_id: version for doc_id, version in versions.items() if version[0] == "completed"}
+    
+    def _refresh(self):
+        """
+        Catch up with documents other processes stored or deleted
+        
+        Runs at most every `lexical_index_refresh_seconds`. A completed
+        document is (re-)read whole whenever its status or updated_at
+        differs from when it was last read, so one that was still being
+        ingested at that time is topped up. Documents being ingested are
+        left as they are (this process may be writing them); documents
+        neither completed nor processing are dropped.
+        """
+        interval = settings.lexical_index_refresh_seconds
+        if not interval or time.monotonic() - self._checked_at < interval:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            version = postgres.get_corpus_version()
+            if version == self._version:
+                return
+            versions = postgres.get_document_versions(["processing", "completed"])
+            completed = self._completed(versions)
+            with self._lock:
+                gone = [doc_id for doc_id in self._by_document if doc_id not in versions]
+                changed = [
+                    doc_id for doc_id, doc_version in completed.items()
+                    if self._document_versions.get(doc_id) != doc_version
+                ]
+                for doc_id in gone + changed:
+                    self._remove_document(doc_id)
+                if changed:
+                    self._add_rows(postgres.get_all_chunks(changed))
+                self._document_versions = completed
+                self._version = version
+        except Exception as e:
+            logger.warning(f"Could not refresh the lexical index: {e}")
+            return
+        if gone or changed:
+            logger.info(f"Lexical index refreshed: {len(self._chunks)} chunks")
+    
+    def _add(self, chunk_id: str, chunk: Dict):
+        """Index one chunk (idempotent: chunks loaded and added twice count once)"""
+        if chunk_id in self._chunks:
+            return
+        tokens = tokenize(chunk["text"])
+        term_counts = defaultdict(int)
+        for token in tokens:
+            term_counts[token] += 1
+        for term, count in term_counts.items():
+            self._postings[term][chunk_id] = count
+        self._chunks[chunk_id] = dict(chunk, length=len(tokens))
+        self._by_document[chunk["document_id"]].append(chunk_id)
+        self._total_length += len(tokens)
+    
+    def add_chunks(
+        self,
+        chunks: List[Dict],
+        chunk_ids: List[str],
+        document_id: str,
+        document_name: str
+    ):
+        """
+        Index newly stored chunks
+        
+        Args:
+            chunks: Chunk dicts from TextChunker
+            chunk_ids: Vector store IDs of the chunks
+            document_id: UUID of parent document
+            document_name: Name of parent document
+        """
+        self._ensure_loaded()
+        with self._lock:
+            for chunk, chunk_id in zip(chunks, chunk_ids):
+                self._add(chunk_id, {
+                    "text": chunk["text"],
+                    "document_id": document_id,
+                    "document_name": document_name,
+                    "chunk_index": chunk["index"],
+                    "chunk_hash": chunk["hash"]
+                })
+    
+    def delete_by_document(self, document_id: str):
+        """Remove all chunks of a document"""
+        if not self._loaded:
+            return  # loading later reads the current state from PostgreSQL
+        with self._lock:
+            self._remove_document(document_id)
+    
+    def _remove_document(self, document_id: str):
+        """Unindex a document's chunks (caller holds the lock)"""
+        for chunk_id in self._by_document.pop(document_id, []):
+            chunk = self._chunks.pop(chunk_id, None)
+            if chunk is None:
+                continue
+            self._total_length -= chunk["length"]
+            for term in set(tokenize(chunk["text"])):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+    
+    def search(self, query: str, top_k: int = 10, document_ids: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Rank chunks by BM25 score for the query terms
+        
+        Args:
+            query: User question
+            top_k: Number of results to return
+            document_ids: Optional scope; other chunks are never scored
+        
+        Returns:
+            Chunk results shaped like VectorStore.search, with bm25_score
+            instead of a vector distance
+        """
+        self._ensure_loaded()
+        self._refresh()
+        with self._lock:
+            total = len(self._chunks)
+            if total == 0:
+                return []
+            average_length = self._total_length / total
+            scope = None
+            if document_ids is not None:
+                scope = {chunk_id for doc_id in document_ids for chunk_id in self._by_document.get(doc_id, [])}
+            
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    if scope is not None and chunk_id not in scope:
+                        continue
+                    length_norm = 1 - self.b + self.b * self._chunks[chunk_id]["length"] / average_length
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+            
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            results = []
+            for chunk_id, score in best:
+                chunk = self._chunks[chunk_id]
+                results.append({
+                    "weaviate_id": chunk_id,
+                    "text": chunk["text"],
+                    "document_id": chunk["document_id"],
+                    "document_name": chunk["document_name"],
+                    "chunk_index": chunk["chunk_index"],
+                    "chunk_hash": chunk["chunk_hash"],
+                    "bm25_score": round(score, 4)
+                })
+            return results
+
+
+# Global instance
+lexical_index = LexicalIndex()
@@ -0,0 +1,608 @@
+"""
+Embedded, in-process vector store (alternative to Weaviate)
+
+For small and medium corpora this avoids a network hop per query and lets
+the service run without the Weaviate container. Same interface as
+VectorStore: add_chunks / search / delete_by_document / close.
+
+Storage (settings.local_vector_store_dir):
+    meta.json      dimension
+    vectors.f32    unit-length float32 rows, memory-mapped on startup
+    chunks.jsonl   one metadata record per row
+    codes.int8     optional int8 codes, one byte per dimension
+    codes.binary   optional sign bits, one bit per dimension
+    hnsw.bin       optional HNSW graph (hnswlib) for large N
+    lock           flock target serializing writers across processes
+
+The API server and bulk_ingest.py may share one store directory. Writes
+(appends, delete compaction, repair on open) hold an exclusive file lock and
+first pick up what other processes wrote. Searches notice a changed
+chunks.jsonl (size, mtime or inode) and read the appended rows, or reload
+everything after another process compacted the files.
+
+With settings.vector_quantization set, search is two-stage: a blocked scan
+over the compressed codes picks vector_rescore_limit candidates, which are
+then rescored exactly against the float32 rows. Only the codes need to stay
+hot in memory; the full vectors are read from the memory map on demand.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rows per block when scanning codes, bounds the temporary float32 buffer
+SCAN_BLOCK_ROWS = 65536
+
+# Rows are unit-length, so every component lies in [-1, 1]: one fixed scale
+# fits all vectors, needs no training and never clips later additions
+INT8_SCALE = 1 / 127
+
+# Set bits per byte value, for Hamming distance over packed sign bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency, only needed for large corpora
+    hnswlib = None
+
+
+class LocalVectorStore:
+    """Contiguous float32 matrix with vectorized top-k and optional HNSW"""
+    
+    def __init__(self, directory: str = None, quantization: str = None):
+        self.directory = Path(directory or settings.local_vector_store_dir)
+        self.quantization = quantization or settings.vector_quantization
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.directory / "meta.json"
+        self.vectors_path = self.directory / "vectors.f32"
+        self.chunks_path = self.directory / "chunks.jsonl"
+        self.hnsw_path = self.directory / "hnsw.bin"
+        self.codes_path = self.directory / f"codes.{self.quantization}"
+        self.lock_path = self.directory / "lock"
+        
+        self._lock = threading.RLock()
+        self._file_locked = False
+        self._reset()
+        with self._file_lock():
+            self._load()
+    
+    def _reset(self):
+        """Forget everything read from disk"""
+        self.dimension: Optional[int] = None
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._records: List[Dict] = []
+        self._document_ids = np.empty(0, dtype=object)
+        self._codes = None
+        self._hnsw = None
+        self._chunks_bytes = 0  # bytes of chunks.jsonl read so far
+        self._disk_state = None
+    
+    @contextmanager
+    def _file_lock(self):
+        """
+        Exclusive lock shared with other processes writing this store
+        
+        Re-entrant within this process (callers hold self._lock), e.g. a
+        reload triggered by _refresh inside add_chunks.
+        """
+        if self._file_locked:
+            yield
+            return
+        with open(self.lock_path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            self._file_locked = True
+            try:
+                yield
+            finally:
+                self._file_locked = False
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    
+    def _stat_chunks(self) -> Optional[tuple]:
+        """Identity of the chunks file as last written by any process"""
+        try:
+            stat = self.chunks_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    
+    def _read_meta(self) -> Dict:
+        """Read the dimension (another process may have set it)"""
+        if not self.meta_path.exists():
+            return {}
+        meta = json.loads(self.meta_path.read_text())
+        self.dimension = meta["dimension"]
+        return meta
+    
+    def _read_records(self) -> List[Dict]:
+        """Complete chunk lines after the ones already read"""
+        records = []
+        if not self.chunks_path.exists():
+            return records
+        with open(self.chunks_path, "rb") as f:
+            f.seek(self._chunks_bytes)
+            data = f.read()
+        # A line without its newline is still being written (or torn)
+        for line in data.split(b"\n")[:-1]:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # torn line from an interrupted append
+            self._chunks_bytes += len(line) + 1
+        return records
+    
+    def _load(self):
+        """Memory-map existing vectors and read chunk metadata (holds the file lock)"""
+        if "int8_scale" in self._read_meta():
+            # Written by an older version that trained per-dimension scales
+            # on the first batch: re-encode the codes with the fixed scale
+            logger.info("Re-encoding int8 codes with the fixed scale")
+            self.codes_path.with_name("codes.int8").unlink(missing_ok=True)
+            self._write_meta()
+        self._records = self._read_records()
+        
+        if self.dimension:
+            row_bytes = self.dimension * 4
+            self.vectors_path.touch(exist_ok=True)
+            vector_bytes = self.vectors_path.stat().st_size
+            rows = min(len(self._records), vector_bytes // row_bytes)
+            # An interrupted append leaves extra vector bytes or metadata lines;
+            # trim both files to their common prefix so later appends line up
+            if vector_bytes != rows * row_bytes:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(rows * row_bytes)
+            chunks_size = self.chunks_path.stat().st_size if self.chunks_path.exists() else 0
+            if len(self._records) != rows or self._chunks_bytes != chunks_size:
+                self._records = self._records[:rows]
+                with open(self.chunks_path, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in self._records)
+                self._chunks_bytes = self.chunks_path.stat().st_size
+            self._remap(rows)
+        
+        self._document_ids = np.array([r["document_id"] for r in self._records], dtype=object)
+        self._disk_state = self._stat_chunks()
+        self._load_codes()
+        self._load_hnsw()
+        logger.info(
+            f"Local vector store at {self.directory}: {len(self._records)} vectors "
+            f"(quantization: {self.quantization})"
+        )
+    
+    def _refresh(self):
+        """
+        Catch up with writes by other processes (call with self._lock held)
+        
+        Appends are read incrementally; a replaced or shrunk chunks file
+        (delete compaction elsewhere) means a full reload.
+        """
+        state = self._stat_chunks()
+        if state == self._disk_state:
+            return
+        previous = self._disk_state
+        if previous is None or state is None or state[0] != previous[0] or state[1] < previous[1]:
+            logger.info(f"Local vector store at {self.directory} changed on disk, reloading")
+            with self._file_lock():
+                self._reset()
+                self._load()
+            return
+        
+        if self.dimension is None:
+            self._read_meta()
+        # Vectors and codes are written before the chunk lines, so every
+        # complete line read here has its rows on disk
+        records = self._read_records()
+        self._disk_state = state
+        if not records:
+            return
+        start = len(self._records)
+        self._append_rows(records)
+        if self._hnsw is not None:
+            self._hnsw.resize_index(len(self._records))
+            self._hnsw.add_items(np.asarray(self._vectors[start:]), np.arange(start, len(self._records)))
+        elif self._hnsw_wanted():
+            self._build_hnsw(save=False)  # the writing process saves its own graph
+    
+    def _append_rows(self, records: List[Dict]):
+        """Extend the in-memory view by rows already on disk"""
+        self._records = self._records + records
+        self._document_ids = np.concatenate(
+            [self._document_ids, np.array([r["document_id"] for r in records], dtype=object)]
+        )
+        self._remap(len(self._records))
+        if self.quantization != "none":
+            self._remap_codes(len(self._records))
+    
+    def _remap(self, rows: int):
+        """Re-open the memory map after the vectors file grew or shrank"""
+        if rows == 0:
+            self._vectors = np.empty((0, self.dimension or 0), dtype=np.float32)
+            return
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension)
+        )
+    
+    def _write_meta(self):
+        """Persist the store dimension"""
+        self.meta_path.write_text(json.dumps({"dimension": self.dimension}))
+    
+    def _code_width(self) -> int:
+        """Bytes per row in the codes file"""
+        if self.quantization == "binary":
+            return (self.dimension + 7) // 8
+        return self.dimension
+    
+    def _encode(self, matrix: np.ndarray) -> np.ndarray:
+        """Compress unit-length float32 rows to codes"""
+        if self.quantization == "binary":
+            return np.packbits(matrix > 0, axis=1)
+        return np.clip(np.rint(matrix / INT8_SCALE), -127, 127).astype(np.int8)
+    
+    def _remap_codes(self, rows: int):
+        """Re-open the codes memory map"""
+        if rows == 0:
+            self._codes = None
+            return
+        dtype = np.int8 if self.quantization == "int8" else np.uint8
+        self._codes = np.memmap(
+            self.codes_path, dtype=dtype, mode="r", shape=(rows, self._code_width())
+        )
+    
+    def _load_codes(self):
+        """Map the codes file, (re)building it if missing or out of sync"""
+        if self.quantization == "none" or not self.dimension:
+            return
+        rows = len(self._records)
+        expected = rows * self._code_width()
+        if not self.codes_path.exists() or self.codes_path.stat().st_size != expected:
+            logger.info(f"Encoding {rows} vectors as {self.quantization} codes")
+            with open(self.codes_path, "wb") as f:
+                for start in range(0, rows, SCAN_BLOCK_ROWS):
+                    f.write(self._encode(np.asarray(self._vectors[start:start + SCAN_BLOCK_ROWS])).tobytes())
+        self._remap_codes(rows)
+    
+    def _hnsw_wanted(self) -> bool:
+        """
+        Use a graph only when hnswlib is installed and N is large
+        
+        Not with quantization: the graph keeps every float32 vector in RAM,
+        which is exactly what the compressed codes are meant to avoid.
+        """
+        threshold = settings.local_vector_store_hnsw_threshold
+        return (
+            hnswlib is not None
+            and self.quantization == "none"
+            and threshold > 0
+            and len(self._records) >= threshold
+        )
+    
+    def _load_hnsw(self):
+        """Load a persisted graph, or build one if the corpus is large enough"""
+        if not self._hnsw_wanted():
+            return
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        if self.hnsw_path.exists():
+            index.load_index(str(self.hnsw_path), max_elements=len(self._records))
+            if index.get_current_count() == len(self._records):
+                index.set_ef(settings.local_vector_store_hnsw_ef)
+                self._hnsw = index
+                return
+        self._build_hnsw()
+    
+    def _build_hnsw(self, save: bool = True):
+        """Build the graph over all rows (labels are row numbers)"""
+        rows = len(self._records)
+        logger.info(f"Building HNSW index over {rows} vectors")
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        index.init_index(max_elements=max(rows, 1), ef_construction=200, M=16)
+        if rows:
+            index.add_items(np.asarray(self._vectors), np.arange(rows))
+        index.set_ef(settings.local_vector_store_hnsw_ef)
+        if save:
+            index.save_index(str(self.hnsw_path))
+        self._hnsw = index
+    
+    def add_chunks(
+        self,
+        chunks: List[Dict],
+        embeddings: List[List[float]],
+        document_id: str,
+        document_name: str
+    ) -> List[str]:
+        """
+        Append chunks with embeddings
+        
+        Args:
+            chunks: List of chunk dictionaries from TextChunker
+            embeddings: List of embedding vectors
+            document_id: UUID of parent document
+            document_name: Name of parent document
+        
+        Returns:
+            List of chunk UUIDs
+        """
+        if len(chunks) != len(embeddings):
+            raise ValueError("Number of chunks and embeddings must match")
+        if not chunks:
+            return []
+        
+        matrix = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        
+        with self._lock, self._file_lock():
+            self._refresh()
+            self.check_dimension(matrix.shape[1])
+            if self.dimension is None:
+                self.dimension = matrix.shape[1]
+                self._write_meta()
+            
+            ids = [str(uuid.uuid4()) for _ in chunks]
+            records = [
+                {
+                    "id": chunk_id,
+                    "text": chunk["text"],
+                    "document_id": document_id,
+                    "document_name": document_name,
+                    "chunk_index": chunk["index"],
+                    "char_count": chunk["char_count"],
+                    "chunk_hash": chunk["hash"],
+                }
+                for chunk_id, chunk in zip(ids, chunks)
+            ]
+            
+            # Vectors first: a crash between the two writes only leaves
+            # unreferenced vector bytes, which _load ignores. Offsets follow
+            # the (refreshed) row count, which includes other processes' rows.
+            start = len(self._records)
+            self._truncate_to(start)
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            if self.quantization != "none":
+                with open(self.codes_path, "ab") as f:
+                    f.write(self._encode(matrix).tobytes())
+            lines = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+            with open(self.chunks_path, "ab") as f:
+                f.write(lines)
+            self._chunks_bytes += len(lines)
+            self._disk_state = self._stat_chunks()
+            
+            self._append_rows(records)
+            
+            if self._hnsw is not None:
+                self._hnsw.resize_index(len(self._records))
+                self._hnsw.add_items(matrix, np.arange(start, len(self._records)))
+                self._hnsw.save_index(str(self.hnsw_path))
+            elif self._hnsw_wanted():
+                self._build_hnsw()
+        
+        logger.info(f"Added {len(ids)} chunks to local vector store")
+        return ids
+    
+    def _truncate_to(self, rows: int):
+        """Drop bytes past the last complete chunk line (a crashed append)"""
+        if self.chunks_path.exists() and self.chunks_path.stat().st_size != self._chunks_bytes:
+            with open(self.chunks_path, "r+b") as f:
+                f.truncate(self._chunks_bytes)
+        if not self.dimension:
+            return
+        files = [(self.vectors_path, self.dimension * 4)]
+        if self.quantization != "none":
+            files.append((self.codes_path, self._code_width()))
+        for path, row_bytes in files:
+            if path.exists() and path.stat().st_size != rows * row_bytes:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_bytes)
+    
+    def check_dimension(self, dimension: int):
+        """
+        Ensure vectors of this size match the ones already stored
+        
+        Raises:
+            ValueError: If the store holds vectors of another size
+        """
+        if self.dimension is not None and dimension != self.dimension:
+            raise ValueError(
+                f"Embedding dimension {dimension} does not match store dimension {self.dimension}"
+            )
+    
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        document_id: Optional[str] = None,
+        include_vectors: bool = False,
+        document_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        Search for similar chunks (cosine distance, like the Weaviate default)
+        
+        Args:
+            query_embedding: Query vector
+            top_k: Number of results to return
+            document_id: Optional filter by document ID
+            include_vectors: Also return each chunk's stored (unit) vector
+            document_ids: Optional filter by any of several document IDs
+                (rows outside the scope are never scored)
+        
+        Returns:
+            List of chunk results with metadata and scores
+        """
+        query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+        if document_id:
+            document_ids = [document_id]
+        
+        # Snapshot under the lock; appends never move existing rows and
+        # deletes swap in new objects, so the scan itself can run unlocked
+        with self._lock:
+            self._refresh()
+            vectors = self._vectors
+            records = self._records
+            row_document_ids = self._document_ids
+            codes = self._codes
+            hnsw = self._hnsw
+            total = len(records)
+        
+        if total == 0:
+            return []
+        
+        if document_ids is None and hnsw is not None:
+            with self._lock:
+                labels, distances = hnsw.knn_query(query, k=min(top_k, total))
+            rows = labels[0]
+            similarities = 1.0 - distances[0]
+        else:
+            candidates = None
+            if document_ids is not None:
+                candidates = np.flatnonzero(np.isin(row_document_ids, list(document_ids)))
+                if len(candidates) == 0:
+                    return []
+            
+            if codes is not None:
+                rows, similarities = self._search_quantized(vectors, codes, query, top_k, candidates)
+            else:
+                if candidates is not None:
+                    scores = np.asarray(vectors[candidates]) @ query
+                else:
+                    scores = vectors @ query
+                rows, similarities = _top_k(scores, top_k)
+                if candidates is not None:
+                    rows = candidates[rows]
+        
+        results = [
+            self._format(records[int(row)], float(similarity))
+            for row, similarity in zip(rows, similarities)
+        ]
+        if include_vectors:
+            for result, row in zip(results, rows):
+                result["vector"] = np.asarray(vectors[int(row)]).tolist()
+        return results
+    
+    def _search_quantized(
+        self,
+        vectors: np.ndarray,
+        codes: np.ndarray,
+        query: np.ndarray,
+        top_k: int,
+        candidates: Optional[np.ndarray]
+    ):
+        """Approximate scan over the codes, then exact rescoring of the best rows"""
+        if candidates is not None:
+            codes = np.asarray(codes[candidates])
+        
+        if self.quantization == "binary":
+            query_code = np.packbits(query > 0)
+        else:
+            # code * scale approximates the vector, so fold the scale into the query
+            scaled_query = query * INT8_SCALE
+        
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = np.asarray(codes[start:start + SCAN_BLOCK_ROWS])
+            if self.quantization == "binary":
+                # Negative Hamming distance, so higher is better as for int8
+                block_scores = -_POPCOUNT[block ^ query_code].sum(axis=1, dtype=np.int32)
+            else:
+                block_scores = block.astype(np.float32) @ scaled_query
+            scores[start:start + len(block)] = block_scores
+        
+        shortlist, _ = _top_k(scores, max(settings.vector_rescore_limit, top_k))
+        if candidates is not None:
+            shortlist = candidates[shortlist]
+        
+        # Sorted row order keeps the reads from the memory map sequential
+        shortlist = np.sort(shortlist)
+        exact = np.asarray(vectors[shortlist]) @ query
+        order, similarities = _top_k(exact, top_k)
+        return shortlist[order], similarities
+    
+    @staticmethod
+    def _format(record: Dict, similarity: float) -> Dict:
+        """Result dict in the same shape as VectorStore.search"""
+        distance = max(1.0 - similarity, 0.0)
+        return {
+            "weaviate_id": record["id"],
+            "text": record["text"],
+            "document_id": record["document_id"],
+            "document_name": record["document_name"],
+            "chunk_index": record["chunk_index"],
+            "chunk_hash": record["chunk_hash"],
+            "similarity_score": round(1 / (1 + distance), 4),
+            "distance": round(distance, 4)
+        }
+    
+    def delete_by_document(self, document_id: str):
+        """Delete all chunks for a document (compacts the files)"""
+        with self._lock, self._file_lock():
+            # Compact from the current files, including other processes' rows
+            self._refresh()
+            keep = np.flatnonzero(self._document_ids != document_id)
+            if len(keep) == len(self._records):
+                return
+            
+            vectors = np.asarray(self._vectors[keep]) if len(keep) else np.empty((0, self.dimension), np.float32)
+            records = [self._records[i] for i in keep]
+            codes = np.asarray(self._codes[keep]) if self._codes is not None and len(keep) else None
+            
+            # Write compacted copies, then swap them in atomically
+            tmp_vectors = self.vectors_path.with_suffix(".tmp")
+            tmp_chunks = self.chunks_path.with_suffix(".tmp")
+            tmp_vectors.write_bytes(vectors.tobytes())
+            with open(tmp_chunks, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+            
+            if codes is not None:
+                tmp_codes = self.codes_path.with_suffix(".tmp")
+                tmp_codes.write_bytes(codes.tobytes())
+            
+            self._vectors = np.empty((0, self.dimension), dtype=np.float32)  # release the old map
+            self._codes = None
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_chunks, self.chunks_path)
+            if codes is not None:
+                os.replace(tmp_codes, self.codes_path)
+            
+            self._records = records
+            self._document_ids = np.array([r["document_id"] for r in records], dtype=object)
+            self._chunks_bytes = self.chunks_path.stat().st_size
+            self._disk_state = self._stat_chunks()
+            self._remap(len(records))
+            self._load_codes()
+            
+            self._hnsw = None
+            self.hnsw_path.unlink(missing_ok=True)
+            if self._hnsw_wanted():
+                self._build_hnsw()
+        
+        logger.info(f"Deleted chunks for document {document_id}")
+    
+    def close(self):
+        """Nothing to close; kept for interface parity with VectorStore"""
+        logger.info("Local vector store closed")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so dot product equals cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """Indices and values of the k highest scores, best first (O(N) select)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if k < len(scores):
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(len(scores))
+    order = idx[np.argsort(-scores[idx])]
+    return order, scores[order]
@@ -0,0 +1,189 @@
+"""
+Relevance gate: answer "Not found in sources" without calling the LLM
+
+When even the closest retrieved chunk is far from the question, the LLM
+almost always answers "Not found in sources" anyway, after a full round
+trip. The gate skips that call when the best vector distance is above a
+per-embedding-model threshold. Distances are not comparable across models,
+so thresholds are learned per model from query_traces history (see
+calibrate_relevance_gate.py) and kept in a small JSON file.
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import logging
+import math
+import threading
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND_ANSWER = "Not found in sources"
+
+
+def model_key(provider: str = None) -> str:
+    """Thresholds are per embedding model (and vector size), e.g. local:all-MiniLM-L6-v2"""
+    provider = provider or settings.embedding_provider
+    if provider == "openai":
+        key = f"openai:{settings.openai_embedding_model}"
+        if settings.openai_embedding_dimensions:
+            key += f"@{settings.openai_embedding_dimensions}"
+        return key
+    return f"{provider}:{settings.local_embedding_model}"
+
+
+def best_distance(chunks: List[Dict]) -> Optional[float]:
+    """Smallest vector distance among chunks (lexical-only hits have none)"""
+    distances = [chunk["distance"] for chunk in chunks if chunk.get("distance") is not None]
+    return min(distances) if distances else None
+
+
+class RelevanceGate:
+    """Per-model distance thresholds, reloaded when the file changes"""
+    
+    def __init__(self, path: str = None):
+        self.path = Path(path or settings.relevance_gate_thresholds_path)
+        self._thresholds: Dict[str, Dict] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+    
+    def thresholds(self) -> Dict[str, Dict]:
+        """Calibrated thresholds by model key (re-read after recalibration)"""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return {}
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self._thresholds = json.loads(self.path.read_text())
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Could not read relevance thresholds from {self.path}: {e}")
+                    self._mtime = mtime
+        return self._thresholds
+    
+    def max_distance(self, provider: str = None) -> Optional[float]:
+        """Distance above which the LLM is skipped, or None if there is no threshold"""
+        calibrated = self.thresholds().get(model_key(provider)) or {}
+        if calibrated.get("max_distance") is not None:
+            return calibrated["max_distance"]
+        return settings.relevance_gate_default_max_distance or None
+    
+    def check(self, chunks: List[Dict], provider: str = None) -> Dict:
+        """
+        Decide whether chunks are too far from the query to be worth an LLM call
+        
+        Args:
+            chunks: Retrieved chunks with vector distances
+            provider: Embedding provider the chunks were retrieved with
+        
+        Returns:
+            Decision for the trace: bypass flag, best distance and threshold.
+            Results with a lexical (BM25) hit never bypass: an exact match on
+            an identifier or error code can sit next to far vector hits.
+        """
+        threshold = self.max_distance(provider)
+        distance = best_distance(chunks)
+        lexical = any("lexical" in chunk.get("retrieval_sources", ()) for chunk in chunks)
+        return {
+            "bypass": threshold is not None and distance is not None and distance > threshold and not lexical,
+            "best_distance": distance,
+            "max_distance": threshold,
+            "lexical_hit": lexical,
+            "model": model_key(provider)
+        }
+    
+    def save(self, thresholds: Dict[str, Dict]):
+        """Merge new thresholds into the file (other models keep theirs)"""
+        merged = dict(self.thresholds(), **thresholds)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(merged, indent=2, sort_keys=True))
+        tmp_path.replace(self.path)
+
+
+def calibrate_thresholds(
+    traces: List[Dict],
+    max_false_skip: float = None,
+    min_samples: int = 50
+) -> Dict[str, Dict]:
+    """
+    Learn a distance threshold per embedding model from past queries
+    
+    A trace counts as answered unless the LLM replied "Not found in sources".
+    The threshold is the distance that at most max_false_skip of answered
+    queries exceeded, so the gate would have wrongly skipped at most that
+    share. Traces the gate bypassed or the answer cache served are left out:
+    no LLM judged them (bypassed traces store no chunks or scores either).
+    
+    Each trace's distance is the one the gate compares: the best distance of
+    the retrieved chunks, recorded under metadata["relevance_gate"]. Older
+    traces without it fall back to the best similarity score of the chunks
+    that went into the prompt.
+    
+    Args:
+        traces: Rows from postgres.get_query_traces_for_calibration
+        max_false_skip: Tolerated share of answered queries above the threshold
+        min_samples: Answered queries a model needs before it gets a threshold
+    
+    Returns:
+        {model key: threshold and calibration stats}; models with too little
+        history are reported with max_distance None
+    """
+    if max_false_skip is None:
+        max_false_skip = settings.relevance_gate_max_false_skip
+    
+    samples: Dict[str, Dict[str, List]] = {}
+    for trace in traces:
+        metadata = trace.get("metadata") or {}
+        bypassed = (metadata.get("relevance_gate") or {}).get("bypass")
+        cached = (metadata.get("answer_cache") or {}).get("hit")
+        if bypassed or cached:
+            continue
+        decision = metadata.get("relevance_gate") or {}
+        if "best_distance" in decision:
+            distance = decision["best_distance"]
+        else:
+            scores = [score for score in trace.get("similarity_scores") or [] if score and score > 0]
+            # similarity_score = 1 / (1 + distance)
+            distance = 1 / max(scores) - 1 if scores else None
+        if distance is None:
+            continue
+        answer = (trace.get("answer_text") or "").strip()
+        label = "not_found" if answer.startswith(NOT_FOUND_ANSWER) else "answered"
+        entry = samples.setdefault(model_key(trace.get("embedding_provider")), {"answered": [], "not_found": []})
+        entry[label].append((distance, trace.get("processing_time_ms") or 0))
+    
+    thresholds = {}
+    for key, entry in samples.items():
+        answered = sorted(distance for distance, _ in entry["answered"])
+        not_found = entry["not_found"]
+        result = {
+            "answered": len(answered),
+            "not_found": len(not_found),
+            "max_distance": None,
+            "calibrated_at": datetime.now(timezone.utc).isoformat()
+        }
+        if len(answered) < min_samples or not not_found:
+            result["reason"] = f"needs {min_samples} answered and 1 not-found queries"
+            thresholds[key] = result
+            continue
+        
+        threshold = answered[max(math.ceil(len(answered) * (1 - max_false_skip)) - 1, 0)]
+        skipped = [ms for distance, ms in not_found if distance > threshold]
+        result.update({
+            "max_distance": round(threshold, 4),
+            "false_skip_rate": round(sum(1 for d in answered if d > threshold) / len(answered), 4),
+            "not_found_skip_rate": round(len(skipped) / len(not_found), 4),
+            # Latency those skipped queries spent, mostly in the LLM call
+            "saved_ms_per_skip": round(sum(skipped) / len(skipped)) if skipped else 0
+        })
+        thresholds[key] = result
+    return thresholds
+
+
+# Global instance
+relevance_gate = RelevanceGate()
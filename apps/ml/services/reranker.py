@@ -0,0 +1,143 @@
+"""
+Cross-encoder reranking of retrieved chunks
+
+A cross-encoder reads query and chunk together, so it orders candidates far
+better than embedding similarity. Retrieval can then send fewer chunks to the
+LLM. Scores are cached per (query, chunk) and the stage has a latency
+budget: if scoring runs over, the caller keeps the retrieval order.
+
+Scoring runs in its own small thread pool with its own slots. A pass that
+overran the budget keeps running (and fills the cache), but it never holds
+the embedding slots or the shared fan-out pool. When every slot is busy,
+new queries skip reranking rather than queue behind them.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Tuple
+import hashlib
+import logging
+import threading
+import time
+
+from sentence_transformers import CrossEncoder
+
+from config import settings
+from utils.caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """Batched cross-encoder scoring with a score cache and time budget"""
+    
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name or settings.rerank_model
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(settings.rerank_max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.rerank_max_concurrency,
+            thread_name_prefix="rerank"
+        )
+        self.score_cache = LRUCache(
+            max_size=settings.rerank_cache_size,
+            ttl_seconds=settings.rerank_cache_ttl_seconds
+        )
+    
+    def load(self):
+        """Load the model (once); also used to warm up at startup"""
+        if self.model is None:
+            with self._load_lock:
+                if self.model is None:
+                    logger.info(f"Loading reranker model: {self.model_name}")
+                    self.model = CrossEncoder(self.model_name)
+        return self.model
+    
+    @staticmethod
+    def _cache_key(query_hash: str, chunk: Dict) -> tuple:
+        """Scores depend only on the query text and the chunk text"""
+        chunk_hash = chunk.get("chunk_hash") or hashlib.md5(chunk["text"].encode("utf-8")).hexdigest()
+        return (query_hash, chunk_hash)
+    
+    def _score(self, query: str, chunks: List[Dict], keys: List[tuple]) -> List[float]:
+        """One batched forward pass over all pairs; results go into the cache"""
+        model = self.load()
+        scores = model.predict(
+            [(query, chunk["text"]) for chunk in chunks],
+            batch_size=settings.rerank_batch_size,
+            show_progress_bar=False
+        )
+        scores = [float(score) for score in scores]
+        for key, score in zip(keys, scores):
+            self.score_cache.set(key, score)
+        return scores
+    
+    def rerank(self, query: str, chunks: List[Dict], top_k: int) -> Tuple[List[Dict], Dict]:
+        """
+        Order chunks by cross-encoder relevance and keep the best top_k
+        
+        Args:
+            query: User question
+            chunks: Retrieved candidates, best first
+            top_k: Number of chunks to keep
+        
+        Returns:
+            Tuple of (chunks, stats for the trace). On timeout, error or when
+            all scoring slots are busy the first top_k chunks are returned in
+            their original order.
+        """
+        started = time.perf_counter()
+        # The exact text the model scores: scores differ with case and spacing
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [self._cache_key(query_hash, chunk) for chunk in chunks]
+        
+        scores = {}
+        for key in keys:
+            cached = self.score_cache.get(key)
+            if cached is not None:
+                scores[key] = cached
+        missing = [(chunk, key) for chunk, key in zip(chunks, keys) if key not in scores]
+        stats = {"candidates": len(chunks), "cached": len(chunks) - len(missing), "fallback": False}
+        
+        if missing and not self._slots.acquire(blocking=False):
+            logger.warning("All reranking slots busy, keeping retrieval order")
+            stats["fallback"] = "busy"
+        elif missing:
+            # Scoring keeps running after a timeout and still fills the
+            # cache, so a repeated query is fast next time; its slot is
+            # released only when it really finishes
+            try:
+                future = self._executor.submit(
+                    self._score, query, [chunk for chunk, _ in missing], [key for _, key in missing]
+                )
+            except RuntimeError:  # executor shut down
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                new_scores = future.result(timeout=settings.rerank_timeout_ms / 1000)
+                scores.update(zip([key for _, key in missing], new_scores))
+            except FutureTimeoutError:
+                logger.warning(f"Reranking exceeded {settings.rerank_timeout_ms} ms, keeping retrieval order")
+                stats["fallback"] = "timeout"
+            except Exception as e:
+                logger.error(f"Reranking failed, keeping retrieval order: {e}")
+                stats["fallback"] = "error"
+        
+        stats["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if stats["fallback"]:
+            return chunks[:top_k], stats
+        
+        ranked = sorted(
+            (dict(chunk, rerank_score=round(scores[key], 4)) for chunk, key in zip(chunks, keys)),
+            key=lambda chunk: chunk["rerank_score"],
+            reverse=True
+        )
+        return ranked[:top_k], stats
+    
+    def shutdown(self):
+        """Wait for running scoring passes (application shutdown)"""
+        self._executor.shutdown(wait=True)
+
+
+# Global instance
+reranker = Reranker()
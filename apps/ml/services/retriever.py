@@ -1,12 +1,20 @@
 """
 Retrieval service for RAG pipeline
 """
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import logging
+import time
 from collections import defaultdict
 
+import numpy as np
+
 from models.embeddings import get_embedder
 from services.vector_store import get_vector_store
+from services.lexical_index import lexical_index
+from services.reranker import reranker
+from database import postgres
+from utils.caching import get_embedding_cache, query_embedding_cache
+from utils.concurrency import submit_fanout
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -30,15 +38,27 @@ class Retriever:
         self,
         query: str,
         top_k: int = None,
-        embedding_provider: str = None
+        embedding_provider: str = None,
+        query_embedding: List[float] = None,
+        trace: Optional[Dict] = None,
+        filters: Optional[Dict] = None
     ) -> List[Dict]:
         """
         Retrieve relevant chunks for a query
         
+        With hybrid search enabled, a BM25 leg runs in parallel with the
+        vector leg and both rankings are fused with reciprocal rank fusion.
+        With reranking enabled, more candidates are retrieved and a
+        cross-encoder picks the final top_k.
+        
         Args:
             query: User question
             top_k: Number of chunks to retrieve
             embedding_provider: Override default embedding provider
+            query_embedding: Precomputed query embedding (skips embedding)
+            trace: Optional dict that receives per-leg timings and hit counts
+            filters: Optional scope (document_ids, filenames, file_types,
+                uploaded_after, uploaded_before), applied inside both searches
             
         Returns:
             List of relevant chunks with metadata
@@ -46,37 +66,326 @@ class Retriever:
         self._ensure_initialized()
         
         top_k = top_k or settings.default_top_k
+        embedder = get_embedder(embedding_provider) if embedding_provider else self.embedder
+        provider = embedding_provider or settings.embedding_provider
+        
+        # Candidates to keep after filtering (the reranker narrows them to top_k)
+        candidates = max(top_k, settings.rerank_candidates) if settings.rerank_enabled else top_k
+        
+        # Resolve filters to the matching document IDs up front, so both legs
+        # search only inside the scope
+        scope = postgres.get_document_ids_matching(**filters) if filters else None
+        if scope is not None and not scope:
+            logger.info("No documents match the query filters")
+            if trace is not None:
+                trace["retrieval"] = {"scope_documents": 0}
+            return []
+        if scope is not None and len(scope) >= postgres.count_documents():
+            scope = None  # the filters match every document: no need to filter
+        
+        lexical_future = None
+        if settings.hybrid_search_enabled:
+            lexical_future = submit_fanout(self._search_lexical, query, candidates * 2, scope)
+        
+        embed_started = time.perf_counter()
+        
+        # Generate query embedding; when rescoring, one full-size embedding
+        # serves both stages (the index gets it truncated)
+        rescore = embedder.rescores_full_dimension()
+        full_query = self._embed_query_full(query, embedder, provider) if rescore else None
+        if query_embedding is None:
+            if rescore:
+                query_embedding = embedder.truncate([full_query])[0]
+            else:
+                query_embedding = self.embed_query(query, embedding_provider)
+        self.vector_store.check_dimension(len(query_embedding))
+        mmr = settings.retrieval_diversification == "mmr"
+        # The vector leg includes embedding the query, as the lexical leg runs meanwhile
+        retrieval_trace = {"vector_ms": (time.perf_counter() - embed_started) * 1000}
+        if scope is not None:
+            retrieval_trace["scope_documents"] = len(scope)
+        lexical_results = None
+        
+        # Request more than top_k to allow for deduplication; MMR widens the
+        # fetch until it finds enough diverse candidates
+        fetch = candidates * 2
+        while True:
+            vector_started = time.perf_counter()
+            limit = max(fetch, settings.vector_rescore_limit) if rescore else fetch
+            raw_results = self.vector_store.search(
+                query_embedding=query_embedding,
+                top_k=limit,
+                include_vectors=mmr,
+                document_ids=scope
+            )
+            exhausted = len(raw_results) < limit
+            logger.info(f"Retrieved {len(raw_results)} raw results")
+            
+            if rescore:
+                raw_results = self._rescore_full(raw_results, full_query, embedder, provider)[:fetch]
+            
+            retrieval_trace["vector_ms"] = round(
+                retrieval_trace["vector_ms"] + (time.perf_counter() - vector_started) * 1000, 1
+            )
+            retrieval_trace["vector_hits"] = len(raw_results)
+            
+            if lexical_future is not None:
+                if lexical_results is None:
+                    lexical_results, retrieval_trace["lexical_ms"] = lexical_future.result()
+                    retrieval_trace["lexical_hits"] = len(lexical_results)
+                raw_results = self._fuse_rrf(raw_results, lexical_results, k=settings.hybrid_rrf_k)
+            
+            if not mmr:
+                # Deduplicate and limit chunks per document
+                filtered_results = self._deduplicate_and_limit(
+                    raw_results,
+                    max_per_document=settings.max_chunks_per_document
+                )
+                break
+            
+            filtered_results = self._diversify_mmr(raw_results, query_embedding, candidates)
+            if len(filtered_results) >= candidates or exhausted or fetch >= settings.mmr_max_fetch:
+                retrieval_trace["mmr_fetch"] = fetch
+                break
+            fetch = min(fetch * 2, settings.mmr_max_fetch)
+        
+        # Take top_k after filtering
+        if settings.rerank_enabled:
+            final_results, retrieval_trace["rerank"] = reranker.rerank(
+                query, filtered_results[:candidates], top_k
+            )
+        else:
+            final_results = filtered_results[:top_k]
+        
+        logger.info(f"After filtering: {len(final_results)} chunks")
+        
+        if lexical_future is not None:
+            # Which leg(s) each returned chunk came from
+            contribution = defaultdict(int)
+            for result in final_results:
+                contribution["+".join(result["retrieval_sources"])] += 1
+            retrieval_trace["contribution"] = dict(contribution)
+        if trace is not None:
+            trace["retrieval"] = retrieval_trace
+        
+        return final_results
+    
+    def embed_query(self, query: str, embedding_provider: str = None) -> List[float]:
+        """
+        Embed a query, reusing cached embeddings for repeated questions
+        
+        Args:
+            query: User question
+            embedding_provider: Override default embedding provider
+            
+        Returns:
+            Query embedding vector
+        """
+        self._ensure_initialized()
         
-        # Generate query embedding
         if embedding_provider:
             embedder = get_embedder(embedding_provider)
         else:
             embedder = self.embedder
+        provider = embedding_provider or settings.embedding_provider
+        
+        if embedder.rescores_full_dimension():
+            # One API call serves both stages: truncate the full vector
+            return embedder.truncate([self._embed_query_full(query, embedder, provider)])[0]
+        
+        cached = query_embedding_cache.get(provider, embedder.model_name, query)
+        if cached is not None:
+            logger.info(f"Query embedding cache hit for: {query[:100]}...")
+            return cached
         
         query_embedding = embedder.embed_text(query)
+        query_embedding_cache.set(provider, embedder.model_name, query, query_embedding)
         logger.info(f"Generated query embedding for: {query[:100]}...")
+        return query_embedding
+    
+    def embed_queries(self, queries: List[str], embedding_provider: str = None) -> List[List[float]]:
+        """
+        Embed many queries with one embed_batch call for all cache misses
+        
+        Args:
+            queries: User questions
+            embedding_provider: Override default embedding provider
+            
+        Returns:
+            One query embedding per question, in input order
+        """
+        self._ensure_initialized()
         
-        # Search in vector store
-        # Request more than top_k to allow for deduplication
-        raw_results = self.vector_store.search(
-            query_embedding=query_embedding,
-            top_k=top_k * 2
-        )
+        embedder = get_embedder(embedding_provider) if embedding_provider else self.embedder
+        provider = embedding_provider or settings.embedding_provider
+        full = embedder.rescores_full_dimension()
+        # Full-size vectors share the cache entries used by _embed_query_full
+        model_key = f"{embedder.model_name}@{embedder.get_full_dimension()}" if full else embedder.model_name
         
-        logger.info(f"Retrieved {len(raw_results)} raw results")
+        embeddings = [query_embedding_cache.get(provider, model_key, query) for query in queries]
+        missing = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+        if missing:
+            new_embeddings = embedder.embed_batch_full(missing) if full else embedder.embed_batch(missing)
+            computed = dict(zip(missing, new_embeddings))
+            for query, embedding in computed.items():
+                query_embedding_cache.set(provider, model_key, query, embedding)
+            embeddings = [e if e is not None else computed[q] for q, e in zip(queries, embeddings)]
+        logger.info(f"Embedded {len(queries)} queries ({len(missing)} computed)")
         
-        # Deduplicate and limit chunks per document
-        filtered_results = self._deduplicate_and_limit(
-            raw_results,
-            max_per_document=settings.max_chunks_per_document
-        )
+        if full:
+            return embedder.truncate(embeddings)
+        return embeddings
+    
+    @staticmethod
+    def _embed_query_full(query: str, embedder, provider: str) -> List[float]:
+        """Full-dimension query embedding, cached separately from truncated ones"""
+        model_key = f"{embedder.model_name}@{embedder.get_full_dimension()}"
+        cached = query_embedding_cache.get(provider, model_key, query)
+        if cached is not None:
+            return cached
+        query_embedding = embedder.embed_batch_full([query])[0]
+        query_embedding_cache.set(provider, model_key, query, query_embedding)
+        return query_embedding
+    
+    @staticmethod
+    def _rescore_full(
+        results: List[Dict],
+        full_query: List[float],
+        embedder,
+        provider: str
+    ) -> List[Dict]:
+        """
+        Re-rank first-stage hits by cosine distance between full-size vectors
         
-        # Take top_k after filtering
-        final_results = filtered_results[:top_k]
+        Full chunk vectors come from the embedding cache (written at
+        ingestion); hits without one keep their truncated-vector distance.
+        """
+        cache = get_embedding_cache(provider, embedder.model_name, embedder.get_full_dimension())
+        if cache is None or not results:
+            return results
+        vectors = cache.get_many([r["chunk_hash"] for r in results if r.get("chunk_hash")])
         
-        logger.info(f"After filtering: {len(final_results)} chunks")
+        query = np.asarray(full_query, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        rescored = []
+        for result in results:
+            vector = vectors.get(result.get("chunk_hash"))
+            if vector is not None:
+                similarity = float(vector @ query) / (float(np.linalg.norm(vector)) or 1.0)
+                distance = max(1.0 - similarity, 0.0)
+                result = dict(
+                    result,
+                    distance=round(distance, 4),
+                    similarity_score=round(1 / (1 + distance), 4)
+                )
+            rescored.append(result)
         
-        return final_results
+        logger.info(f"Rescored {len(vectors)}/{len(results)} results with full-size vectors")
+        return sorted(rescored, key=lambda r: r["distance"])
+    
+    @staticmethod
+    def _search_lexical(
+        query: str,
+        limit: int,
+        document_ids: Optional[List[str]] = None
+    ) -> Tuple[List[Dict], float]:
+        """BM25 leg; returns (results, elapsed ms) and never fails the query"""
+        started = time.perf_counter()
+        try:
+            results = lexical_index.search(query, top_k=limit, document_ids=document_ids)
+        except Exception as e:
+            logger.warning(f"Lexical search failed, using vector results only: {e}")
+            results = []
+        return results, round((time.perf_counter() - started) * 1000, 1)
+    
+    @staticmethod
+    def _fuse_rrf(
+        vector_results: List[Dict],
+        lexical_results: List[Dict],
+        k: int = 60
+    ) -> List[Dict]:
+        """
+        Reciprocal rank fusion: score = sum over legs of 1 / (k + rank)
+        
+        Chunks found by the vector leg keep its scores; lexical-only chunks
+        have no vector distance (similarity_score 0.0, distance None).
+        """
+        fused = {}
+        for leg, results in (("vector", vector_results), ("lexical", lexical_results)):
+            for rank, result in enumerate(results, start=1):
+                entry = fused.get(result["weaviate_id"])
+                if entry is None:
+                    entry = dict(result, rrf_score=0.0, retrieval_sources=[])
+                    entry.setdefault("similarity_score", 0.0)
+                    entry.setdefault("distance", None)
+                    fused[result["weaviate_id"]] = entry
+                elif "bm25_score" in result:
+                    entry["bm25_score"] = result["bm25_score"]
+                entry["rrf_score"] += 1 / (k + rank)
+                entry["retrieval_sources"].append(leg)
+        
+        ranked = sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)
+        for entry in ranked:
+            entry["rrf_score"] = round(entry["rrf_score"], 6)
+        return ranked
+    
+    @staticmethod
+    def _diversify_mmr(results: List[Dict], query_embedding: List[float], k: int) -> List[Dict]:
+        """
+        Maximal marginal relevance selection of k results
+        
+        Each step picks the candidate maximizing
+            lambda * relevance - (1 - lambda) * max similarity to picked ones
+        Candidates with an already picked chunk hash, or a cosine similarity
+        of at least mmr_duplicate_threshold to a picked one, are skipped.
+        Relevance is cosine similarity to the query, or the normalized RRF
+        score for fused results (lexical-only hits carry no vector).
+        """
+        if not results:
+            return []
+        
+        vectors = np.zeros((len(results), len(query_embedding)), dtype=np.float32)
+        for i, result in enumerate(results):
+            if result.get("vector") is not None:
+                vectors[i] = result["vector"]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        
+        if "rrf_score" in results[0]:
+            relevance = np.array([r["rrf_score"] for r in results], dtype=np.float32)
+            relevance /= relevance.max() or 1.0
+        else:
+            query = np.asarray(query_embedding, dtype=np.float32)
+            relevance = vectors @ (query / (np.linalg.norm(query) or 1.0))
+        
+        # All pairwise similarities in one matrix product
+        similarity = vectors @ vectors.T
+        
+        lam = settings.mmr_lambda
+        available = np.ones(len(results), dtype=bool)
+        max_similarity = np.zeros(len(results), dtype=np.float32)
+        seen_hashes = set()
+        selected = []
+        while len(selected) < k and available.any():
+            scores = np.where(available, lam * relevance - (1 - lam) * max_similarity, -np.inf)
+            best = int(np.argmax(scores))
+            available[best] = False
+            
+            chunk_hash = results[best].get("chunk_hash")
+            if chunk_hash and chunk_hash in seen_hashes:
+                continue
+            if chunk_hash:
+                seen_hashes.add(chunk_hash)
+            
+            selected.append(best)
+            max_similarity = np.maximum(max_similarity, similarity[best])
+            available &= similarity[best] < settings.mmr_duplicate_threshold
+        
+        return [
+            {key: value for key, value in results[i].items() if key != "vector"}
+            for i in selected
+        ]
     
     @staticmethod
     def _deduplicate_and_limit(
@@ -2,10 +2,11 @@
 Weaviate vector store operations
 """
 import weaviate
-from weaviate.classes.config import Configure, Property, DataType
-from weaviate.classes.query import MetadataQuery
+from weaviate.classes.config import Configure, Property, DataType, Tokenization
+from weaviate.classes.query import MetadataQuery, Filter
 from typing import List, Dict, Optional
 import logging
+import threading
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -20,6 +21,7 @@ class VectorStore:
         self.weaviate_url = weaviate_url or settings.weaviate_url
         self.client = None
         self.collection = None
+        self._checked_dimensions = set()
         self._connect()
     
     def _connect(self):
@@ -41,25 +43,49 @@ class VectorStore:
             if self.client.collections.exists(self.COLLECTION_NAME):
                 self.collection = self.client.collections.get(self.COLLECTION_NAME)
                 logger.info(f"Using existing collection: {self.COLLECTION_NAME}")
+                if settings.vector_quantization != "none":
+                    logger.warning(
+                        "VECTOR_QUANTIZATION only applies to new collections; "
+                        "recreate the collection to change it"
+                    )
             else:
                 # Create collection
                 self.collection = self.client.collections.create(
                     name=self.COLLECTION_NAME,
                     properties=[
                         Property(name="text", data_type=DataType.TEXT),
-                        Property(name="document_id", data_type=DataType.TEXT),
+                        # Whole-value tokens: UUIDs must not match on single hyphen groups
+                        Property(name="document_id", data_type=DataType.TEXT, tokenization=Tokenization.FIELD),
                         Property(name="document_name", data_type=DataType.TEXT),
                         Property(name="chunk_index", data_type=DataType.INT),
                         Property(name="char_count", data_type=DataType.INT),
                         Property(name="chunk_hash", data_type=DataType.TEXT),
                     ],
                     vectorizer_config=Configure.Vectorizer.none(),  # We provide embeddings
+                    vector_index_config=self._vector_index_config(),
                 )
                 logger.info(f"Created new collection: {self.COLLECTION_NAME}")
         except Exception as e:
             logger.error(f"Schema initialization error: {e}")
             raise
     
+    @staticmethod
+    def _vector_index_config():
+        """
+        HNSW config for settings.vector_quantization
+        
+        Weaviate keeps the compressed codes in memory and rescores the best
+        vector_rescore_limit candidates against the full vectors on disk.
+        Only applied when the collection is created.
+        """
+        if settings.vector_quantization == "int8":
+            quantizer = Configure.VectorIndex.Quantizer.sq(rescore_limit=settings.vector_rescore_limit)
+        elif settings.vector_quantization == "binary":
+            quantizer = Configure.VectorIndex.Quantizer.bq(rescore_limit=settings.vector_rescore_limit)
+        else:
+            return None
+        return Configure.VectorIndex.hnsw(quantizer=quantizer)
+    
     def add_chunks(
         self,
         chunks: List[Dict],
@@ -81,6 +107,8 @@ class VectorStore:
         """
         if len(chunks) != len(embeddings):
             raise ValueError("Number of chunks and embeddings must match")
+        if embeddings:
+            self.check_dimension(len(embeddings[0]))
         
         weaviate_ids = []
         
@@ -109,37 +137,94 @@ class VectorStore:
             logger.error(f"Error adding chunks to Weaviate: {e}")
             raise
     
+    def check_dimension(self, dimension: int):
+        """
+        Ensure vectors of this size match the ones already in the collection
+        
+        Raises:
+            ValueError: If the collection holds vectors of another size
+                (e.g. after changing the embedding model or dimensions)
+        """
+        if dimension in self._checked_dimensions:
+            return
+        response = self.collection.query.fetch_objects(limit=1, include_vector=True)
+        if not response.objects:
+            return  # empty collection: the first insert sets the size
+        vector = response.objects[0].vector
+        if isinstance(vector, dict):
+            vector = vector.get("default", [])
+        if len(vector) != dimension:
+            raise ValueError(
+                f"Embedding dimension {dimension} does not match the {len(vector)}-dimensional "
+                f"vectors in {self.COLLECTION_NAME}; re-ingest documents into a new collection"
+            )
+        self._checked_dimensions.add(dimension)
+    
     def search(
         self,
         query_embedding: List[float],
         top_k: int = 5,
-        document_id: Optional[str] = None
+        document_id: Optional[str] = None,
+        include_vectors: bool = False,
+        document_ids: Optional[List[str]] = None
     ) -> List[Dict]:
         """
         Search for similar chunks
         
+        Document filters are pre-filters: Weaviate restricts the HNSW search
+        (or a flat scan, for small allow-lists) to matching objects, so the
+        results are the top_k within the scope, not a filtered global top_k.
+        A long ID list is searched in batches of `weaviate_filter_batch_size`
+        IDs (one OR of equalities each) and the results merged by distance.
+        
         Args:
             query_embedding: Query vector
             top_k: Number of results to return
             document_id: Optional filter by document ID
+            include_vectors: Also return each chunk's stored vector
+            document_ids: Optional filter by any of several document IDs
             
         Returns:
             List of chunk results with metadata and scores
         """
+        if document_id:
+            document_ids = [document_id]
+        if document_ids is None:
+            return self._search(query_embedding, top_k, None, include_vectors)
+        
+        batch_size = max(settings.weaviate_filter_batch_size, 1)
+        results = []
+        for start in range(0, len(document_ids), batch_size):
+            # One equality per ID: collections created before document_id used
+            # field tokenization split UUIDs on hyphens, and contains_any would
+            # then match any object sharing a single group with an in-scope ID
+            clauses = [
+                Filter.by_property("document_id").equal(d)
+                for d in document_ids[start:start + batch_size]
+            ]
+            filters = clauses[0] if len(clauses) == 1 else Filter.any_of(clauses)
+            results.extend(self._search(query_embedding, top_k, filters, include_vectors))
+        if len(document_ids) > batch_size:
+            results.sort(key=lambda result: result["distance"])
+        return results[:top_k]
+    
+    def _search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filters,
+        include_vectors: bool
+    ) -> List[Dict]:
+        """One near-vector query with an optional filter"""
         try:
-            # Build query
-            query = self.collection.query.near_vector(
+            response = self.collection.query.near_vector(
                 near_vector=query_embedding,
                 limit=top_k,
-                return_metadata=MetadataQuery(distance=True)
+                filters=filters,
+                return_metadata=MetadataQuery(distance=True),
+                include_vector=include_vectors
             )
             
-            # Apply document filter if provided
-            if document_id:
-                query = query.where(f"document_id == '{document_id}'")
-            
-            response = query
-            
             # Format results
             results = []
             for obj in response.objects:
@@ -153,9 +238,13 @@ class VectorStore:
                     "document_id": obj.properties["document_id"],
                     "document_name": obj.properties["document_name"],
                     "chunk_index": obj.properties["chunk_index"],
+                    "chunk_hash": obj.properties.get("chunk_hash"),
                     "similarity_score": round(similarity_score, 4),
                     "distance": round(distance, 4)
                 })
+                if include_vectors:
+                    vector = obj.vector
+                    results[-1]["vector"] = vector.get("default") if isinstance(vector, dict) else vector
             
             return results
         
@@ -167,7 +256,7 @@ class VectorStore:
         """Delete all chunks for a document"""
         try:
             self.collection.data.delete_many(
-                where={"path": ["document_id"], "operator": "Equal", "valueText": document_id}
+                where=Filter.by_property("document_id").equal(document_id)
             )
             logger.info(f"Deleted chunks for document {document_id}")
         except Exception as e:
@@ -183,11 +272,24 @@ class VectorStore:
 
 # Global instance
 _vector_store = None
+_vector_store_lock = threading.Lock()
 
 
 def get_vector_store() -> VectorStore:
-    """Get or create global VectorStore instance"""
+    """
+    Get or create the global vector store
+    
+    settings.vector_store_backend selects Weaviate or the embedded,
+    in-process LocalVectorStore (same interface).
+    """
     global _vector_store
     if _vector_store is None:
-        _vector_store = VectorStore()
+        # Requests run in worker threads; connect only once
+        with _vector_store_lock:
+            if _vector_store is None:
+                if settings.vector_store_backend == "local":
+                    from services.local_vector_store import LocalVectorStore
+                    _vector_store = LocalVectorStore()
+                else:
+                    _vector_store = VectorStore()
     return _vector_store
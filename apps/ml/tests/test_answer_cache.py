@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from config import settings
+from utils.caching import AnswerCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(settings, "answer_cache_enabled", True)
+    monkeypatch.setattr(settings, "answer_cache_semantic_enabled", True)
+    monkeypatch.setattr(settings, "answer_cache_similarity_threshold", 0.9)
+    monkeypatch.setattr(settings, "answer_cache_size", 8)
+    monkeypatch.setattr(settings, "answer_cache_ttl_seconds", 0)
+    return AnswerCache()
+
+
+def _store(cache, query, vector, answer, generation=None):
+    generation = cache.generation if generation is None else generation
+    cache.store(query, 5, "ollama", "local", {"answer": answer}, generation, query_embedding=vector)
+
+
+def test_exact_match_ignores_case_and_whitespace(cache):
+    _store(cache, "What is  RAG?", [1.0, 0.0], "retrieval")
+    hit = cache.get_exact("what is rag?", 5, "ollama", "local")
+    assert hit["result"] == {"answer": "retrieval"}
+    assert cache.get_exact("what is rag?", 3, "ollama", "local") is None
+
+
+def test_results_from_before_an_invalidation_are_not_stored(cache):
+    generation = cache.generation
+    cache.invalidate()
+    _store(cache, "q", [1.0, 0.0], "stale", generation=generation)
+    assert cache.get_exact("q", 5, "ollama", "local") is None
+
+
+def test_semantic_match_above_threshold(cache):
+    _store(cache, "first", [1.0, 0.0], "one")
+    hit = cache.get_similar([0.99, 0.05], 5, "ollama", "local")
+    assert hit["result"] == {"answer": "one"}
+    assert hit["match"] == "semantic"
+    assert cache.get_similar([0.0, 1.0], 5, "ollama", "local") is None
+
+
+def test_semantic_match_falls_through_to_the_next_candidate(cache):
+    _store(cache, "closest", [1.0, 0.0], "evicted")
+    _store(cache, "next", [0.95, np.sqrt(1 - 0.95 ** 2)], "kept")
+    cache.cache._data.pop(next(key for key in cache.cache._data if key[0] == "closest"))
+    
+    hit = cache.get_similar([1.0, 0.0], 5, "ollama", "local")
+    assert hit["result"] == {"answer": "kept"}
+    # The dangling vector was pruned
+    (vectors,) = cache._vectors.values()
+    assert [key[0] for key in vectors] == ["next"]
+
+
+def test_sync_corpus_invalidates_when_the_shared_version_changes(cache, monkeypatch):
+    monkeypatch.setattr(settings, "answer_cache_corpus_check_seconds", 1)
+    version = [("a", 1)]
+    cache.sync_corpus(lambda: version[0])
+    _store(cache, "q", [1.0, 0.0], "answer")
+    
+    cache.sync_corpus(lambda: version[0])  # within the interval: not even checked
+    version[0] = ("b", 2)
+    cache._corpus_checked_at -= 2
+    cache.sync_corpus(lambda: version[0])
+    assert cache.get_exact("q", 5, "ollama", "local") is None
+    assert cache.generation == 1
+
+
+def test_sync_corpus_survives_a_failing_version_check(cache, monkeypatch):
+    monkeypatch.setattr(settings, "answer_cache_corpus_check_seconds", 1)
+    
+    def fail():
+        raise RuntimeError("database down")
+    
+    cache.sync_corpus(fail)
+    assert cache.generation == 0
@@ -0,0 +1,62 @@
+import pytest
+
+from utils import caching
+from utils.caching import LRUCache, QueryEmbeddingCache, normalize_query
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_expires_entries_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, "monotonic", lambda: now[0])
+    cache = LRUCache(max_size=10, ttl_seconds=60)
+    cache.set("a", 1)
+    now[0] += 59
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_counts_hits_and_misses():
+    cache = LRUCache(max_size=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_zero_size_cache_stores_nothing():
+    cache = LRUCache(max_size=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_normalize_query_ignores_case_and_whitespace():
+    assert normalize_query("  What   is\nRAG? ") == "what is rag?"
+
+
+def test_query_embedding_cache_is_keyed_by_provider_and_model():
+    cache = QueryEmbeddingCache(enabled=True, max_size=10, ttl_seconds=0)
+    cache.set("local", "model-a", "What is RAG?", [0.5, 0.25])
+    assert cache.get("local", "model-a", "what is  rag?") == pytest.approx([0.5, 0.25])
+    assert cache.get("local", "model-b", "what is rag?") is None
+    assert cache.get("openai", "model-a", "what is rag?") is None
+
+
+def test_disabled_query_embedding_cache():
+    cache = QueryEmbeddingCache(enabled=False)
+    cache.set("local", "model", "q", [1.0])
+    assert cache.get("local", "model", "q") is None
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+from utils.concurrency import iterate_blocking
+
+
+def test_iterate_blocking_runs_each_step_in_the_request_pool():
+    threads = []
+    
+    def events():
+        for i in range(3):
+            threads.append(threading.current_thread().name)
+            yield i
+    
+    async def consume():
+        return [item async for item in iterate_blocking(events())]
+    
+    assert asyncio.run(consume()) == [0, 1, 2]
+    assert all(name.startswith("rag-worker") for name in threads)
+
+
+def test_iterate_blocking_closes_the_generator_when_the_consumer_stops():
+    closed = threading.Event()
+    
+    def events():
+        try:
+            while True:
+                yield "token"
+        finally:
+            closed.set()
+    
+    async def consume_one():
+        stream = iterate_blocking(events())
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+    
+    assert asyncio.run(consume_one()) == "token"
+    assert closed.is_set()
@@ -0,0 +1,65 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from utils.caching import DiskEmbeddingCache
+
+
+def _hash(text):
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def test_round_trip_and_reopen(tmp_path):
+    cache = DiskEmbeddingCache(tmp_path, 3)
+    cache.put_many([_hash("a"), _hash("b")], [[1, 0, 0], [0, 1, 0]])
+    assert len(cache) == 2
+    
+    reopened = DiskEmbeddingCache(tmp_path, 3)
+    found = reopened.get_many([_hash("a"), _hash("b"), _hash("c")])
+    assert set(found) == {_hash("a"), _hash("b")}
+    np.testing.assert_array_equal(found[_hash("b")], [0, 1, 0])
+
+
+def test_duplicates_are_stored_once(tmp_path):
+    cache = DiskEmbeddingCache(tmp_path, 2)
+    cache.put_many([_hash("a"), _hash("a")], [[1, 0], [1, 0]])
+    cache.put_many([_hash("a")], [[0, 1]])
+    assert len(cache) == 1
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 4
+    np.testing.assert_array_equal(cache.get_many([_hash("a")])[_hash("a")], [1, 0])
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    cache = DiskEmbeddingCache(tmp_path, 3)
+    with pytest.raises(ValueError):
+        cache.put_many([_hash("a")], [[1, 0]])
+
+
+def test_torn_append_is_repaired_on_open(tmp_path):
+    cache = DiskEmbeddingCache(tmp_path, 2)
+    cache.put_many([_hash("a")], [[1, 0]])
+    # A crash after writing a vector but before its key
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.asarray([[9, 9]], dtype=np.float32).tobytes())
+    
+    reopened = DiskEmbeddingCache(tmp_path, 2)
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 4
+    reopened.put_many([_hash("b")], [[0, 1]])
+    np.testing.assert_array_equal(reopened.get_many([_hash("b")])[_hash("b")], [0, 1])
+
+
+def test_two_writers_share_one_directory(tmp_path):
+    first = DiskEmbeddingCache(tmp_path, 2)
+    second = DiskEmbeddingCache(tmp_path, 2)
+    first.put_many([_hash("a")], [[1, 0]])
+    second.put_many([_hash("b")], [[0, 1]])
+    first.put_many([_hash("c")], [[1, 1]])
+    
+    # Each sees the other's rows, at the right offsets
+    for cache in (first, second):
+        found = cache.get_many([_hash("a"), _hash("b"), _hash("c")])
+        np.testing.assert_array_equal(found[_hash("a")], [1, 0])
+        np.testing.assert_array_equal(found[_hash("b")], [0, 1])
+        np.testing.assert_array_equal(found[_hash("c")], [1, 1])
+    assert len(DiskEmbeddingCache(tmp_path, 2)) == 3
@@ -0,0 +1,119 @@
+import pytest
+
+from config import settings
+from services.generator import Generator, _overlap_length
+from utils import tokens
+
+OVERLAP = "this is the overlapping tail"
+
+
+@pytest.fixture(autouse=True)
+def heuristic(monkeypatch):
+    """Count with the heuristic: tiktoken downloads its encodings on first use"""
+    monkeypatch.setattr(tokens, "tiktoken", None)
+    monkeypatch.setattr(tokens, "_counters", {})
+    monkeypatch.setattr(settings, "chunk_overlap", 50)
+
+
+def _chunk(document_id, chunk_index, text, score=0.5):
+    return {
+        "document_id": document_id,
+        "document_name": f"{document_id}.txt",
+        "chunk_index": chunk_index,
+        "chunk_hash": f"{document_id}-{chunk_index}",
+        "text": text,
+        "similarity_score": score
+    }
+
+
+def test_overlap_length_ignores_chance_matches():
+    assert _overlap_length("Start. " + OVERLAP, OVERLAP + " and more") == len(OVERLAP)
+    # Shorter than MIN_OVERLAP_CHARS: not an overlap
+    assert _overlap_length("ends with the", "the next chunk") == 0
+    assert _overlap_length("no shared text here", "something else entirely") == 0
+
+
+def test_merge_adjacent_joins_neighbours_once():
+    chunks = [
+        _chunk("d1", 3, OVERLAP + ". Chunk three.", score=0.9),
+        _chunk("d2", 0, "Another document.", score=0.8),
+        _chunk("d1", 2, "Chunk two. " + OVERLAP, score=0.7),
+        _chunk("d1", 5, "Chunk five.", score=0.6),
+    ]
+    trace = {}
+    spans = Generator._merge_adjacent(chunks, trace)
+    
+    assert [(s["document_id"], s["chunk_index"]) for s in spans] == [("d1", 2), ("d2", 0), ("d1", 5)]
+    merged = spans[0]
+    assert merged["text"] == "Chunk two. " + OVERLAP + ". Chunk three."
+    assert merged["chunk_indices"] == [2, 3]
+    assert merged["span_offsets"] == [[2, 0], [3, len("Chunk two. ")]]
+    assert merged["best_offset"] == len("Chunk two. ")
+    # Rank and score of the best member; its hash no longer matches the text
+    assert merged["similarity_score"] == 0.9
+    assert "chunk_hash" not in merged
+    assert trace["context"] == {"chunks_merged": 1, "overlap_chars_removed": len(OVERLAP)}
+
+
+def test_merge_adjacent_without_overlap_joins_with_newline():
+    spans = Generator._merge_adjacent([_chunk("d1", 0, "First."), _chunk("d1", 1, "Second.")])
+    assert len(spans) == 1
+    assert spans[0]["text"] == "First.\nSecond."
+    assert spans[0]["span_offsets"] == [[0, 0], [1, len("First.\n")]]
+
+
+def test_pack_context_cuts_the_first_chunk_that_does_not_fit(monkeypatch):
+    monkeypatch.setattr(settings, "ollama_context_token_budget", 19)
+    chunks = [
+        _chunk("d1", 0, "Alpha beta gamma delta."),  # 5 tokens + 4 for the marker
+        _chunk("d2", 0, "One two. Three four. Five six."),  # 9 + 4
+        _chunk("d3", 0, "Extra words here."),  # 4 + 4
+    ]
+    trace = {}
+    packed = Generator()._pack_context(chunks, "ollama", trace)
+    
+    assert [c["text"] for c in packed] == ["Alpha beta gamma delta.", "One two. Three four."]
+    assert packed[1]["truncated"] is True
+    assert trace["context"] == {
+        "tokenizer": "estimate",
+        "budget": 19,
+        "tokens_used": 19,
+        "tokens_dropped": 11,
+        "chunks_used": 2,
+        "chunks_dropped": 1,
+        "truncated": True
+    }
+
+
+def test_pack_context_budget_limits(monkeypatch):
+    chunks = [_chunk("d1", 0, "One two. Three four."), _chunk("d2", 0, "Five six.")]
+    
+    monkeypatch.setattr(settings, "ollama_context_token_budget", 0)
+    assert Generator()._pack_context(chunks, "ollama") == chunks
+    
+    # Not even one sentence fits: the best chunk is still sent whole
+    monkeypatch.setattr(settings, "ollama_context_token_budget", 2)
+    trace = {}
+    assert Generator()._pack_context(chunks, "ollama", trace) == chunks[:1]
+    assert trace["context"]["tokens_used"] == 10
+    assert trace["context"]["tokens_dropped"] == 7
+
+
+def test_cut_chunk_keeps_the_best_member_of_a_span():
+    counter = tokens.get_token_counter("ollama")
+    span = dict(
+        _chunk("d1", 4, "Lead in sentence. Best part here. Tail bit."),
+        chunk_indices=[4, 5, 6],
+        span_offsets=[[4, 0], [5, 18], [6, 34]],
+        best_offset=18
+    )
+    cut = Generator._cut_chunk(span, counter, 5)
+    
+    assert cut["text"] == "Best part here."
+    assert (cut["chunk_index"], cut["chunk_indices"]) == (5, [5])
+    assert "span_offsets" not in cut and "best_offset" not in cut
+    
+    # Compressed spans lost their offsets: cut from the start
+    cut = Generator._cut_chunk(dict(span, compressed=True), counter, 5)
+    assert cut["text"] == "Lead in sentence."
+    assert Generator._cut_chunk(span, counter, 1) is None
@@ -0,0 +1,146 @@
+import pytest
+
+from config import settings
+from database import postgres
+from services.lexical_index import LexicalIndex, tokenize
+
+
+class FakeDatabase:
+    """Documents and chunks as postgres.get_all_chunks returns them"""
+    
+    def __init__(self):
+        self.documents = {}  # id -> (status, updated_at)
+        self.chunks = {}  # id -> chunk rows
+    
+    def store(self, doc_id, status, updated_at, texts):
+        self.documents[doc_id] = (status, updated_at)
+        self.chunks[doc_id] = [
+            {
+                "weaviate_id": f"{doc_id}-{i}",
+                "chunk_text": text,
+                "document_id": doc_id,
+                "filename": f"{doc_id}.txt",
+                "chunk_index": i,
+                "chunk_hash": f"{doc_id}-{i}"
+            }
+            for i, text in enumerate(texts)
+        ]
+    
+    def delete(self, doc_id):
+        self.documents.pop(doc_id)
+        self.chunks.pop(doc_id)
+    
+    def get_corpus_version(self):
+        completed = [v for v in self.documents.values() if v[0] == "completed"]
+        return len(completed), max((v[1] for v in completed), default=None)
+    
+    def get_document_versions(self, statuses):
+        return {doc_id: v for doc_id, v in self.documents.items() if v[0] in statuses}
+    
+    def get_all_chunks(self, document_ids=None):
+        ids = self.chunks if document_ids is None else document_ids
+        return [row for doc_id in ids for row in self.chunks.get(doc_id, [])]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    fake = FakeDatabase()
+    for name in ("get_corpus_version", "get_document_versions", "get_all_chunks"):
+        monkeypatch.setattr(postgres, name, getattr(fake, name))
+    monkeypatch.setattr(settings, "lexical_index_refresh_seconds", 1)
+    return fake
+
+
+def _search_now(index, query, **kwargs):
+    """Search with the refresh interval already elapsed"""
+    index._checked_at = float("-inf")
+    return index.search(query, **kwargs)
+
+
+def _ids(results):
+    return [result["weaviate_id"] for result in results]
+
+
+def test_tokenize_keeps_compounds_and_their_parts():
+    assert tokenize("Set ERR_CONN_RESET in os.path.join") == [
+        "set", "err_conn_reset", "err", "conn", "reset", "in", "os.path.join", "os", "path", "join"
+    ]
+    assert tokenize("text-embedding-3-small") == ["text-embedding-3-small", "text", "embedding", "3", "small"]
+
+
+def test_bm25_ranks_rare_terms_and_exact_codes(database):
+    database.store("d1", "completed", 1, [
+        "the server returned ERR_CONN_RESET after the timeout",
+        "the server is configured in the settings file",
+        "the timeout is set in the settings file",
+    ])
+    index = LexicalIndex()
+    
+    results = index.search("ERR_CONN_RESET", top_k=3)
+    assert _ids(results) == ["d1-0"]
+    assert results[0]["bm25_score"] > 0
+    assert results[0]["document_name"] == "d1.txt"
+    
+    # "timeout" is in two chunks, "server" in two; the chunk with both wins
+    assert _ids(index.search("server timeout", top_k=1)) == ["d1-0"]
+    assert index.search("nothing matches", top_k=3) == []
+
+
+def test_search_scope_and_delete_by_document(database):
+    database.store("d1", "completed", 1, ["python packaging guide"])
+    database.store("d2", "completed", 1, ["python web frameworks"])
+    index = LexicalIndex()
+    
+    assert set(_ids(index.search("python", top_k=5))) == {"d1-0", "d2-0"}
+    assert _ids(index.search("python", top_k=5, document_ids=["d2"])) == ["d2-0"]
+    assert index.search("python", top_k=5, document_ids=[]) == []
+    
+    index.delete_by_document("d1")
+    assert _ids(index.search("python", top_k=5)) == ["d2-0"]
+    assert index.search("packaging", top_k=5) == []
+
+
+def test_add_chunks_is_idempotent(database):
+    index = LexicalIndex()
+    chunk = {"text": "vector quantization", "index": 0, "hash": "h"}
+    index.add_chunks([chunk], ["c1"], "d1", "d1.txt")
+    index.add_chunks([chunk], ["c1"], "d1", "d1.txt")
+    
+    results = index.search("quantization", top_k=5)
+    assert _ids(results) == ["c1"]
+    assert index._total_length == 2
+
+
+def test_refresh_picks_up_other_processes_changes(database):
+    database.store("d1", "completed", 1, ["alpha release notes"])
+    index = LexicalIndex()
+    assert _ids(index.search("alpha", top_k=5)) == ["d1-0"]
+    
+    database.store("d2", "completed", 2, ["alpha migration guide"])
+    database.delete("d1")
+    assert _ids(_search_now(index, "alpha", top_k=5)) == ["d2-0"]
+
+
+def test_refresh_tops_up_partially_indexed_documents(database):
+    # Loaded while another process was still storing chunks
+    database.store("d1", "processing", 1, ["first batch about caching"])
+    index = LexicalIndex()
+    assert _ids(index.search("caching", top_k=5)) == ["d1-0"]
+    
+    # Progress updates alone leave the corpus version, and the index, as is
+    database.store("d1", "processing", 2, ["first batch about caching", "second batch about eviction"])
+    assert _search_now(index, "eviction", top_k=5) == []
+    
+    database.store("d1", "completed", 3, ["first batch about caching", "second batch about eviction"])
+    assert _ids(_search_now(index, "eviction", top_k=5)) == ["d1-1"]
+    assert _ids(_search_now(index, "caching", top_k=5)) == ["d1-0"]
+
+
+def test_refresh_waits_for_the_interval(database):
+    database.store("d1", "completed", 1, ["alpha"])
+    index = LexicalIndex()
+    index.search("alpha", top_k=5)
+    
+    database.store("d2", "completed", 2, ["beta"])
+    assert index.search("beta", top_k=5) == []
+    assert _ids(_search_now(index, "beta", top_k=5)) == ["d2-0"]
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from config import settings
+from services.local_vector_store import INT8_SCALE, LocalVectorStore
+
+
+def _chunks(count, document):
+    return [{"text": f"{document} {i}", "index": i, "char_count": 4, "hash": f"{document}-{i}"} for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def brute_force(monkeypatch):
+    monkeypatch.setattr(settings, "local_vector_store_hnsw_threshold", 0)
+    monkeypatch.setattr(settings, "vector_rescore_limit", 5)
+
+
+def _unit_rows(rng, rows, dimension):
+    matrix = rng.normal(size=(rows, dimension)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_search_finds_each_stored_vector(tmp_path, quantization):
+    rng = np.random.default_rng(0)
+    vectors = _unit_rows(rng, 200, 64)
+    store = LocalVectorStore(str(tmp_path), quantization)
+    store.add_chunks(_chunks(200, "doc"), vectors.tolist(), "doc", "doc.txt")
+    
+    for row in range(0, 200, 17):
+        (best,) = store.search(vectors[row].tolist(), top_k=1)
+        assert best["text"] == f"doc {row}"
+        assert best["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_int8_codes_do_not_depend_on_the_first_batch(tmp_path):
+    # A first batch of one vector with small components everywhere...
+    first = np.full((1, 64), 1 / 8, dtype=np.float32)
+    store = LocalVectorStore(str(tmp_path), "int8")
+    store.add_chunks(_chunks(1, "first"), first.tolist(), "first", "first.txt")
+    # ...must not clip later vectors with large components
+    later = np.zeros((50, 64), dtype=np.float32)
+    later[np.arange(50), np.arange(50)] = 0.9
+    later[:, 60] = np.sqrt(1 - 0.81)
+    store.add_chunks(_chunks(50, "later"), later.tolist(), "later", "later.txt")
+    
+    decoded = np.asarray(store._codes, dtype=np.float32) * INT8_SCALE
+    assert np.abs(decoded[1:] - later).max() <= INT8_SCALE / 2 + 1e-6
+    for row in range(50):
+        (best,) = store.search(later[row].tolist(), top_k=1)
+        assert best["text"] == f"later {row}"
+
+
+def test_store_reopens_and_scopes_by_document(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = _unit_rows(rng, 20, 16)
+    store = LocalVectorStore(str(tmp_path), "int8")
+    store.add_chunks(_chunks(10, "a"), vectors[:10].tolist(), "a", "a.txt")
+    store.add_chunks(_chunks(10, "b"), vectors[10:].tolist(), "b", "b.txt")
+    store.delete_by_document("a")
+    
+    reopened = LocalVectorStore(str(tmp_path), "int8")
+    results = reopened.search(vectors[3].tolist(), top_k=20)
+    assert {r["document_id"] for r in results} == {"b"}
+    assert len(results) == 10
+    scoped = reopened.search(vectors[12].tolist(), top_k=3, document_ids=["b"])
+    assert scoped[0]["text"] == "b 2"
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_two_processes_share_one_store(tmp_path, quantization):
+    vectors = np.eye(8, dtype=np.float32)
+    first = LocalVectorStore(str(tmp_path), quantization)
+    second = LocalVectorStore(str(tmp_path), quantization)
+    first.add_chunks(_chunks(2, "a"), vectors[0:2].tolist(), "a", "a.txt")
+    second.add_chunks(_chunks(2, "b"), vectors[2:4].tolist(), "b", "b.txt")
+    first.add_chunks(_chunks(2, "c"), vectors[4:6].tolist(), "c", "c.txt")
+    
+    # Both see all rows, at the same positions
+    for row, document in enumerate("aabbcc"):
+        for store in (first, second):
+            (best,) = store.search(vectors[row].tolist(), top_k=1)
+            assert best["document_id"] == document
+    
+    # A compaction in one process makes the other reload
+    second.delete_by_document("a")
+    assert {r["document_id"] for r in first.search(vectors[0].tolist(), top_k=10)} == {"b", "c"}
+    first.add_chunks(_chunks(1, "d"), vectors[6:7].tolist(), "d", "d.txt")
+    assert second.search(vectors[6].tolist(), top_k=1)[0]["document_id"] == "d"
+    assert len(LocalVectorStore(str(tmp_path), quantization).search(vectors[0].tolist(), top_k=10)) == 5
+
+
+def test_torn_append_is_repaired_on_open(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    store = LocalVectorStore(str(tmp_path), "none")
+    store.add_chunks(_chunks(2, "a"), vectors[:2].tolist(), "a", "a.txt")
+    # A crash after writing vectors but before their chunk lines
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(vectors[2:].tobytes())
+    
+    reopened = LocalVectorStore(str(tmp_path), "none")
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 4 * 4
+    reopened.add_chunks(_chunks(1, "b"), vectors[3:].tolist(), "b", "b.txt")
+    assert reopened.search(vectors[3].tolist(), top_k=1)[0]["document_id"] == "b"
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_search_rescores_to_exact_distances(tmp_path, monkeypatch, quantization):
+    monkeypatch.setattr(settings, "vector_rescore_limit", 50)
+    rng = np.random.default_rng(3)
+    vectors = _unit_rows(rng, 500, 256)
+    exact = LocalVectorStore(str(tmp_path / "exact"), "none")
+    quantized = LocalVectorStore(str(tmp_path / quantization), quantization)
+    for store in (exact, quantized):
+        store.add_chunks(_chunks(500, "doc"), vectors.tolist(), "doc", "doc.txt")
+    
+    # Queries near stored rows, as real questions are near their answers
+    queries = vectors[:20] + 0.5 * _unit_rows(rng, 20, 256)
+    for query in queries:
+        (expected,) = exact.search(query.tolist(), top_k=1)
+        results = quantized.search(query.tolist(), top_k=5)
+        assert results[0]["text"] == expected["text"]
+        # Whatever the first stage picked is rescored against the float32 rows
+        assert results[0]["distance"] == pytest.approx(expected["distance"], abs=1e-4)
+        distances = [result["distance"] for result in results]
+        assert distances == sorted(distances)
@@ -0,0 +1,94 @@
+import pytest
+
+from config import settings
+from services.relevance_gate import RelevanceGate, best_distance, calibrate_thresholds
+
+
+@pytest.fixture
+def gate(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "relevance_gate_default_max_distance", 0.5)
+    return RelevanceGate(str(tmp_path / "thresholds.json"))
+
+
+def test_best_distance_ignores_lexical_only_chunks():
+    chunks = [{"distance": 0.7}, {"distance": None}, {"distance": 0.4}]
+    assert best_distance(chunks) == 0.4
+    assert best_distance([{"distance": None}]) is None
+
+
+def test_far_vector_hits_bypass(gate):
+    chunks = [{"distance": 0.9, "retrieval_sources": ["vector"]}]
+    decision = gate.check(chunks)
+    assert decision["bypass"]
+    assert decision["best_distance"] == 0.9
+
+
+def test_close_vector_hit_does_not_bypass(gate):
+    chunks = [{"distance": 0.9}, {"distance": 0.3}]
+    assert not gate.check(chunks)["bypass"]
+
+
+def test_lexical_hit_next_to_far_vector_hits_does_not_bypass(gate):
+    chunks = [
+        {"distance": 0.9, "retrieval_sources": ["vector"]},
+        {"distance": None, "retrieval_sources": ["lexical"]},
+        {"distance": 0.95, "retrieval_sources": ["vector", "lexical"]},
+    ]
+    decision = gate.check(chunks)
+    assert not decision["bypass"]
+    assert decision["lexical_hit"]
+    assert decision["best_distance"] == 0.9
+
+
+def test_no_threshold_never_bypasses(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "relevance_gate_default_max_distance", 0.0)
+    gate = RelevanceGate(str(tmp_path / "thresholds.json"))
+    assert not gate.check([{"distance": 5.0}])["bypass"]
+
+
+def test_saved_thresholds_are_per_model(gate):
+    gate.save({"local:model-a": {"max_distance": 0.2}})
+    gate.save({"local:model-b": {"max_distance": 0.8}})
+    assert set(gate.thresholds()) == {"local:model-a", "local:model-b"}
+
+
+def _trace(distance, answer="An answer [1]", **metadata):
+    return {
+        "answer_text": answer,
+        "embedding_provider": "local",
+        "processing_time_ms": 100,
+        "similarity_scores": [],
+        "metadata": dict(metadata, relevance_gate={"best_distance": distance, "bypass": False}),
+    }
+
+
+def test_calibration_uses_recorded_best_distance():
+    traces = [_trace(0.1 + i / 100) for i in range(100)]
+    traces += [_trace(0.9, answer="Not found in sources")]
+    thresholds = calibrate_thresholds(traces, max_false_skip=0.05, min_samples=50)
+    (result,) = thresholds.values()
+    assert result["answered"] == 100
+    # 95% of the answered distances (0.10 .. 1.09) are at or below 1.04
+    assert result["max_distance"] == pytest.approx(1.04)
+    assert result["false_skip_rate"] <= 0.05
+    assert result["not_found_skip_rate"] == 0.0
+
+
+def test_calibration_skips_bypassed_and_cached_traces():
+    traces = [_trace(0.2) for _ in range(60)]
+    traces.append(_trace(0.9, answer="Not found in sources"))
+    traces[-1]["metadata"]["relevance_gate"]["bypass"] = True
+    traces.append(_trace(0.2, answer_cache={"hit": True}))
+    (result,) = calibrate_thresholds(traces, min_samples=50).values()
+    assert result["answered"] == 60
+    assert result["not_found"] == 0
+    assert result["max_distance"] is None
+
+
+def test_calibration_falls_back_to_similarity_scores():
+    trace = {"answer_text": "Yes", "embedding_provider": "local", "similarity_scores": [0.5, 0.25], "metadata": {}}
+    traces = [trace] * 3 + [dict(trace, answer_text="Not found in sources", similarity_scores=[0.2])]
+    (result,) = calibrate_thresholds(traces, max_false_skip=0.0, min_samples=3).values()
+    # similarity 0.5 -> distance 1.0
+    assert result["max_distance"] == 1.0
+    assert result["not_found_skip_rate"] == 1.0
@@ -0,0 +1,49 @@
+import pytest
+
+from config import settings
+from services.reranker import Reranker
+
+
+class FakeCrossEncoder:
+    """Scores a pair by how often the exact query text occurs in the chunk"""
+    
+    def __init__(self):
+        self.pairs = []
+    
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.pairs.extend(pairs)
+        return [float(text.count(query)) for query, text in pairs]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    monkeypatch.setattr(settings, "rerank_timeout_ms", 5000)
+    reranker = Reranker("fake")
+    reranker.model = FakeCrossEncoder()
+    yield reranker
+    reranker.shutdown()
+
+
+CHUNKS = [
+    {"text": "Error E42 occurs when the disk is full", "chunk_hash": "a"},
+    {"text": "error e42 error e42", "chunk_hash": "b"},
+]
+
+
+def test_orders_by_score_and_keeps_top_k(reranker):
+    ranked, stats = reranker.rerank("error e42", CHUNKS, top_k=1)
+    assert [chunk["chunk_hash"] for chunk in ranked] == ["b"]
+    assert ranked[0]["rerank_score"] == 2.0
+    assert stats["fallback"] is False
+    assert stats["cached"] == 0
+
+
+def test_scores_are_cached_per_exact_query_text(reranker):
+    reranker.rerank("error e42", CHUNKS, top_k=2)
+    _, stats = reranker.rerank("error e42", CHUNKS, top_k=2)
+    assert stats["cached"] == 2
+    
+    # Differs only in case: the model sees different text, so it is scored again
+    ranked, stats = reranker.rerank("Error E42", CHUNKS, top_k=2)
+    assert stats["cached"] == 0
+    assert [chunk["chunk_hash"] for chunk in ranked] == ["a", "b"]
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from config import settings
+from services import retriever as retriever_module
+from services.retriever import Retriever
+from utils.caching import QueryEmbeddingCache
+
+
+class FakeEmbedder:
+    """Shortened embeddings: 4 native dimensions, 2 indexed"""
+    
+    model_name = "fake"
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def embed_batch_full(self, texts):
+        self.calls += 1
+        return [[1.0, 0.0, 0.0, 0.0] for _ in texts]
+    
+    def embed_text(self, text):
+        self.calls += 1
+        return [1.0, 0.0]
+    
+    def truncate(self, embeddings):
+        return [embedding[:2] for embedding in embeddings]
+    
+    def get_dimension(self):
+        return 2
+    
+    def get_full_dimension(self):
+        return 4
+    
+    def rescores_full_dimension(self):
+        return True
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.queries = []
+    
+    def check_dimension(self, dimension):
+        assert dimension == 2
+    
+    def search(self, query_embedding, top_k, include_vectors=False, document_ids=None):
+        self.queries.append(query_embedding)
+        return []
+
+
+@pytest.fixture
+def retriever(monkeypatch):
+    monkeypatch.setattr(retriever_module, "query_embedding_cache", QueryEmbeddingCache(enabled=False))
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "hybrid_search_enabled", False)
+    monkeypatch.setattr(settings, "rerank_enabled", False)
+    retriever = Retriever()
+    retriever.embedder = FakeEmbedder()
+    retriever.vector_store = FakeVectorStore()
+    return retriever
+
+
+def test_rescoring_embeds_the_query_once(retriever):
+    retriever.retrieve("what is rag?", top_k=3)
+    assert retriever.embedder.calls == 1
+    assert retriever.vector_store.queries[0] == [1.0, 0.0]
+
+
+def test_rrf_fuses_both_legs():
+    vector = [
+        {"weaviate_id": "a", "similarity_score": 0.9, "distance": 0.1},
+        {"weaviate_id": "b", "similarity_score": 0.8, "distance": 0.2},
+    ]
+    lexical = [{"weaviate_id": "c", "bm25_score": 5.0}, {"weaviate_id": "b", "bm25_score": 3.0}]
+    fused = Retriever._fuse_rrf(vector, lexical, k=60)
+    
+    assert [r["weaviate_id"] for r in fused] == ["b", "a", "c"]
+    assert fused[0]["retrieval_sources"] == ["vector", "lexical"]
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 62, abs=1e-6)
+    assert fused[0]["bm25_score"] == 3.0
+    lexical_only = fused[2]
+    assert lexical_only["distance"] is None
+    assert lexical_only["similarity_score"] == 0.0
+
+
+def test_deduplicate_and_limit_per_document():
+    results = [
+        {"document_id": "d1", "chunk_hash": "x"},
+        {"document_id": "d1", "chunk_hash": "x"},
+        {"document_id": "d1", "chunk_hash": "y"},
+        {"document_id": "d1", "chunk_hash": "z"},
+        {"document_id": "d2", "chunk_hash": "w"},
+    ]
+    kept = Retriever._deduplicate_and_limit(results, max_per_document=2)
+    assert [(r["document_id"], r["chunk_hash"]) for r in kept] == [("d1", "x"), ("d1", "y"), ("d2", "w")]
+
+
+def _candidate(name, vector, chunk_hash=None, **extra):
+    return dict(
+        weaviate_id=name, document_id="d1", chunk_hash=chunk_hash or name, vector=vector, **extra
+    )
+
+
+def test_mmr_skips_near_duplicates_for_a_diverse_pick(monkeypatch):
+    monkeypatch.setattr(settings, "mmr_lambda", 0.5)
+    results = [
+        _candidate("a", [1.0, 0.0, 0.0]),
+        _candidate("a-copy", [1.0, 0.0, 0.02]),
+        # More relevant than c but close to a: picked after c
+        _candidate("b", [1.0, 0.0, 0.5]),
+        _candidate("c", [0.3, 1.0, 0.0]),
+    ]
+    picked = Retriever._diversify_mmr(results, [1.0, 0.5, 0.0], k=3)
+    
+    assert [r["weaviate_id"] for r in picked] == ["a", "c", "b"]
+    assert all("vector" not in r for r in picked)
+
+
+def test_mmr_with_full_lambda_keeps_relevance_order(monkeypatch):
+    monkeypatch.setattr(settings, "mmr_lambda", 1.0)
+    monkeypatch.setattr(settings, "mmr_duplicate_threshold", 1.1)
+    results = [
+        _candidate("far", [0.0, 1.0]),
+        _candidate("near", [1.0, 0.1]),
+        _candidate("mid", [1.0, 1.0]),
+    ]
+    picked = Retriever._diversify_mmr(results, [1.0, 0.0], k=3)
+    assert [r["weaviate_id"] for r in picked] == ["near", "mid", "far"]
+
+
+def test_mmr_drops_repeated_chunk_hashes():
+    results = [
+        _candidate("a", [1.0, 0.0], chunk_hash="same"),
+        _candidate("b", [0.0, 1.0], chunk_hash="same"),
+        _candidate("c", [0.6, 0.8]),
+    ]
+    picked = Retriever._diversify_mmr(results, [1.0, 0.0], k=3)
+    assert [r["weaviate_id"] for r in picked] == ["a", "c"]
+
+
+def test_mmr_uses_rrf_scores_for_fused_results(monkeypatch):
+    monkeypatch.setattr(settings, "mmr_lambda", 1.0)
+    results = [
+        _candidate("vector-hit", [0.0, 1.0], rrf_score=0.02),
+        # Lexical-only: no vector, ranked by its fused score alone
+        _candidate("lexical-hit", None, rrf_score=0.03),
+    ]
+    picked = Retriever._diversify_mmr(results, [1.0, 0.0], k=2)
+    assert [r["weaviate_id"] for r in picked] == ["lexical-hit", "vector-hit"]
+    assert Retriever._diversify_mmr([], [1.0, 0.0], k=2) == []
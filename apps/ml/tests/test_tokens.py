@@ -0,0 +1,52 @@
+import pytest
+
+from config import settings
+from utils import tokens
+from utils.tokens import TokenCounter, get_token_counter, split_sentences
+
+
+@pytest.fixture(autouse=True)
+def heuristic(monkeypatch):
+    """Count with the heuristic: tiktoken downloads its encodings on first use"""
+    monkeypatch.setattr(tokens, "tiktoken", None)
+    monkeypatch.setattr(tokens, "_counters", {})
+
+
+def test_heuristic_counts_long_words_as_several_tokens():
+    counter = TokenCounter()
+    assert counter.name == "estimate"
+    assert counter.count("") == 0
+    assert counter.count("Hi there.") == 3
+    # 14 letters: about 3 BPE tokens
+    assert counter.count("internationals") == 3
+
+
+def test_count_is_cached_by_text():
+    counter = TokenCounter()
+    assert counter.count("cached text") == 2
+    assert (counter.cache.hits, counter.cache.misses) == (0, 1)
+    assert counter.count("cached text") == 2
+    assert (counter.cache.hits, counter.cache.misses) == (1, 1)
+
+
+def test_truncate_sentences_keeps_whole_sentences():
+    counter = TokenCounter()
+    text = "One two. Three four. Five six."
+    
+    assert counter.truncate_sentences(text, 100) == text
+    # Each sentence is 3 tokens
+    assert counter.truncate_sentences(text, 6) == "One two. Three four."
+    assert counter.truncate_sentences(text, 5) == "One two."
+    assert counter.truncate_sentences(text, 2) == ""
+
+
+def test_split_sentences():
+    text = "First one. Second one?  Third!\n\nNew paragraph without a stop\n\n\n"
+    assert split_sentences(text) == ["First one.", "Second one?", "Third!", "New paragraph without a stop"]
+    assert split_sentences("  ") == []
+
+
+def test_get_token_counter_is_shared_per_provider(monkeypatch):
+    monkeypatch.setattr(settings, "llm_provider", "ollama")
+    assert get_token_counter() is get_token_counter("ollama")
+    assert get_token_counter("openai") is not get_token_counter("ollama")
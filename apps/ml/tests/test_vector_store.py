@@ -0,0 +1,55 @@
+import uuid
+from types import SimpleNamespace
+
+from config import settings
+from services.vector_store import VectorStore
+
+
+class FakeQuery:
+    """Returns one object per call, farther away with every call"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def near_vector(self, near_vector, limit, filters, return_metadata, include_vector):
+        self.calls.append(filters)
+        distance = 0.5 - len(self.calls) / 10
+        obj = SimpleNamespace(
+            uuid=uuid.uuid4(),
+            vector=None,
+            metadata=SimpleNamespace(distance=distance),
+            properties={
+                "text": f"call {len(self.calls)}",
+                "document_id": f"doc-{len(self.calls)}",
+                "document_name": "doc.txt",
+                "chunk_index": 0,
+            },
+        )
+        return SimpleNamespace(objects=[obj])
+
+
+def _store():
+    store = VectorStore.__new__(VectorStore)
+    store.collection = SimpleNamespace(query=FakeQuery())
+    return store
+
+
+def test_unscoped_search_has_no_filter():
+    store = _store()
+    store.search([0.1, 0.2], top_k=3)
+    assert store.collection.query.calls == [None]
+
+
+def test_empty_scope_searches_nothing():
+    store = _store()
+    assert store.search([0.1, 0.2], top_k=3, document_ids=[]) == []
+    assert store.collection.query.calls == []
+
+
+def test_long_scope_is_searched_in_batches_and_merged(monkeypatch):
+    monkeypatch.setattr(settings, "weaviate_filter_batch_size", 200)
+    store = _store()
+    results = store.search([0.1, 0.2], top_k=2, document_ids=[str(uuid.uuid4()) for _ in range(450)])
+    assert len(store.collection.query.calls) == 3
+    # Later fake calls are closer, so the merge must reorder by distance
+    assert [r["text"] for r in results] == ["call 3", "call 2"]
@@ -0,0 +1,476 @@
+"""
+In-process caches for the RAG pipeline
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import fcntl
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with optional TTL and hit/miss counters
+    
+    A max_size of 0 turns the cache into a no-op (every get is a miss,
+    nothing is stored), so callers never need to branch on "enabled".
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return cached value or None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            
+            value, stored_at = item
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                self.misses += 1
+                return None
+            
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key: Hashable, value: Any):
+        """Store value, evicting the least recently used entry if full"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and occupancy"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text for cache keys (case and whitespace insensitive)"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Cache of query embeddings keyed by (provider, model, normalized query)
+    
+    Vectors are stored as float32 arrays, which is half the size of Python
+    float lists and avoids keeping thousands of boxed floats alive.
+    """
+    
+    def __init__(self, enabled: bool = None, max_size: int = None, ttl_seconds: int = None):
+        enabled = settings.query_embedding_cache_enabled if enabled is None else enabled
+        self.cache = LRUCache(
+            max_size=(max_size or settings.query_embedding_cache_size) if enabled else 0,
+            ttl_seconds=settings.query_embedding_cache_ttl_seconds if ttl_seconds is None else ttl_seconds
+        )
+    
+    @staticmethod
+    def _key(provider: str, model_name: str, query: str) -> tuple:
+        return (provider, model_name, normalize_query(query))
+    
+    def get(self, provider: str, model_name: str, query: str) -> Optional[List[float]]:
+        """Return cached embedding as a list, or None"""
+        vector = self.cache.get(self._key(provider, model_name, query))
+        return vector.tolist() if vector is not None else None
+    
+    def set(self, provider: str, model_name: str, query: str, embedding: List[float]):
+        """Store embedding for query"""
+        self.cache.set(
+            self._key(provider, model_name, query),
+            np.asarray(embedding, dtype=np.float32)
+        )
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters"""
+        return self.cache.stats()
+
+
+class DiskEmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache for one embedding model
+    
+    Layout (append-only, survives restarts):
+        keys.bin     16-byte md5 digests, one per row
+        vectors.f32  float32 rows of `dimension` values, memory-mapped on read
+        lock         flock target serializing appends across processes
+    
+    Vectors are appended before keys, so a crash mid-write can only leave
+    trailing vector bytes without a key; those are truncated on open.
+    
+    Several processes (API server, bulk_ingest.py) may append to the same
+    directory. Appends hold an exclusive file lock and first read the keys
+    other processes added, so row numbers always follow the files on disk.
+    A lookup miss re-reads new keys too.
+    """
+    
+    KEY_BYTES = 16
+    
+    def __init__(self, directory: Path, dimension: int):
+        self.directory = Path(directory)
+        self.dimension = dimension
+        self.keys_path = self.directory / "keys.bin"
+        self.vectors_path = self.directory / "vectors.f32"
+        self.lock_path = self.directory / "lock"
+        self._row_bytes = dimension * np.dtype(np.float32).itemsize
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._rows = 0  # key rows read from keys.bin so far
+        self._mmap: Optional[np.memmap] = None
+        self._load()
+    
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared with other processes using this directory"""
+        with open(self.lock_path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    
+    def _load(self):
+        """Read key index and repair a torn trailing write"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Under the lock: another process's in-flight append is not torn
+        with self._file_lock():
+            self.keys_path.touch(exist_ok=True)
+            self.vectors_path.touch(exist_ok=True)
+            
+            key_rows = self.keys_path.stat().st_size // self.KEY_BYTES
+            vector_rows = self.vectors_path.stat().st_size // self._row_bytes
+            rows = min(key_rows, vector_rows)
+            
+            if self.keys_path.stat().st_size != rows * self.KEY_BYTES:
+                with open(self.keys_path, "r+b") as f:
+                    f.truncate(rows * self.KEY_BYTES)
+            if self.vectors_path.stat().st_size != rows * self._row_bytes:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(rows * self._row_bytes)
+            
+            self._refresh()
+        
+        logger.info(f"Embedding cache {self.directory}: {len(self._index)} vectors")
+    
+    def _refresh(self):
+        """Index keys appended (by any process) since the last read"""
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._rows * self.KEY_BYTES)
+            tail = f.read()
+        # A key still being written is picked up next time
+        for offset in range(len(tail) // self.KEY_BYTES):
+            key = tail[offset * self.KEY_BYTES:(offset + 1) * self.KEY_BYTES]
+            self._index.setdefault(key, self._rows + offset)
+        self._rows += len(tail) // self.KEY_BYTES
+    
+    def _vectors(self) -> np.ndarray:
+        """Memory-mapped view of all indexed rows (remapped after appends)"""
+        rows = self._rows
+        if self._mmap is None or self._mmap.shape[0] != rows:
+            if rows == 0:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            self._mmap = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension)
+            )
+        return self._mmap
+    
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Return {hash: vector} for the hashes present in the cache"""
+        with self._lock:
+            keys = {h: bytes.fromhex(h) for h in hashes}
+            if any(key not in self._index for key in keys.values()):
+                # Keys are written after their vectors, so every key read
+                # here already has its row in vectors.f32
+                self._refresh()
+            rows = {h: self._index.get(key) for h, key in keys.items()}
+            found = {h: row for h, row in rows.items() if row is not None}
+            if not found:
+                return {}
+            vectors = self._vectors()
+            return {h: np.array(vectors[row]) for h, row in found.items()}
+    
+    def put_many(self, hashes: List[str], vectors: List[List[float]]):
+        """Append vectors for hashes that are not stored yet"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if len(matrix) and matrix.shape[1] != self.dimension:
+            raise ValueError(
+                f"Embedding dimension {matrix.shape[1]} does not match cache dimension {self.dimension}"
+            )
+        
+        with self._lock, self._file_lock():
+            self._refresh()
+            new_keys = []
+            new_rows = []
+            seen = set()
+            for row, h in enumerate(hashes):
+                key = bytes.fromhex(h)
+                if key in self._index or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(row)
+            
+            if not new_keys:
+                return
+            
+            # Row numbers follow the files, which other processes extend too.
+            # Vector bytes past the last key can only be left by a crashed
+            # append (nobody else writes while we hold the lock).
+            start = self._rows
+            if self.vectors_path.stat().st_size != start * self._row_bytes:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(start * self._row_bytes)
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix[new_rows].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            
+            for offset, key in enumerate(new_keys):
+                self._index[key] = start + offset
+            self._rows = start + len(new_keys)
+    
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class AnswerCache:
+    """
+    Cache of full /query results in front of retrieval + generation
+    
+    Exact matches use (normalized query, top_k, llm provider, embedding
+    provider, scope), where scope identifies the query's search filters.
+    Optionally, a query whose embedding is at least
+    `similarity_threshold` cosine-similar to a cached query with the same
+    top_k/providers reuses that answer.
+    
+    Every corpus change bumps `generation`, which drops all entries. Results
+    computed against an older generation are never stored. Changes made by
+    other processes (API workers, bulk_ingest.py) are noticed through a
+    shared corpus version, see sync_corpus.
+    """
+    
+    def __init__(self):
+        enabled = settings.answer_cache_enabled
+        self.semantic_enabled = enabled and settings.answer_cache_semantic_enabled
+        self.similarity_threshold = settings.answer_cache_similarity_threshold
+        self.max_size = settings.answer_cache_size if enabled else 0
+        self.cache = LRUCache(max_size=self.max_size, ttl_seconds=settings.answer_cache_ttl_seconds)
+        self.generation = 0
+        self._corpus_version = None
+        self._corpus_checked_at = 0.0
+        self._lock = threading.Lock()
+        # namespace -> OrderedDict(exact key -> unit-length float32 query vector)
+        self._vectors: Dict[tuple, "OrderedDict[tuple, np.ndarray]"] = {}
+    
+    @staticmethod
+    def _namespace(top_k: int, llm_provider: str, embedding_provider: str, scope: str = "") -> tuple:
+        return (top_k, llm_provider, embedding_provider, scope)
+    
+    def get_exact(
+        self,
+        query: str,
+        top_k: int,
+        llm_provider: str,
+        embedding_provider: str,
+        scope: str = ""
+    ) -> Optional[Dict]:
+        """Return cached result for the normalized query, or None"""
+        key = (normalize_query(query),) + self._namespace(top_k, llm_provider, embedding_provider, scope)
+        entry = self.cache.get(key)
+        if entry is None or entry["generation"] != self.generation:
+            return None
+        return {"result": entry["result"], "match": "exact", "similarity": 1.0}
+    
+    def get_similar(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        llm_provider: str,
+        embedding_provider: str,
+        scope: str = ""
+    ) -> Optional[Dict]:
+        """
+        Return the cached result of the most similar query above the threshold
+        
+        Candidates are tried in similarity order: a closer query whose answer
+        expired, was evicted or predates an invalidation is dropped from the
+        vector index and the next one is tried.
+        """
+        if not self.semantic_enabled:
+            return None
+        
+        namespace = self._namespace(top_k, llm_provider, embedding_provider, scope)
+        with self._lock:
+            vectors = self._vectors.get(namespace)
+            if not vectors:
+                return None
+            keys = list(vectors.keys())
+            matrix = np.stack(list(vectors.values()))
+        
+        query_vector = _unit(query_embedding)
+        similarities = matrix @ query_vector
+        hit = None
+        stale = []
+        for row in np.argsort(-similarities):
+            similarity = float(similarities[row])
+            if similarity < self.similarity_threshold:
+                break
+            entry = self.cache.get(keys[row])
+            if entry is None or entry["generation"] != self.generation:
+                stale.append(keys[row])
+                continue
+            hit = {"result": entry["result"], "match": "semantic", "similarity": round(similarity, 4)}
+            break
+        
+        if stale:
+            with self._lock:
+                vectors = self._vectors.get(namespace, {})
+                for key in stale:
+                    vectors.pop(key, None)
+        return hit
+    
+    def store(
+        self,
+        query: str,
+        top_k: int,
+        llm_provider: str,
+        embedding_provider: str,
+        result: Dict,
+        generation: int,
+        query_embedding: List[float] = None,
+        scope: str = ""
+    ):
+        """
+        Cache a result computed while the corpus was at `generation`
+        
+        Results from before an invalidation are silently dropped.
+        """
+        if self.max_size <= 0 or generation != self.generation:
+            return
+        
+        namespace = self._namespace(top_k, llm_provider, embedding_provider, scope)
+        key = (normalize_query(query),) + namespace
+        self.cache.set(key, {"result": result, "generation": generation})
+        
+        if self.semantic_enabled and query_embedding is not None:
+            with self._lock:
+                vectors = self._vectors.setdefault(namespace, OrderedDict())
+                vectors[key] = _unit(query_embedding)
+                vectors.move_to_end(key)
+                while len(vectors) > self.max_size:
+                    vectors.popitem(last=False)
+    
+    def sync_corpus(self, fetch_version: Callable[[], Hashable]):
+        """
+        Invalidate if another process changed the corpus
+        
+        `generation` only counts this process's changes. The shared version
+        (postgres.get_corpus_version) is compared at most every
+        `answer_cache_corpus_check_seconds`, so stale answers outlive a
+        change made elsewhere by that long at most.
+        
+        Args:
+            fetch_version: Returns the current corpus version
+        """
+        interval = settings.answer_cache_corpus_check_seconds
+        now = time.monotonic()
+        if self.max_size <= 0 or not interval or now - self._corpus_checked_at < interval:
+            return
+        self._corpus_checked_at = now
+        try:
+            version = fetch_version()
+        except Exception as e:
+            logger.warning(f"Could not check the corpus version: {e}")
+            return
+        previous, self._corpus_version = self._corpus_version, version
+        if previous is not None and version != previous:
+            self.invalidate()
+    
+    def invalidate(self):
+        """Drop everything; called whenever the corpus changes"""
+        with self._lock:
+            self.generation += 1
+            self._vectors.clear()
+        self.cache.clear()
+        logger.info(f"Answer cache invalidated (corpus generation {self.generation})")
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and corpus generation"""
+        return {**self.cache.stats(), "generation": self.generation}
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    """Normalize a vector to unit length as float32"""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+_disk_caches: Dict[tuple, DiskEmbeddingCache] = {}
+_disk_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(provider: str, model_name: str, dimension: int) -> Optional[DiskEmbeddingCache]:
+    """
+    Get the on-disk embedding cache for a model (None when disabled)
+    
+    The directory name includes the dimension, so changing the embedding size
+    of a model never mixes incompatible vectors.
+    """
+    if not settings.embedding_cache_enabled:
+        return None
+    
+    key = (provider, model_name, dimension)
+    with _disk_caches_lock:
+        if key not in _disk_caches:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{provider}__{model_name}__{dimension}")
+            _disk_caches[key] = DiskEmbeddingCache(
+                Path(settings.embedding_cache_dir) / safe_name,
+                dimension
+            )
+        return _disk_caches[key]
+
+
+# Global instances
+query_embedding_cache = QueryEmbeddingCache()
+answer_cache = AnswerCache()
@@ -4,6 +4,7 @@ Text chunking utilities
 from typing import List, Dict
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from config import settings
+from utils.tokens import get_token_counter
 import hashlib
 
 
@@ -56,8 +57,8 @@ class TextChunker:
     
     @staticmethod
     def estimate_tokens(text: str) -> int:
-        """Rough token count estimation (1 token ≈ 4 chars)"""
-        return len(text) // 4
+        """Token count with the default LLM provider's tokenizer"""
+        return get_token_counter().count(text)
 
 
 # Global instance
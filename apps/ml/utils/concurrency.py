@@ -0,0 +1,91 @@
+"""
+Helpers for keeping the FastAPI event loop free of blocking work
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Iterator
+import asyncio
+import logging
+import threading
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Threads that run the blocking RAG pipeline (LLM calls, Weaviate, psycopg2)
+_request_executor = ThreadPoolExecutor(
+    max_workers=settings.request_worker_threads,
+    thread_name_prefix="rag-worker"
+)
+
+# Sub-tasks a pipeline thread runs alongside its own work (e.g. the lexical
+# retrieval leg). Kept apart from the request pool: a request thread waiting
+# on work queued behind other waiting request threads could deadlock.
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=settings.request_worker_threads,
+    thread_name_prefix="rag-fanout"
+)
+
+# CPU-bound local embedding gets fewer slots than I/O-bound work, so a burst
+# of queries cannot oversubscribe the cores torch is already using
+embedding_slots = threading.BoundedSemaphore(settings.embedding_max_concurrency)
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the request worker pool and await its result
+    
+    Args:
+        func: Blocking callable
+        *args, **kwargs: Arguments for func
+    
+    Returns:
+        Whatever func returns (exceptions propagate)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_request_executor, partial(func, *args, **kwargs))
+
+
+async def iterate_blocking(iterator: Iterator) -> AsyncIterator:
+    """
+    Drive a blocking iterator (e.g. a sync generator) from the event loop
+    
+    Each step runs in the request worker pool, so a streaming response is
+    bounded by the same thread cap as other requests. If the consumer stops
+    early (client disconnect), a generator is closed in the pool too.
+    
+    Args:
+        iterator: Blocking iterator
+    
+    Yields:
+        The iterator's items
+    """
+    done = object()
+    try:
+        while True:
+            item = await run_blocking(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await run_blocking(close)
+
+
+def submit_fanout(func: Callable, *args, **kwargs) -> Future:
+    """
+    Start a blocking function in the fan-out pool from a pipeline thread
+    
+    Returns:
+        Future with the function's result
+    """
+    return _fanout_executor.submit(func, *args, **kwargs)
+
+
+def shutdown_executors():
+    """Stop accepting work and wait for running jobs (application shutdown)"""
+    _request_executor.shutdown(wait=True)
+    _fanout_executor.shutdown(wait=True)
+    logger.info("Request worker pool stopped")
@@ -0,0 +1,108 @@
+"""
+Token counting for prompt budgets
+
+Counts come from tiktoken when it is installed. Without it a word/punctuation
+heuristic is used, which is closer to BPE counts than len(text) // 4 for code
+and non-English text. Counts are cached by text hash, because the same
+chunks are counted again on every query that retrieves them.
+"""
+from typing import Dict, List
+import hashlib
+import logging
+import re
+
+from config import settings
+from utils.caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency, the heuristic is used instead
+    tiktoken = None
+
+# Llama-family models (Ollama, Groq) have no tiktoken encoding; cl100k is a
+# close stand-in for their BPE vocabularies
+_DEFAULT_ENCODING = "cl100k_base"
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+class TokenCounter:
+    """Cached token counts for one tokenizer"""
+    
+    def __init__(self, model_name: str = None):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name) if model_name else None
+            except KeyError:
+                pass
+            if self.encoding is None:
+                self.encoding = tiktoken.get_encoding(_DEFAULT_ENCODING)
+        self.name = f"tiktoken:{self.encoding.name}" if self.encoding else "estimate"
+        self.cache = LRUCache(max_size=settings.token_count_cache_size)
+    
+    def count(self, text: str) -> int:
+        """Number of tokens in text"""
+        if not text:
+            return 0
+        key = hashlib.md5(text.encode("utf-8")).hexdigest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        if self.encoding is not None:
+            tokens = len(self.encoding.encode(text, disallowed_special=()))
+        else:
+            # Long words split into several BPE tokens: ~1 token per 4 chars
+            tokens = sum(max(1, len(word) // 4) for word in _WORD_PATTERN.findall(text))
+        self.cache.set(key, tokens)
+        return tokens
+    
+    def truncate_sentences(self, text: str, max_tokens: int) -> str:
+        """
+        Longest prefix of whole sentences that fits in max_tokens
+        
+        Sentences are counted one at a time and summed, so each is encoded
+        once (and cached for the next query that retrieves it); the sum can
+        differ from a count of the whole prefix by a token at a boundary.
+        
+        Returns:
+            Truncated text, or "" if not even the first sentence fits
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        
+        end = 0
+        used = 0
+        for boundary in _SENTENCE_PATTERN.finditer(text):
+            used += self.count(text[end:boundary.start()])
+            if used > max_tokens:
+                break
+            end = boundary.start()
+        return text[:end].rstrip()
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of text (split after . ! ? and at blank lines), stripped"""
+    return [sentence.strip() for sentence in _SENTENCE_PATTERN.split(text) if sentence.strip()]
+
+
+_counters: Dict[str, TokenCounter] = {}
+
+
+def get_token_counter(provider: str = None) -> TokenCounter:
+    """
+    Token counter for an LLM provider's model
+    
+    Args:
+        provider: "ollama", "openai", or "groq". If None, uses settings.llm_provider
+    """
+    provider = provider or settings.llm_provider
+    counter = _counters.get(provider)
+    if counter is None:
+        model_name = settings.openai_model if provider == "openai" else None
+        counter = _counters.setdefault(provider, TokenCounter(model_name))
+    return counter
@@ -1,7 +1,7 @@
 """
 Query tracing utilities for debugging RAG pipeline
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
 import logging
 from database import postgres
 
@@ -16,7 +16,9 @@ def save_trace(
     llm_provider: str,
     embedding_provider: str,
     top_k: int,
-    processing_time_ms: int
+    processing_time_ms: int,
+    metadata: Dict = None,
+    time_to_first_token_ms: Optional[int] = None
 ) -> str:
     """
     Save query trace to database
@@ -30,6 +32,8 @@ def save_trace(
         embedding_provider: Embedding provider used
         top_k: Number of chunks requested
         processing_time_ms: Total processing time
+        metadata: Pipeline details (cache hits, stage timings, ...)
+        time_to_first_token_ms: Latency until the first streamed token
         
     Returns:
         Trace ID
@@ -48,7 +52,9 @@ def save_trace(
             llm_provider=llm_provider,
             embedding_provider=embedding_provider,
             top_k=top_k,
-            processing_time_ms=processing_time_ms
+            processing_time_ms=processing_time_ms,
+            metadata=metadata,
+            time_to_first_token_ms=time_to_first_token_ms
         )
         
         logger.info(f"Saved trace: {trace_id}")
@@ -60,6 +66,41 @@ def save_trace(
         return ""
 
 
+def save_traces(traces: List[Dict]) -> List[str]:
+    """
+    Save many query traces in one bulk insert
+    
+    Args:
+        traces: Dicts with the keyword arguments of save_trace
+        
+    Returns:
+        Trace IDs in input order ("" for all if saving failed)
+    """
+    try:
+        trace_ids = postgres.insert_query_traces([
+            {
+                "query_text": trace["query_text"],
+                "retrieved_chunk_ids": [chunk.get("weaviate_id", "") for chunk in trace["chunks"]],
+                "similarity_scores": [chunk.get("similarity_score", 0.0) for chunk in trace["chunks"]],
+                "answer_text": trace["answer"],
+                "citations": trace["citations"],
+                "llm_provider": trace["llm_provider"],
+                "embedding_provider": trace["embedding_provider"],
+                "top_k": trace["top_k"],
+                "processing_time_ms": trace["processing_time_ms"],
+                "metadata": trace.get("metadata")
+            }
+            for trace in traces
+        ])
+        logger.info(f"Saved {len(trace_ids)} traces")
+        return trace_ids
+    
+    except Exception as e:
+        logger.error(f"Error saving traces: {e}")
+        # Don't fail the batch if tracing fails
+        return [""] * len(traces)
+
+
 def get_trace(trace_id: str) -> Dict:
     """Get trace by ID"""
     trace = postgres.get_query_trace(trace_id)
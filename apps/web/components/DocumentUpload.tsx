@@ -42,7 +42,7 @@ export default function DocumentUpload({ onUploadComplete }: DocumentUploadProps
 
     try {
       const result = await uploadDocument(file)
-      setSuccess(`Document uploaded successfully! ${result.chunk_count} chunks created.`)
+      setSuccess(`Document uploaded! Processing in the background (job ${result.job_id}).`)
       setFile(null)
       if (onUploadComplete) {
         onUploadComplete()
@@ -16,6 +16,7 @@ export interface QueryResponse {
   trace_id: string;
   processing_time_ms: number;
   context_used: number;
+  cached?: boolean;
 }
 
 export interface Citation {
@@ -41,6 +41,8 @@ CREATE TABLE IF NOT EXISTS query_traces (
     embedding_provider VARCHAR(50), -- local, openai
     top_k INTEGER,
     processing_time_ms INTEGER,
+    time_to_first_token_ms INTEGER, -- Set for streamed answers
+    metadata JSONB DEFAULT '{}', -- Pipeline details: cache hits, stage timings
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 